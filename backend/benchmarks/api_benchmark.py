@@ -0,0 +1,276 @@
+"""
+Reproducible API benchmark: seed synthetic data, drive the endpoints at fixed concurrency
+and report throughput and latency percentiles per endpoint as JSON.
+
+The app runs in-process through httpx's ASGI transport (default) or is reached over HTTP
+with --url. Either way the database named by DATABASE_URL is seeded directly, so point it
+at a throwaway local MySQL database (the schema uses MySQL-only SQL, so SQLite can't stand
+in): benchmark users are recreated and the rollups rebuilt on every seeded run.
+
+Rate limits are turned off for the in-process app, since every request comes from one client;
+start a server for --url with RATE_LIMIT_ENABLED=false, or the numbers measure 429s.
+
+    cd backend
+    python -m benchmarks.api_benchmark --users 200 --emotions 200000 --output before.json
+    python -m benchmarks.api_benchmark --skip-seed --output after.json --compare before.json
+    python -m benchmarks.api_benchmark --url http://127.0.0.1:8000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+from config import database
+from utils.emotion_writer import write_emotions
+from utils.jwt_handler import create_jwt
+from utils.migrations import run_migrations
+from utils.password_hashing import get_pwd_context
+from utils.rollups import rebuild_rollups
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+BENCH_PASSWORD = "bench-password"
+SEED_CHUNK = 5000
+ENDPOINTS = ["add_emotion", "get_emotion", "user_get_emotion_stats", "admin_get_emotion_stats", "get_all_emotion",
+             "login", "register"]
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# Seeding
+
+async def seed(users: int, emotions: int, days: int, rng: random.Random):
+    """
+    Recreate the benchmark users and spread `emotions` rows over the last `days` days.
+    """
+    await database.execute("DELETE FROM users WHERE email LIKE 'bench-%@example.com'")
+    password = get_pwd_context().hash(BENCH_PASSWORD)
+    for start in range(0, users, SEED_CHUNK):
+        names = range(start, min(users, start + SEED_CHUNK))
+        placeholders = ", ".join(f"(:name_{i}, :email_{i}, :password, {int(i == 0)})" for i in names)
+        values = {"password": password}
+        for i in names:
+            values.update({f"name_{i}": f"bench {i}", f"email_{i}": f"bench-{i}@example.com"})
+        await database.execute(f"INSERT INTO users (name, email, password, isAdmin) VALUES {placeholders}", values)
+
+    user_ids = [row["id"] for row in await database.fetch_all(
+        "SELECT id FROM users WHERE email LIKE 'bench-%@example.com' ORDER BY id")]
+    now = datetime.utcnow()
+    span = days * 86400
+    for start in range(0, emotions, SEED_CHUNK):
+        rows = [
+            {
+                "user_id": rng.choice(user_ids),
+                "emotion": rng.choice(EMOTIONS),
+                "timestamp": now - timedelta(seconds=rng.randrange(span)),
+                "confidence": round(rng.random(), 3),
+            }
+            for _ in range(min(SEED_CHUNK, emotions - start))
+        ]
+        await write_emotions(rows)
+    # Deleting the old benchmark users left their counts in the global totals
+    await rebuild_rollups()
+    return user_ids
+
+
+async def benchmark_context():
+    rows = await database.fetch_all("SELECT id, email, isAdmin FROM users WHERE email LIKE 'bench-%@example.com'")
+    if not rows:
+        raise SystemExit("No benchmark users found; run without --skip-seed first")
+    admin = next((row for row in rows if row["isAdmin"]), rows[0])
+    token = create_jwt({"sub": admin["email"], "role": True, "id": admin["id"]}, timedelta(hours=6))
+    return [row["id"] for row in rows], [row["email"] for row in rows], {"Authorization": f"Bearer {token}"}
+
+
+# Scenarios: each returns an async callable issuing one request
+
+def scenarios(user_ids, emails, admin_headers, rng: random.Random):
+    def add_emotion(client):
+        return client.post("/user/add_emotion", json={"userId": rng.choice(user_ids), "emotion": rng.choice(EMOTIONS)})
+
+    def get_emotion(client):
+        return client.get("/user/get_emotion", params={"user_id": rng.choice(user_ids), "limit": 100, "order": "desc"})
+
+    def user_stats(client):
+        return client.get("/user/get_emotion_stats", params={"user_id": rng.choice(user_ids)})
+
+    def admin_stats(client):
+        return client.get("/admin/get_emotion_stats", headers=admin_headers)
+
+    def get_all_emotion(client):
+        return client.get("/admin/get_all_emotion", params={"limit": 1000}, headers=admin_headers)
+
+    def login(client):
+        return client.post("/auth/login", json={"email": rng.choice(emails), "password": BENCH_PASSWORD})
+
+    def register(client):
+        email = f"bench-reg-{uuid.uuid4().hex}@example.com"
+        return client.post("/auth/register", json={"name": "bench", "email": email, "password": BENCH_PASSWORD})
+
+    return {
+        "add_emotion": add_emotion,
+        "get_emotion": get_emotion,
+        "user_get_emotion_stats": user_stats,
+        "admin_get_emotion_stats": admin_stats,
+        "get_all_emotion": get_all_emotion,
+        "login": login,
+        "register": register,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, request, requests: int, concurrency: int, warmup: int):
+    for _ in range(warmup):
+        await request(client)
+
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await request(client)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3),
+        },
+    }
+
+
+# Reporting
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _change(old, new):
+    change = (new - old) / old * 100 if old else 0.0
+    return f"{new:9.2f} ({change:+5.1f}%)"
+
+
+def compare(results: dict, baseline: dict):
+    print(f"{'endpoint':<26}{'p50 ms':>18}{'p99 ms':>18}{'req/s':>18}", file=sys.stderr)
+    for name, current in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+        print(f"{name:<26}"
+              f"{_change(before['latency_ms']['p50'], current['latency_ms']['p50']):>18}"
+              f"{_change(before['latency_ms']['p99'], current['latency_ms']['p99']):>18}"
+              f"{_change(before['throughput_rps'], current['throughput_rps']):>18}", file=sys.stderr)
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    await database.connect()
+    try:
+        await run_migrations()
+        if not args.skip_seed:
+            seed_start = time.perf_counter()
+            await seed(args.users, args.emotions, args.days, rng)
+            print(f"Seeded {args.users} users and {args.emotions} emotions in "
+                  f"{time.perf_counter() - seed_start:.1f} s", file=sys.stderr)
+        user_ids, emails, admin_headers = await benchmark_context()
+    finally:
+        await database.disconnect()
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        import main as app_module
+        from utils.rate_limit import rate_limiter
+        app = app_module.create_app()
+        rate_limiter.enabled = False
+        await app_module.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    selected = scenarios(user_ids, emails, admin_headers, rng)
+    results = {
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "mode": "http" if args.url else "in-process",
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users, "emotions": args.emotions, "days": args.days, "seed": args.seed,
+            "requests": args.requests, "concurrency": args.concurrency, "warmup": args.warmup,
+            "seeded": not args.skip_seed,
+        },
+        "endpoints": {},
+    }
+    try:
+        for name in args.endpoints or ENDPOINTS:
+            # bcrypt endpoints are two orders of magnitude slower; keep their runs short
+            requests = args.requests if name not in ("login", "register") else max(1, args.requests // 10)
+            results["endpoints"][name] = await run_scenario(
+                client, selected[name], requests, args.concurrency, args.warmup)
+            summary = results["endpoints"][name]
+            print(f"{name:<26}{summary['throughput_rps']:>10.1f} req/s  "
+                  f"p50 {summary['latency_ms']['p50']:8.2f}  p95 {summary['latency_ms']['p95']:8.2f}  "
+                  f"p99 {summary['latency_ms']['p99']:8.2f} ms  errors {summary['errors']}", file=sys.stderr)
+    finally:
+        await client.aclose()
+        if not args.url:
+            await app_module.shutdown()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of the app in-process")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--emotions", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=90, help="Spread seeded emotions over this many days")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the benchmark data from a previous run")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint (a tenth for login/register)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and request parameters")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, help="Subset of endpoints to run (default: all)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON report to print p50/p99/throughput changes against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+"""
+Vectorized analytics vs the per-row Python approach on synthetic data (no database needed).
+
+    cd backend
+    python -m benchmarks.bench_analytics --rows 100000 1000000
+"""
+import argparse
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from config import settings
+from utils import analytics
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+
+def python_baseline(user_ids, days, emotions, counts, window):
+    valence = settings.EMOTION_VALENCE
+    per_day = defaultdict(Counter)
+    for day, emotion, count in zip(days, emotions, counts):
+        per_day[day][emotion] += count
+    calendar = sorted(per_day)
+    mood = []
+    for day in calendar:
+        total = sum(per_day[day].values())
+        mood.append(sum(valence.get(e, 0.0) * c for e, c in per_day[day].items()) / total)
+    rolling = [sum(mood[max(0, i - window + 1):i + 1]) / len(mood[max(0, i - window + 1):i + 1])
+               for i in range(len(mood))]
+    transitions = Counter(zip(emotions[:-1], emotions[1:]))
+    return per_day, rolling, transitions
+
+
+def vectorized(user_ids, days, emotions, counts, window):
+    columns = analytics._daily_columns(user_ids, days, emotions, counts)
+    return (analytics.daily_distribution(columns), analytics.mood_series(columns, window),
+            analytics.transition_matrix(emotions))
+
+
+def main(sizes, window):
+    rng = np.random.default_rng(0)
+    for rows in sizes:
+        user_ids = rng.integers(1, 1000, rows).tolist()
+        # Days since the epoch, as fetch_daily_columns selects them
+        days = (19723 + rng.integers(0, 365, rows)).tolist()
+        emotions = [EMOTIONS[i] for i in rng.integers(0, len(EMOTIONS), rows)]
+        counts = rng.integers(1, 10, rows).tolist()
+
+        start = time.perf_counter()
+        python_baseline(user_ids, days, emotions, counts, window)
+        python_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        vectorized(user_ids, days, emotions, counts, window)
+        numpy_ms = (time.perf_counter() - start) * 1000
+        print(f"rows={rows:>9,}  python={python_ms:9.1f} ms  numpy={numpy_ms:9.1f} ms  "
+              f"speedup={python_ms / numpy_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--window", type=int, default=7)
+    args = parser.parse_args()
+    main(args.rows, args.window)
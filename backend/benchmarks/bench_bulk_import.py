@@ -0,0 +1,127 @@
+"""
+Sustained throughput of the bulk import path (python cli.py import).
+
+Generates a synthetic CSV or NDJSON file for the benchmark users, then times parsing alone,
+the full import through cli.import_records, and optionally the request-path writer
+(write_emotions) on a sample for comparison. Use a throwaway database: the benchmark users'
+emotions are deleted before each run.
+
+    cd backend
+    python -m benchmarks.bench_bulk_import --rows 1000000 --format csv --batch-size 20000
+    python -m benchmarks.bench_bulk_import --rows 200000 --format ndjson --compare-writer 50000
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cli
+from config import database
+from utils.emotion_writer import write_emotions
+from utils.migrations import run_migrations
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+
+async def seed_users(users: int):
+    await database.execute(
+        "DELETE FROM emotions WHERE user_id IN (SELECT id FROM users WHERE email LIKE 'bench-%@example.com')")
+    existing = await database.fetch_val("SELECT COUNT(*) FROM users WHERE email LIKE 'bench-%@example.com'")
+    for i in range(existing, users):
+        await database.execute(
+            "INSERT INTO users (name, email, password) VALUES (:name, :email, 'x')",
+            {"name": f"bench {i}", "email": f"bench-{i}@example.com"},
+        )
+    return [row["email"] for row in await database.fetch_all(
+        "SELECT email FROM users WHERE email LIKE 'bench-%@example.com' ORDER BY id LIMIT :limit", {"limit": users})]
+
+
+def generate(path: str, fmt: str, rows: int, emails, rng: random.Random):
+    now = datetime.utcnow()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["email", "emotion", "timestamp", "confidence"])
+        for _ in range(rows):
+            email = rng.choice(emails)
+            emotion = rng.choice(EMOTIONS)
+            timestamp = (now - timedelta(seconds=rng.randrange(90 * 86400))).isoformat()
+            confidence = round(rng.random(), 3)
+            if fmt == "csv":
+                writer.writerow([email, emotion, timestamp, confidence])
+            else:
+                f.write(json.dumps({"email": email, "emotion": emotion, "timestamp": timestamp,
+                                    "confidence": confidence}) + "\n")
+
+
+async def time_writer(path: str, fmt: str, sample: int):
+    """
+    Insert the first `sample` records through write_emotions in INSERT_CHUNK_SIZE batches.
+    """
+    user_ids = {}
+    records = []
+    for record in cli.read_records(path, fmt):
+        records.append(record)
+        if len(records) == sample:
+            break
+    await cli.resolve_users(records, user_ids)
+    now = datetime.utcnow()
+    rows = [cli._parse_record(record, user_ids, now) for record in records]
+    start = time.perf_counter()
+    for offset in range(0, len(rows), 500):
+        await write_emotions(rows[offset:offset + 500])
+    return len(rows), time.perf_counter() - start
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    await database.connect()
+    try:
+        await run_migrations()
+        emails = await seed_users(args.users)
+
+        suffix = (".csv" if args.format == "csv" else ".ndjson") + (".gz" if args.gzip else "")
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            start = time.perf_counter()
+            generate(path, args.format, args.rows, emails, rng)
+            print(f"Generated {args.rows:,} records ({os.path.getsize(path) / 1e6:.1f} MB) in "
+                  f"{time.perf_counter() - start:.1f} s")
+
+            start = time.perf_counter()
+            parsed = sum(1 for _ in cli.read_records(path, args.format))
+            elapsed = time.perf_counter() - start
+            print(f"{'parse only':<16}{parsed / elapsed:>14,.0f} rows/s")
+
+            result = await cli.import_records(cli.read_records(path, args.format), args.batch_size, progress=None)
+            print(f"{'cli import':<16}{result['loaded'] / result['seconds']:>14,.0f} rows/s  "
+                  f"({result['loaded']:,} loaded, {result['rejected']:,} rejected, {result['seconds']:.1f} s)")
+
+            if args.compare_writer:
+                count, elapsed = await time_writer(path, args.format, args.compare_writer)
+                print(f"{'write_emotions':<16}{count / elapsed:>14,.0f} rows/s  ({count:,} rows)")
+        finally:
+            os.remove(path)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Generate a .gz input file")
+    parser.add_argument("--batch-size", type=int, default=cli.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--compare-writer", type=int, default=0, metavar="ROWS",
+                        help="Also time write_emotions on this many rows")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
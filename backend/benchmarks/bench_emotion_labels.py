@@ -0,0 +1,106 @@
+"""
+Before/after for dictionary-encoded emotion labels: table and index size and GROUP BY time
+for the VARCHAR(50) label layout versus the SMALLINT emotion_id layout.
+
+Both layouts are built as scratch tables (bench_emotions_label, bench_emotions_id) in the
+database named by DATABASE_URL, filled with the same synthetic rows, and dropped afterwards.
+
+    cd backend
+    python -m benchmarks.bench_emotion_labels --rows 1000000 5000000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from config import database
+from utils.emotion_labels import DEFAULT_LABELS
+
+USERS = 1000
+
+LAYOUTS = {
+    "label": ("VARCHAR(50) NOT NULL", "emotion",
+              "ELT(1 + (n % {labels}), {quoted})"),
+    "id": ("SMALLINT UNSIGNED NOT NULL", "emotion_id",
+           "1 + (n % {labels})"),
+}
+
+
+def _create(name: str, column_type: str, column: str) -> str:
+    return f"""
+        CREATE TABLE bench_emotions_{name} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            {column} {column_type},
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            confidence FLOAT NULL,
+            INDEX idx_user_timestamp (user_id, timestamp),
+            INDEX idx_user_emotion (user_id, {column})
+        )
+    """
+
+
+async def timed(query, values=None, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await database.fetch_all(query, values)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def table_size(table: str):
+    await database.execute(f"ANALYZE TABLE {table}")
+    row = await database.fetch_one("""
+        SELECT data_length, index_length FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = :table
+    """, {"table": table})
+    return row["data_length"] / 1e6, row["index_length"] / 1e6
+
+
+async def run(rows: int):
+    quoted = ", ".join(f"'{label}'" for label in DEFAULT_LABELS)
+    print(f"rows={rows:,}")
+    for name, (column_type, column, expression) in LAYOUTS.items():
+        table = f"bench_emotions_{name}"
+        await database.execute(f"DROP TABLE IF EXISTS {table}")
+        await database.execute(_create(name, column_type, column))
+        expression = expression.format(labels=len(DEFAULT_LABELS), quoted=quoted)
+        # Numbers 0..rows-1 from a cross join of a digit table, a million per statement
+        for block in range(0, rows, 1000 * 1000):
+            await database.execute(f"""
+                INSERT INTO {table} (user_id, {column}, timestamp, confidence)
+                SELECT n % {USERS}, {expression}, NOW() - INTERVAL n MINUTE, (n % 100) / 100
+                FROM (
+                    SELECT a.d + 10 * b.d + 100 * c.d + 1000 * e.d + 10000 * f.d + 100000 * g.d + {block} AS n
+                    FROM bench_digits a, bench_digits b, bench_digits c, bench_digits e, bench_digits f, bench_digits g
+                ) numbers
+                WHERE n < {rows}
+            """)
+
+        data_mb, index_mb = await table_size(table)
+        admin = await timed(f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column}")
+        user = await timed(f"SELECT {column}, COUNT(*) FROM {table} WHERE user_id = :user_id GROUP BY {column}",
+                           {"user_id": 1})
+        print(f"  {name:<6} data {data_mb:8.1f} MB  index {index_mb:8.1f} MB  "
+              f"global GROUP BY {admin:9.2f} ms  per-user GROUP BY {user:7.2f} ms")
+        await database.execute(f"DROP TABLE {table}")
+
+
+async def main(sizes):
+    await database.connect()
+    try:
+        await database.execute("DROP TABLE IF EXISTS bench_digits")
+        await database.execute("CREATE TABLE bench_digits (d INT NOT NULL PRIMARY KEY)")
+        await database.execute("INSERT INTO bench_digits VALUES (0), (1), (2), (3), (4), (5), (6), (7), (8), (9)")
+        for rows in sizes:
+            await run(rows)
+    finally:
+        await database.execute("DROP TABLE IF EXISTS bench_digits")
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    asyncio.run(main(parser.parse_args().rows))
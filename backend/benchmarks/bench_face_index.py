@@ -0,0 +1,62 @@
+"""
+Query latency of the face identification index at several sizes, exact vs IVF.
+
+Uses random unit-length descriptors, so no database is needed.
+
+    cd backend
+    python -m benchmarks.bench_face_index --sizes 10000 100000 1000000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from utils.face_index import FaceIndex
+
+
+def random_descriptors(rng, count):
+    vectors = rng.standard_normal((count, 128), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def measure(index, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=1)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main(sizes, queries, nprobe):
+    rng = np.random.default_rng(42)
+    for size in sizes:
+        vectors = random_descriptors(rng, size)
+        ids = np.arange(size, dtype=np.int64)
+        sample = vectors[rng.choice(size, queries)] + rng.normal(0, 0.01, (queries, 128)).astype(np.float32)
+
+        exact = FaceIndex(ivf_min_size=size + 1)
+        exact.build(ids, vectors)
+        p50, p99 = measure(exact, sample)
+        print(f"n={size:>9,}  exact  p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+
+        start = time.perf_counter()
+        ivf = FaceIndex(ivf_min_size=0, nprobe=nprobe)
+        ivf.build(ids, vectors)
+        train_seconds = time.perf_counter() - start
+        p50, p99 = measure(ivf, sample)
+        hits = sum(ivf.search(q, 1)[0][0] == exact.search(q, 1)[0][0] for q in sample[:100])
+        print(f"n={size:>9,}  ivf    p50={p50:8.3f} ms  p99={p99:8.3f} ms  "
+              f"recall@1={hits / min(100, queries):.2f}  build={train_seconds:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+    main(args.sizes, args.queries, args.nprobe)
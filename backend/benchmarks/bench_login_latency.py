@@ -0,0 +1,85 @@
+"""
+Measure latency of an unrelated endpoint while logins hammer bcrypt.
+
+Registers a throwaway user, then runs concurrent /auth/login calls while probing
+/url-list, and prints probe p50/p99 with and without the login storm. Run the server with
+rate limits off, or the storm is mostly answered with 429 before reaching bcrypt:
+
+    cd backend
+    RATE_LIMIT_ENABLED=false uvicorn main:app &
+    python -m benchmarks.bench_login_latency --logins 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/url-list")
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def login_storm(client: httpx.AsyncClient, credentials: dict, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = Counter()
+
+    async def login():
+        async with semaphore:
+            statuses[(await client.post("/auth/login", json=credentials)).status_code] += 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    if statuses[429]:
+        raise SystemExit(f"{statuses[429]} of {logins} logins were rate limited: "
+                         "run the server with RATE_LIMIT_ENABLED=false")
+
+
+async def measure(client, credentials, logins, concurrency):
+    samples = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, stop, samples))
+    if logins:
+        await login_storm(client, credentials, logins, concurrency)
+    else:
+        await asyncio.sleep(2)
+    stop.set()
+    await prober
+    return samples
+
+
+async def main(args):
+    credentials = {"email": f"bench-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+    async with httpx.AsyncClient(base_url=args.url, timeout=120,
+                                 limits=httpx.Limits(max_connections=args.concurrency + 4)) as client:
+        response = await client.post("/auth/register", json={"name": "bench", **credentials})
+        response.raise_for_status()
+        response = await client.post("/auth/login", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        for label, logins in (("idle", 0), ("login storm", args.logins)):
+            samples = await measure(client, credentials, logins, args.concurrency)
+            print(f"{label:12} probes={len(samples):5}  p50={statistics.median(samples):8.2f} ms  "
+                  f"p99={percentile(samples, 99):8.2f} ms")
+
+        await client.delete("/user/delete", params={"email": credentials["email"]}, headers=headers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
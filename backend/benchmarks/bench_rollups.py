@@ -0,0 +1,87 @@
+"""
+Compare the raw GROUP BY stats queries against the rollup tables.
+
+Seeds the database pointed at by DATABASE_URL with synthetic users and emotions, rebuilds
+the rollups and times both paths. Use a throwaway database: the emotion tables are wiped.
+
+    cd backend
+    python -m benchmarks.bench_rollups --rows 1000000 10000000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from config import database
+from utils.emotion_labels import emotion_labels
+from utils.migrations import run_migrations
+from utils.rollups import rebuild_rollups
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+RAW_ADMIN = "SELECT emotion_id, COUNT(*) AS count FROM emotions GROUP BY emotion_id ORDER BY count DESC"
+RAW_USER = ("SELECT emotion_id, COUNT(*) AS count FROM emotions WHERE user_id = :user_id "
+            "GROUP BY emotion_id ORDER BY count DESC")
+ROLLUP_ADMIN = "SELECT emotion_id, count FROM emotion_totals WHERE count > 0 ORDER BY count DESC"
+ROLLUP_USER = ("SELECT emotion_id, count FROM emotion_user_totals WHERE user_id = :user_id AND count > 0 "
+               "ORDER BY count DESC")
+
+
+async def seed(rows: int, users: int):
+    await database.execute("DELETE FROM emotions")
+    await database.execute("DELETE FROM users WHERE email LIKE 'bench-%@example.com'")
+    for i in range(users):
+        await database.execute(
+            "INSERT INTO users (name, email, password) VALUES (:name, :email, 'x')",
+            {"name": f"bench {i}", "email": f"bench-{i}@example.com"},
+        )
+    user_ids = [r["id"] for r in await database.fetch_all(
+        "SELECT id FROM users WHERE email LIKE 'bench-%@example.com'")]
+
+    # Seed one row per (user, emotion), then double with INSERT ... SELECT until the target is reached
+    label_ids = await emotion_labels.ids(EMOTIONS)
+    values = ", ".join(f"({uid}, {label_ids[emotion]}, NOW() - INTERVAL {n} MINUTE)"
+                       for n, (uid, emotion) in enumerate((u, e) for u in user_ids for e in EMOTIONS))
+    await database.execute(f"INSERT INTO emotions (user_id, emotion_id, timestamp) VALUES {values}")
+    count = len(user_ids) * len(EMOTIONS)
+    while count < rows:
+        batch = min(count, rows - count)
+        await database.execute(f"""
+            INSERT INTO emotions (user_id, emotion_id, timestamp)
+            SELECT user_id, emotion_id, timestamp - INTERVAL {count} MINUTE FROM emotions LIMIT {batch}
+        """)
+        count += batch
+    return user_ids
+
+
+async def timed(query, values=None, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await database.fetch_all(query, values)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main(sizes, users):
+    await database.connect()
+    try:
+        await run_migrations()
+        for rows in sizes:
+            user_ids = await seed(rows, users)
+            await rebuild_rollups()
+            user = {"user_id": user_ids[0]}
+            print(f"rows={rows:,}")
+            print(f"  admin stats  raw={await timed(RAW_ADMIN):9.2f} ms  rollup={await timed(ROLLUP_ADMIN):7.2f} ms")
+            print(f"  user stats   raw={await timed(RAW_USER, user):9.2f} ms  "
+                  f"rollup={await timed(ROLLUP_USER, user):7.2f} ms")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.users))
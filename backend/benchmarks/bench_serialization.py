@@ -0,0 +1,75 @@
+"""
+Serialize time and bytes on the wire for a large emotion history.
+
+Builds the /user/get_emotion payload for N synthetic rows and encodes it the old way
+(jsonable_encoder + json.dumps, FastAPI's default) and through utils.serialization: orjson
+with per-row objects and with the columnar layout, plus MessagePack when the `msgpack`
+package is installed. Sizes are reported raw and gzip'd. No database is needed.
+
+    cd backend
+    python -m benchmarks.bench_serialization --rows 100000
+"""
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from utils.emotion_history import RAW_FIELDS, shape_rows
+from utils.serialization import JSON, MSGPACK, encode, msgpack
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+
+def synthetic_rows(count: int, rng: random.Random):
+    start = datetime(2024, 1, 1)
+    return [
+        (i + 1, rng.choice(EMOTIONS), start + timedelta(seconds=37 * i), round(rng.random(), 3))
+        for i in range(count)
+    ]
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main(rows: int, repeat: int, seed: int):
+    items = synthetic_rows(rows, random.Random(seed))
+    cases = {
+        "stdlib json, rows": lambda: json.dumps(
+            jsonable_encoder({"emotion": shape_rows(items, RAW_FIELDS)}), separators=(",", ":")).encode(),
+        "orjson, rows": lambda: encode({"emotion": shape_rows(items, RAW_FIELDS)}, JSON),
+        "orjson, columns": lambda: encode({"emotion": shape_rows(items, RAW_FIELDS, "columns")}, JSON),
+    }
+    if msgpack is not None:
+        cases["msgpack, rows"] = lambda: encode({"emotion": shape_rows(items, RAW_FIELDS)}, MSGPACK)
+        cases["msgpack, columns"] = lambda: encode({"emotion": shape_rows(items, RAW_FIELDS, "columns")}, MSGPACK)
+
+    print(f"rows={rows:,} (build + encode, median of {repeat})")
+    baseline = None
+    for name, fn in cases.items():
+        ms, body = timed(fn, repeat)
+        baseline = baseline or ms
+        print(f"  {name:<20}{ms:9.1f} ms ({baseline / ms:4.1f}x)  {len(body) / 1e6:7.2f} MB  "
+              f"gzip {len(gzip.compress(body, 6)) / 1e6:6.2f} MB")
+    if msgpack is None:
+        print("  (install msgpack to include MessagePack)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    main(args.rows, args.repeat, args.seed)
@@ -0,0 +1,59 @@
+"""
+Cold-start time of a worker: a fresh interpreter imports main, builds the app and runs the
+startup phase (connect, schema check, face index) against DATABASE_URL, as an autoscaled
+worker would. Each run is a new process; the wall time and per-phase times are reported.
+
+    cd backend
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# One event loop for startup and shutdown, as under uvicorn: the pool and the background
+# tasks startup creates belong to that loop
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+app = main.create_app()
+
+async def run():
+    await main.startup()
+    ready = time.perf_counter() - started
+    await main.shutdown()
+    return ready
+
+ready = asyncio.run(run())
+print(json.dumps({"ready_seconds": ready, **main.startup_times}))
+"""
+
+
+def run_once():
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    return wall, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs):
+    walls = []
+    phases = {}
+    for _ in range(runs):
+        wall, times = run_once()
+        walls.append(wall * 1000)
+        for name, seconds in times.items():
+            phases.setdefault(name, []).append(seconds * 1000)
+
+    print(f"{'process wall':<24}{statistics.median(walls):>10.1f} ms median  {max(walls):>10.1f} ms max")
+    for name, samples in phases.items():
+        print(f"{name:<24}{statistics.median(samples):>10.1f} ms median  {max(samples):>10.1f} ms max")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    main(parser.parse_args().runs)
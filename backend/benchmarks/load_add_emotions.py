@@ -0,0 +1,77 @@
+"""
+Load test comparing POST /user/add_emotion against the batched POST /user/add_emotions.
+
+Run against a live server backed by a throwaway database, with rate limits off (one user
+sending thousands of rows would otherwise be answered with 429):
+
+    cd backend
+    RATE_LIMIT_ENABLED=false uvicorn main:app &
+    python -m benchmarks.load_add_emotions --user-id 1 --rows 20000 --batch-size 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+EMOTIONS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+
+def check(response: httpx.Response):
+    if response.status_code == 429:
+        raise SystemExit("Rate limited: run the server with RATE_LIMIT_ENABLED=false")
+    response.raise_for_status()
+
+
+async def run_workers(concurrency: int, jobs: list, send):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            await send(queue.get_nowait())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def single_rows(client: httpx.AsyncClient, user_id: int, rows: int, concurrency: int):
+    async def send(emotion):
+        response = await client.post("/user/add_emotion", json={"userId": user_id, "emotion": emotion})
+        check(response)
+
+    return await run_workers(concurrency, [random.choice(EMOTIONS) for _ in range(rows)], send)
+
+
+async def batches(client: httpx.AsyncClient, user_id: int, rows: int, batch_size: int, concurrency: int):
+    async def send(batch):
+        response = await client.post("/user/add_emotions", json={"userId": user_id, "emotions": batch})
+        check(response)
+
+    jobs = []
+    for start in range(0, rows, batch_size):
+        jobs.append([{"emotion": random.choice(EMOTIONS), "confidence": round(random.random(), 3)}
+                     for _ in range(min(batch_size, rows - start))])
+    return await run_workers(concurrency, jobs, send)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        elapsed = await single_rows(client, args.user_id, args.rows, args.concurrency)
+        print(f"add_emotion   {args.rows:>8} rows  {elapsed:7.2f} s  {args.rows / elapsed:10.0f} inserts/s")
+        elapsed = await batches(client, args.user_id, args.rows, args.batch_size, args.concurrency)
+        print(f"add_emotions  {args.rows:>8} rows  {elapsed:7.2f} s  {args.rows / elapsed:10.0f} inserts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
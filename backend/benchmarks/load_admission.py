@@ -0,0 +1,105 @@
+"""
+Load test for admission control: latency of well-behaved clients with and without an attack.
+
+Well-behaved clients are --users users with their own tokens, each polling
+/user/get_emotion_stats and /user/get_user_profile at --rate requests per second. The
+test runs twice for --seconds each: alone, then alongside an attack of --attackers
+connections flooding /auth/login with bad passwords and /admin/get_all_emotion with one
+admin token as fast as they can. With admission control on, the attack should be answered
+with 429/503 while the well-behaved percentiles stay about where they were; run the server
+with RATE_LIMIT_ENABLED=false to see the difference.
+
+Tokens are signed with the server's SECRET_KEY, so run it from the backend directory with
+the same .env as the server:
+
+    cd backend
+    uvicorn main:app &
+    python -m benchmarks.load_admission --users 1 2 3 4 --admin-user 5 --seconds 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+from utils.jwt_handler import create_jwt
+
+
+def token(user_id: int, admin: bool = False) -> str:
+    return create_jwt({"sub": f"user{user_id}@example.com", "role": admin, "id": user_id})
+
+
+async def well_behaved(client: httpx.AsyncClient, user_id: int, rate: float, until: float, latencies, statuses):
+    headers = {"Authorization": f"Bearer {token(user_id)}"}
+    requests = [
+        ("/user/get_emotion_stats", {"user_id": user_id}),
+        ("/user/get_user_profile", None),
+    ]
+    sent = 0
+    while time.perf_counter() < until:
+        path, params = requests[sent % len(requests)]
+        start = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] += 1
+        sent += 1
+        await asyncio.sleep(max(0.0, 1 / rate - (time.perf_counter() - start)))
+
+
+async def attacker(client: httpx.AsyncClient, admin_token: str, until: float, statuses, index: int):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    while time.perf_counter() < until:
+        try:
+            if index % 2:
+                response = await client.post("/auth/login", json={"email": "nobody@example.com", "password": "wrong"})
+            else:
+                response = await client.get("/admin/get_all_emotion", params={"limit": 1000}, headers=headers)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError:
+            statuses["error"] += 1
+
+
+def percentiles(samples):
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return (f"p50 {statistics.median(samples):7.1f} ms  p95 {pick(0.95):7.1f} ms  "
+            f"p99 {pick(0.99):7.1f} ms  max {samples[-1]:7.1f} ms")
+
+
+async def phase(args, attack: bool):
+    latencies = []
+    statuses = Counter()
+    attack_statuses = Counter()
+    until = time.perf_counter() + args.seconds
+    limits = httpx.Limits(max_connections=len(args.users) + args.attackers + 10)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        tasks = [well_behaved(client, user_id, args.rate, until, latencies, statuses) for user_id in args.users]
+        if attack:
+            admin_token = token(args.admin_user, admin=True)
+            tasks += [attacker(client, admin_token, until, attack_statuses, i) for i in range(args.attackers)]
+        await asyncio.gather(*tasks)
+
+    print(f"{'under attack' if attack else 'baseline':<13} {percentiles(latencies)}  statuses {dict(statuses)}")
+    if attack:
+        total = sum(attack_statuses.values())
+        print(f"{'':<13} attack: {total} requests ({total / args.seconds:.0f}/s), statuses {dict(attack_statuses)}")
+
+
+async def main(args):
+    await phase(args, attack=False)
+    await phase(args, attack=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, nargs="+", required=True, help="ids of the well-behaved users")
+    parser.add_argument("--admin-user", type=int, required=True, help="id used for the attacker's admin token")
+    parser.add_argument("--rate", type=float, default=5, help="requests per second per well-behaved user")
+    parser.add_argument("--attackers", type=int, default=200, help="concurrent attacking connections")
+    parser.add_argument("--seconds", type=float, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,323 @@
+"""
+Bulk import and export of emotion records.
+
+    cd backend
+    python cli.py import emotions.csv                      # CSV or NDJSON, optionally .gz
+    python cli.py import emotions.ndjson.gz --batch-size 20000 --strict
+    python cli.py export --output all.csv.gz
+    python cli.py export --email someone@example.com --from 2024-01-01 --to 2024-02-01 --format ndjson
+
+Import records carry `email` or `user_id`, `emotion`, and optionally `timestamp` (ISO 8601,
+default now) and `confidence` (0..1). Users are resolved and checked in bulk, rows are
+loaded in multi-row batches together with their rollups, and progress goes to stderr.
+Exports stream in keyset pages, so memory stays flat at any size.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Union
+
+from config import database
+from utils.date_utils import to_utc_naive
+from utils.emotion_labels import emotion_labels
+from utils.emotion_writer import bulk_insert_emotions
+from utils.migrations import run_migrations
+from utils.response_cache import response_cache
+
+DEFAULT_BATCH_SIZE = 10000
+EXPORT_PAGE_SIZE = 50000
+EMAIL_LOOKUP_CHUNK = 1000
+MAX_EMOTION_LENGTH = 50
+
+
+class RecordError(Exception):
+    pass
+
+
+def _open_text(path: str, mode: str):
+    if path == "-":
+        return nullcontext(sys.stdin if "r" in mode else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", newline="")
+    return open(path, mode, newline="")
+
+
+def _detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith(".gz") else path
+    return "ndjson" if name.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def read_records(path: str, fmt: str) -> Iterator[Union[dict, str]]:
+    with _open_text(path, "r") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            # Lines are decoded by import_records, so a bad one is rejected like any other record
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def _batches(records: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def resolve_users(records, known: Dict[object, Optional[int]]):
+    """
+    Map the emails and user ids in `records` that aren't in `known` yet to user ids, with one
+    query per EMAIL_LOOKUP_CHUNK keys. Unknown users map to None.
+    """
+    emails, ids = set(), set()
+    for record in records:
+        user_id = record.get("user_id")
+        if user_id not in (None, ""):
+            try:
+                ids.add(int(user_id))
+            except (TypeError, ValueError):
+                pass
+        elif isinstance(record.get("email"), str):
+            emails.add(record["email"])
+
+    for column, keys in (("email", emails), ("id", ids)):
+        missing = [key for key in keys if key not in known]
+        for start in range(0, len(missing), EMAIL_LOOKUP_CHUNK):
+            chunk = missing[start:start + EMAIL_LOOKUP_CHUNK]
+            values = {f"key_{i}": key for i, key in enumerate(chunk)}
+            rows = await database.fetch_all(
+                f"SELECT id, {column} FROM users WHERE {column} IN ({', '.join(':' + name for name in values)})",
+                values,
+            )
+            found = {row[column]: row["id"] for row in rows}
+            for key in chunk:
+                known[key] = found.get(key)
+
+
+def _decode_record(record: Union[dict, str]) -> dict:
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}") from e
+    if not isinstance(record, dict):
+        raise TypeError(f"expected an object, got {type(record).__name__}")
+    return record
+
+
+def _parse_record(record: dict, user_ids: Dict[object, Optional[int]], now: datetime) -> dict:
+    if record.get("user_id") not in (None, ""):
+        user_id = user_ids.get(int(record["user_id"]))
+    else:
+        user_id = user_ids.get(record.get("email") or "")
+    if user_id is None:
+        raise ValueError(f"unknown user {record.get('user_id') or record.get('email')!r}")
+
+    emotion = record.get("emotion") or ""
+    if not isinstance(emotion, str) or not 1 <= len(emotion) <= MAX_EMOTION_LENGTH:
+        raise ValueError(f"invalid emotion {emotion!r}")
+
+    timestamp = record.get("timestamp")
+    timestamp = to_utc_naive(datetime.fromisoformat(timestamp)) if timestamp else now
+
+    confidence = record.get("confidence")
+    if confidence in (None, ""):
+        confidence = None
+    else:
+        confidence = float(confidence)
+        if not 0.0 <= confidence <= 1.0:
+            raise ValueError(f"confidence {confidence} out of range")
+    return {"user_id": user_id, "emotion": emotion, "timestamp": timestamp, "confidence": confidence}
+
+
+async def import_records(records: Iterator[Union[dict, str]], batch_size: int = DEFAULT_BATCH_SIZE,
+                         strict: bool = False, progress=sys.stderr) -> dict:
+    """
+    Validate, resolve and load records in batches. Records are dicts, or NDJSON lines still to
+    be decoded. Returns counts of loaded and rejected rows.
+    """
+    user_ids: Dict[object, Optional[int]] = {}
+    loaded = rejected = 0
+    start = time.perf_counter()
+    for batch_index, batch in enumerate(_batches(records, batch_size)):
+        decoded = []
+        for i, record in enumerate(batch):
+            try:
+                decoded.append((i, _decode_record(record)))
+            except (ValueError, TypeError) as e:
+                if strict:
+                    raise RecordError(f"record {batch_index * batch_size + i + 1}: {e}") from e
+                rejected += 1
+        await resolve_users((record for _, record in decoded), user_ids)
+        now = datetime.utcnow()
+        rows = []
+        for i, record in decoded:
+            try:
+                rows.append(_parse_record(record, user_ids, now))
+            except (ValueError, TypeError) as e:
+                if strict:
+                    raise RecordError(f"record {batch_index * batch_size + i + 1}: {e}") from e
+                rejected += 1
+        loaded += await bulk_insert_emotions(rows)
+
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            print(f"\r{loaded:>12,} rows loaded  {rejected:>8,} rejected  {loaded / elapsed:>12,.0f} rows/s",
+                  end="", file=progress, flush=True)
+    if progress is not None:
+        print(file=progress)
+    if loaded:
+        await response_cache.invalidate()
+    return {"loaded": loaded, "rejected": rejected, "seconds": time.perf_counter() - start}
+
+
+async def _resolve_user(email: Optional[str], user_id: Optional[int]) -> Optional[int]:
+    if email is None:
+        return user_id
+    found = await database.fetch_val("SELECT id FROM users WHERE email = :email", {"email": email})
+    if found is None:
+        raise SystemExit(f"No user with email {email}")
+    return found
+
+
+async def iterate_export(user_id: Optional[int], start: Optional[datetime], end: Optional[datetime],
+                         page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Yield pages of (user_id, email, emotion, timestamp, confidence) ordered by user, time and id.
+    """
+    conditions = []
+    values = {"limit": page_size}
+    if user_id is not None:
+        conditions.append("e.user_id = :user_id")
+        values["user_id"] = user_id
+    if start is not None:
+        conditions.append("e.timestamp >= :start")
+        values["start"] = start
+    if end is not None:
+        conditions.append("e.timestamp < :end")
+        values["end"] = end
+
+    after = None
+    while True:
+        page_conditions = list(conditions)
+        if after is not None:
+            page_conditions.append("""(e.user_id > :after_user OR (e.user_id = :after_user AND
+                (e.timestamp > :after_timestamp OR (e.timestamp = :after_timestamp AND e.id > :after_id))))""")
+            values.update({"after_user": after[0], "after_timestamp": after[1], "after_id": after[2]})
+        where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+        rows = await database.fetch_all(f"""
+            SELECT e.id, e.user_id, u.email, e.emotion_id, e.timestamp, e.confidence
+            FROM emotions e
+            JOIN users u ON u.id = e.user_id
+            {where}
+            ORDER BY e.user_id, e.timestamp, e.id
+            LIMIT :limit
+        """, values)
+        if not rows:
+            return
+        labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+        yield [{**row, "emotion": labels[row["emotion_id"]]} for row in rows]
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        after = (last["user_id"], last["timestamp"], last["id"])
+
+
+async def export_records(output: str, fmt: str, user_id: Optional[int], start: Optional[datetime],
+                         end: Optional[datetime], progress=sys.stderr) -> int:
+    exported = 0
+    began = time.perf_counter()
+    with _open_text(output, "w") as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["user_id", "email", "emotion", "timestamp", "confidence"])
+        async for rows in iterate_export(user_id, start, end):
+            if writer is not None:
+                writer.writerows(
+                    (row["user_id"], row["email"], row["emotion"], row["timestamp"].isoformat(), row["confidence"])
+                    for row in rows
+                )
+            else:
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write(json.dumps({
+                        "user_id": row["user_id"], "email": row["email"], "emotion": row["emotion"],
+                        "timestamp": row["timestamp"].isoformat(), "confidence": row["confidence"],
+                    }))
+                    buffer.write("\n")
+                f.write(buffer.getvalue())
+            exported += len(rows)
+            if progress is not None:
+                elapsed = time.perf_counter() - began
+                print(f"\r{exported:>12,} rows exported  {exported / elapsed:>12,.0f} rows/s",
+                      end="", file=progress, flush=True)
+    if progress is not None:
+        print(file=progress)
+    return exported
+
+
+def _parse_datetime(value: str) -> datetime:
+    return to_utc_naive(datetime.fromisoformat(value))
+
+
+async def _main(args) -> int:
+    await database.connect()
+    try:
+        await run_migrations()
+        if args.command == "import":
+            fmt = _detect_format(args.path, args.format)
+            try:
+                result = await import_records(read_records(args.path, fmt), args.batch_size, args.strict)
+            except RecordError as e:
+                print(f"Import aborted: {e}", file=sys.stderr)
+                return 1
+            print(f"Loaded {result['loaded']:,} rows ({result['rejected']:,} rejected) in "
+                  f"{result['seconds']:.1f} s", file=sys.stderr)
+        else:
+            user_id = await _resolve_user(args.email, args.user_id)
+            fmt = _detect_format(args.output, args.format)
+            exported = await export_records(args.output, fmt, user_id, args.start, args.end)
+            print(f"Exported {exported:,} rows", file=sys.stderr)
+    finally:
+        await database.disconnect()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Bulk-load emotion records from CSV or NDJSON")
+    importer.add_argument("path", help="Input file (.csv, .ndjson, optionally .gz) or - for stdin")
+    importer.add_argument("--format", choices=["csv", "ndjson"], help="Override detection by extension")
+    importer.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    importer.add_argument("--strict", action="store_true", help="Abort on the first invalid record")
+
+    exporter = commands.add_parser("export", help="Stream emotion records to CSV or NDJSON")
+    exporter.add_argument("--output", default="-", help="Output file (.csv, .ndjson, optionally .gz) or - for stdout")
+    exporter.add_argument("--format", choices=["csv", "ndjson"], help="Override detection by extension")
+    user = exporter.add_mutually_exclusive_group()
+    user.add_argument("--email", help="Only this user's emotions")
+    user.add_argument("--user-id", type=int, help="Only this user's emotions")
+    exporter.add_argument("--from", dest="start", type=_parse_datetime, help="Start of the range (inclusive)")
+    exporter.add_argument("--to", dest="end", type=_parse_datetime, help="End of the range (exclusive)")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(build_parser().parse_args())))
@@ -1,21 +1,224 @@
+"""
+Settings and the shared database handle.
+
+Nothing is built at import time: `settings` and `database` are created on first access
+(`from config import settings` counts), so tools and app factories can call configure()
+with their own Settings before any module reads them.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-from databases import Database
-
-# Load environment variables from .env file
-load_dotenv()
 
 
 class Settings(BaseSettings):
     SECRET_KEY: str
     DATABASE_URL: str
 
+    # Connection pool (per worker; MySQL only) and query instrumentation
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_RECYCLE: int = 3600  # seconds before a pooled connection is replaced
+    DB_POOL_TIMEOUT: float = 10.0  # seconds to wait for a free connection
+    DB_SLOW_QUERY_MS: int = 200
+
+    # Read replicas for the heavy read endpoints; empty sends everything to DATABASE_URL
+    READ_DATABASE_URL: Optional[str] = None
+    READ_DATABASE_URLS: List[str] = []  # several replicas, as a JSON list
+    READ_STICKY_SECONDS: float = 5  # a user's reads stay on the primary this long after they write
+    REPLICA_HEALTH_INTERVAL_SECONDS: float = 5
+    REPLICA_HEALTH_TIMEOUT_SECONDS: float = 2
+    REPLICA_CACHE_SECONDS: float = 10  # cached responses computed on a replica are refreshed this often
+
+    # Schema migrations normally run as a deploy step (python -m utils.migrations); when this
+    # is off, workers refuse to start against an out-of-date schema instead of migrating it
+    RUN_MIGRATIONS_ON_STARTUP: bool = False
+
+    # /metrics answers an admin token, or this token for a Prometheus scraper (bearer_token)
+    METRICS_TOKEN: Optional[str] = None
+
+    # Request profiling, off unless PROFILE_ROUTES lists paths such as "/auth/login"
+    PROFILE_ROUTES: List[str] = []
+    PROFILE_SAMPLE_RATE: float = 0.1  # fraction of matching requests to profile
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_OUTPUT_DIR: str = "profiles"  # folded stacks are written here on shutdown
+
+    # Labels /user/add_emotion(s) accept (face-api.js expressions); cli.py imports may carry others
+    EMOTION_LABELS: List[str] = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+
+    # Mood score per emotion label (face-api.js expressions); unknown labels count as 0
+    EMOTION_VALENCE: Dict[str, float] = {
+        "happy": 1.0,
+        "surprised": 0.5,
+        "neutral": 0.0,
+        "sad": -1.0,
+        "angry": -1.0,
+        "fearful": -1.0,
+        "disgusted": -1.0,
+    }
+
+    # Profile image storage, relative to the backend directory
+    FACE_DATA_DIR: str = "face_data"
+    THUMBNAIL_SIZE: int = 128
+
+    # Face identification index
+    FACE_INDEX_DIR: str = "face_index"
+    FACE_INDEX_IVF_MIN_SIZE: int = 50000  # Partition the index once it holds this many faces
+    FACE_INDEX_NPROBE: int = 8
+    FACE_INDEX_SYNC_SECONDS: float = 5  # how often workers apply each other's descriptor changes
+    FACE_MATCH_THRESHOLD: float = 0.4
+    # Match distance for server (dlib) descriptors against the browser's; unset keeps clients on
+    # the profile image. Calibrate with `python -m utils.face_descriptors compare` before setting it.
+    FACE_SERVER_DESCRIPTOR_THRESHOLD: Optional[float] = None
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12  # Changing this rehashes stored passwords on next login
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Auth caches (seconds); a TTL of 0 disables the cache
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL: int = 300
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL: int = 30
+
+    # Write-behind buffer for /user/add_emotion
+    EMOTION_BUFFER_ENABLED: bool = False
+    EMOTION_BUFFER_CAPACITY: int = 10000
+    EMOTION_BUFFER_BATCH_SIZE: int = 500
+    EMOTION_BUFFER_FLUSH_INTERVAL_MS: int = 50
+    EMOTION_BUFFER_BLOCK_WHEN_FULL: bool = False  # False answers 429 when the buffer is full
+
+    # Raw emotion retention; older rows are archived and served from the daily rollups
+    RETENTION_ENABLED: bool = False
+    RETENTION_RAW_DAYS: int = 180
+    RETENTION_INTERVAL_HOURS: float = 24
+    RETENTION_BATCH_SIZE: int = 5000
+    RETENTION_BATCH_PAUSE_MS: int = 50
+    RETENTION_ARCHIVE_DIR: str = "archive"
+
+    # Background account and record deletion (see utils.deletion_jobs)
+    DELETION_BATCH_SIZE: int = 1000  # emotion rows per delete transaction
+    DELETION_BATCH_PAUSE_MS: int = 50
+    DELETION_POLL_SECONDS: float = 5
+    DELETION_MAX_ATTEMPTS: int = 5
+    DELETION_MAX_RECORDS: int = 10000  # ids per /user/remove request
+
+    # Admission control (see utils.rate_limit); excess requests get 429 or 503 straight away
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # or "redis" to share the buckets between workers
+    RATE_LIMIT_URL: Optional[str] = None  # e.g. redis://localhost:6379/1
+    RATE_LIMIT_MAX_KEYS: int = 100000  # buckets kept per worker by the memory backend
+    # Key anonymous clients by X-Forwarded-For. Set it behind a reverse proxy, or every anonymous
+    # client shares the proxy's buckets (e.g. one auth_ip bucket for all logins)
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+    # Route class -> [requests per second, burst] for each client (token user, else IP) and route;
+    # login and registration use "auth" per submitted email and "auth_ip" per client IP
+    RATE_LIMITS: Dict[str, List[float]] = {
+        "auth": [1, 10],
+        "auth_ip": [10, 50],
+        "heavy": [2, 20],
+        "write": [50, 200],
+        "read": [20, 100],
+    }
+    # Route class -> requests in progress at once per worker
+    CONCURRENCY_LIMITS: Dict[str, int] = {
+        "auth": 16,
+        "heavy": 8,
+        "write": 128,
+        "read": 256,
+    }
+
+    # Response cache for the admin stats endpoints ("memory" or "redis")
+    CACHE_BACKEND: str = "memory"
+    CACHE_URL: Optional[str] = None  # e.g. redis://localhost:6379/0
+    RESPONSE_CACHE_TTL: int = 300
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # total body size per worker (memory backend)
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 16 * 1024 * 1024
+
+    # Live emotion stream for admin dashboards
+    EVENT_STREAM_QUEUE_SIZE: int = 256  # messages buffered per subscriber before it is dropped
+    EVENT_STREAM_MAX_SUBSCRIBERS: int = 10000
+    EVENT_STREAM_HEARTBEAT_SECONDS: int = 15
+
     class Config:
         env_file = ".env"  # Specify the dotenv file to use
 
 
-# Instantiate settings
-settings = Settings()
+_configured: Optional[Settings] = None
+
+
+def configure(settings: Settings):
+    """
+    Use `settings` instead of reading the environment. Must run before anything reads them.
+    """
+    global _configured
+    if get_settings.cache_info().currsize and get_settings() is not settings:
+        raise RuntimeError("Settings are already in use; call configure() before importing the app modules")
+    _configured = settings
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    if _configured is not None:
+        return _configured
+    # Load environment variables from .env file
+    load_dotenv()
+    return Settings()
+
+
+def pool_options(settings: Settings, url: Optional[str] = None) -> dict:
+    if not (url or settings.DATABASE_URL).startswith("mysql"):
+        return {}
+    return {
+        "min_size": settings.DB_POOL_MIN_SIZE,
+        "max_size": settings.DB_POOL_MAX_SIZE,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Timestamps are written as UTC from Python (datetime.utcnow) and truncated to
+        # buckets in SQL (DATE(timestamp)); a UTC session keeps both, and CURRENT_TIMESTAMP
+        # defaults, on the same clock whatever the server's time zone is
+        "init_command": "SET time_zone = '+00:00'",
+    }
+
+
+@lru_cache(maxsize=None)
+def get_database():
+    # Imported here so loading config doesn't pull in the database drivers
+    from utils.instrumented_database import InstrumentedDatabase
+
+    settings = get_settings()
+    return InstrumentedDatabase(
+        settings.DATABASE_URL,
+        slow_query_ms=settings.DB_SLOW_QUERY_MS,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        **pool_options(settings),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_read_databases() -> list:
+    from utils.instrumented_database import InstrumentedDatabase
+
+    settings = get_settings()
+    urls = list(settings.READ_DATABASE_URLS)
+    if settings.READ_DATABASE_URL and settings.READ_DATABASE_URL not in urls:
+        urls.insert(0, settings.READ_DATABASE_URL)
+    return [
+        InstrumentedDatabase(
+            url,
+            slow_query_ms=settings.DB_SLOW_QUERY_MS,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            **pool_options(settings, url),
+        )
+        for url in urls
+    ]
+
 
-# Instantiate the Database connection
-database = Database(settings.DATABASE_URL)
+def __getattr__(name):
+    if name == "settings":
+        return get_settings()
+    if name == "database":
+        return get_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,77 +1,219 @@
-import os
-import sqlalchemy
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from starlette.staticfiles import StaticFiles
+"""
+Application factory.
+
+    uvicorn main:app                       # default settings from the environment / .env
+    uvicorn --factory main:create_app      # same, built by uvicorn
+
+Schema migrations are a separate deploy step (python -m utils.migrations); startup only
+checks that none are pending unless RUN_MIGRATIONS_ON_STARTUP is set. How long each startup
+phase took is logged and exported as emotion_tracker_startup_* gauges on /metrics.
+"""
+import time
+
+_import_started = time.perf_counter()
 
-from config import database
+import logging
+from contextlib import asynccontextmanager
 from importlib import import_module
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+
+from config import Settings, configure, get_database, get_settings
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Set up CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.mount("/static", StaticFiles(directory="G:/emotion-tracker/backend"), name="static")
+# Mounted in this order: (URL prefix, module, router attribute)
+ROUTERS = [
+    ("/admin", "routes.admin_routes", "admin_router"),
+    ("/auth", "routes.auth_routes", "auth_router"),
+    ("/user", "routes.user_routes", "user_router"),
+]
 
-metadata = sqlalchemy.MetaData()
+# Seconds spent in each startup phase, exported through the metrics registry
+startup_times = {}
 
-# Dynamically include all routers from the routes folder
-for filename in os.listdir("routes"):
-    if filename.endswith("_routes.py"):
-        module_name = filename[:-3]  # Remove .py extension
-        prefix = module_name.split("_")[0]  # Extract the prefix before _
-        module = import_module(f"routes.{module_name}")
-        if hasattr(module, f"{prefix}_router"):
-            router = getattr(module, f"{prefix}_router")
-            app.include_router(router, prefix=f"/{prefix}")
+
+class _phase:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        startup_times[f"{self.name}_seconds"] = time.perf_counter() - self.start
 
 
-@app.on_event("startup")
 async def startup():
-    await database.connect()
-    # Ensure the table exists
-    create_users_table = """
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            email VARCHAR(100) NOT NULL UNIQUE,
-            name VARCHAR(100) NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            isAdmin BOOLEAN NOT NULL DEFAULT FALSE,
-            account_created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            face_data_path VARCHAR(255),
-            last_login TIMESTAMP
-        )
-    """
-    create_emotion_table = """
-    CREATE TABLE IF NOT EXISTS emotions (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    user_id INT NOT NULL,
-    emotion VARCHAR(50) NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
+    from utils.deletion_jobs import deletion_worker
+    from utils.emotion_labels import emotion_labels
+    from utils.face_index import face_index_sync, load_face_index
+    from utils.migrations import pending_migrations, run_migrations
+    from utils.read_replicas import read_router
+    from utils.retention import retention_scheduler
+    from utils.write_buffer import emotion_buffer
 
-    """
-    await database.execute(create_users_table)
-    await database.execute(create_emotion_table)
+    settings = get_settings()
+    database = get_database()
+    with _phase("connect"):
+        await database.connect()
+    with _phase("migrations"):
+        if settings.RUN_MIGRATIONS_ON_STARTUP:
+            await run_migrations()
+        else:
+            pending = await pending_migrations()
+            if pending:
+                await database.disconnect()
+                raise RuntimeError(f"Schema migrations {pending} are pending; run `python -m utils.migrations` "
+                                   f"or set RUN_MIGRATIONS_ON_STARTUP")
+    with _phase("replicas"):
+        await read_router.connect()
+    with _phase("labels"):
+        await emotion_labels.load()
+    with _phase("face_index"):
+        await load_face_index()
+    face_index_sync.start()
+
+    if settings.EMOTION_BUFFER_ENABLED:
+        await emotion_buffer.start()
+    if settings.RETENTION_ENABLED:
+        retention_scheduler.start()
+    deletion_worker.start()
+
+    startup_times["ready_seconds"] = time.perf_counter() - _import_started
+    logger.info("Ready %.3f s after import (%s)", startup_times["ready_seconds"],
+                ", ".join(f"{name} {seconds:.3f}" for name, seconds in startup_times.items()))
 
 
-@app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    from utils.deletion_jobs import deletion_worker
+    from utils.face_index import face_index_sync, save_face_index
+    from utils.password_hashing import password_hasher
+    from utils.read_replicas import read_router
+    from utils.request_metrics import request_profiler
+    from utils.retention import retention_scheduler
+    from utils.write_buffer import emotion_buffer
+
+    # Drain buffered emotions before the connection pool goes away
+    await retention_scheduler.stop()
+    await deletion_worker.stop()
+    await emotion_buffer.stop()
+    await face_index_sync.stop()
+    await save_face_index()
+    await read_router.disconnect()
+    await get_database().disconnect()
+    request_profiler.dump(get_settings().PROFILE_OUTPUT_DIR)
+    password_hasher.shutdown()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the application. Pass `settings` to run with something other than the environment;
+    it has to happen before any other module has read the settings.
+    """
+    if settings is not None:
+        configure(settings)
+
+    build_started = time.perf_counter()
+    from utils.auth import auth_cache_metrics, require_metrics_access
+    from utils.deletion_jobs import deletion_worker
+    from utils.emotion_labels import emotion_labels
+    from utils.event_hub import event_hub
+    from utils.face_index import face_index_sync
+    from utils.instrumented_database import PoolTimeout
+    from utils.metrics import registry
+    from utils.password_hashing import password_hasher
+    from utils.rate_limit import AdmissionControlMiddleware, rate_limiter
+    from utils.read_replicas import read_router
+    from utils.request_metrics import RequestMetricsMiddleware, request_profiler
+    from utils.response_cache import response_cache
+    from utils.retention import retention_scheduler
+    from utils.serialization import FastJSONResponse
+    from utils.storage import ContentHashedStaticFiles, FACE_DATA_DIR, FACE_DATA_URL_PREFIX
+    from utils.write_buffer import emotion_buffer
+
+    settings = get_settings()
+    database = get_database()
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+    # Innermost, so rejected requests still get CORS headers and show up in the request metrics
+    app.add_middleware(AdmissionControlMiddleware, limiter=rate_limiter)
+    # Set up CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Image-Hash", "X-Match-Threshold"],
+    )
+    app.add_middleware(
+        RequestMetricsMiddleware,
+        profile_routes=settings.PROFILE_ROUTES,
+        profile_sample_rate=settings.PROFILE_SAMPLE_RATE,
+        profiler=request_profiler if settings.PROFILE_ROUTES else None,
+    )
+    # Only the image directory is public; stored paths look like face_data/<hash>.png
+    app.mount(
+        f"/static/{FACE_DATA_URL_PREFIX}",
+        ContentHashedStaticFiles(directory=FACE_DATA_DIR, check_dir=False),
+        name="static",
+    )
+
+    for prefix, module_name, attribute in ROUTERS:
+        app.include_router(getattr(import_module(module_name), attribute), prefix=prefix)
+
+    # Components with their own counters show up as gauges on /metrics
+    registry.register_collector("db_pool", database.pool_metrics)
+    registry.register_collector("emotion_buffer", emotion_buffer.metrics)
+    registry.register_collector("emotion_labels", emotion_labels.metrics)
+    registry.register_collector("password_hashing", password_hasher.metrics)
+    registry.register_collector("auth", auth_cache_metrics)
+    registry.register_collector("response_cache", response_cache.metrics)
+    registry.register_collector("event_stream", event_hub.metrics)
+    registry.register_collector("face_index", face_index_sync.metrics)
+    registry.register_collector("retention", retention_scheduler.metrics)
+    registry.register_collector("deletion_jobs", deletion_worker.metrics)
+    registry.register_collector("read_replicas", read_router.metrics)
+    registry.register_collector("admission", rate_limiter.metrics)
+    registry.register_collector("startup", lambda: dict(startup_times))
+
+    @app.exception_handler(PoolTimeout)
+    async def pool_timeout_handler(request, exc):
+        return JSONResponse(status_code=503, content={"detail": "Database busy, try again later"})
+
+    @app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+    def get_metrics():
+        """
+        Prometheus scrape endpoint: query latency, pool wait and component counters.
+        """
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
+    @app.get("/url-list")
+    def get_all_urls(request: Request):
+        url_list = [{"path": route.path, "name": route.name} for route in request.app.routes]
+        return url_list
 
-# Using FastAPI instance
-@app.get("/url-list")
-def get_all_urls():
-    url_list = [{"path": route.path, "name": route.name} for route in app.routes]
-    return url_list
+    startup_times["import_seconds"] = build_started - _import_started
+    startup_times["create_app_seconds"] = time.perf_counter() - build_started
+    return app
 
 
-print("Database connection successful")
+def __getattr__(name):
+    # `uvicorn main:app` builds the default app on first access, not when main is imported
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
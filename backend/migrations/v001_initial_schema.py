@@ -0,0 +1,75 @@
+"""
+Baseline schema: the tables main.startup used to create inline, plus the rollup tables.
+Every statement is idempotent so databases created before versioning adopt it cleanly.
+"""
+VERSION = 1
+DESCRIPTION = "initial schema"
+
+CREATE_USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        email VARCHAR(100) NOT NULL UNIQUE,
+        name VARCHAR(100) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        isAdmin BOOLEAN NOT NULL DEFAULT FALSE,
+        account_created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        face_data_path VARCHAR(255),
+        last_login TIMESTAMP
+    )
+"""
+
+CREATE_EMOTIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS emotions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        emotion VARCHAR(50) NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        confidence FLOAT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+"""
+
+CREATE_ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS emotion_totals (
+        emotion VARCHAR(50) NOT NULL PRIMARY KEY,
+        count BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS emotion_user_totals (
+        user_id INT NOT NULL,
+        emotion VARCHAR(50) NOT NULL,
+        count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, emotion),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS emotion_rollups (
+        user_id INT NOT NULL,
+        granularity ENUM('hour', 'day') NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        emotion VARCHAR(50) NOT NULL,
+        count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, granularity, bucket_start, emotion),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+
+async def upgrade(database):
+    await database.execute(CREATE_USERS_TABLE)
+    await database.execute(CREATE_EMOTIONS_TABLE)
+
+    # Tables created before batch ingestion lack the confidence column
+    has_confidence = await database.fetch_val("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'emotions' AND column_name = 'confidence'
+    """)
+    if not has_confidence:
+        await database.execute("ALTER TABLE emotions ADD COLUMN confidence FLOAT NULL")
+
+    for statement in CREATE_ROLLUP_TABLES:
+        await database.execute(statement)
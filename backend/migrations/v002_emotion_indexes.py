@@ -0,0 +1,25 @@
+"""
+Composite indexes for the per-user emotion queries.
+
+(user_id, timestamp) serves history reads and the admin keyset walk; InnoDB appends the
+primary key, so it also covers the (user_id, timestamp, id) cursor order.
+(user_id, emotion) serves per-user grouping by label. Either index can back the user_id
+foreign key, so MySQL drops the implicit single-column FK index on its own.
+"""
+VERSION = 2
+DESCRIPTION = "emotions (user_id, timestamp) and (user_id, emotion) indexes"
+
+INDEXES = {
+    "idx_emotions_user_timestamp": "(user_id, timestamp)",
+    "idx_emotions_user_emotion": "(user_id, emotion)",
+}
+
+
+async def upgrade(database):
+    for name, columns in INDEXES.items():
+        exists = await database.fetch_val("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'emotions' AND index_name = :name
+        """, {"name": name})
+        if not exists:
+            await database.execute(f"CREATE INDEX {name} ON emotions {columns}")
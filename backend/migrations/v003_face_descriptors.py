@@ -0,0 +1,21 @@
+"""
+Per-user face descriptor cache: the 128-d float32 descriptor of the current profile image
+(512 bytes) and the content hash of the image it was computed from.
+"""
+VERSION = 3
+DESCRIPTION = "users face_descriptor and face_image_hash columns"
+
+COLUMNS = {
+    "face_descriptor": "VARBINARY(512) NULL",
+    "face_image_hash": "CHAR(64) NULL",
+}
+
+
+async def upgrade(database):
+    for name, definition in COLUMNS.items():
+        exists = await database.fetch_val("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'users' AND column_name = :name
+        """, {"name": name})
+        if not exists:
+            await database.execute(f"ALTER TABLE users ADD COLUMN {name} {definition}")
@@ -0,0 +1,17 @@
+"""
+Retention watermark: raw emotions before `watermark` have been archived and compacted into
+the daily rollups, so reads before it come from the rollups.
+"""
+VERSION = 4
+DESCRIPTION = "retention_state table"
+
+
+async def upgrade(database):
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS retention_state (
+            name VARCHAR(64) NOT NULL PRIMARY KEY,
+            watermark DATETIME NOT NULL,
+            rows_archived BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
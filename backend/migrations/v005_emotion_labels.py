@@ -0,0 +1,123 @@
+"""
+Dictionary-encode emotion labels.
+
+Labels move to an emotion_labels lookup table and `emotions` and the three rollup tables
+store a SMALLINT UNSIGNED emotion_id instead of the VARCHAR(50) label, which shrinks the
+rows, the (user_id, emotion) index and the rollup primary keys, and turns every GROUP BY
+emotion into an integer comparison.
+
+Each table is copied into a new table with the id column and swapped in with one RENAME.
+`emotions` is copied in primary-key ranges so no single statement runs for long, and a
+re-run after an interruption continues from the last copied id. Stop the writers while it
+runs: rows written to the old table after their range was copied are not carried over.
+"""
+from utils.emotion_labels import DEFAULT_LABELS
+
+VERSION = 5
+DESCRIPTION = "emotion_labels lookup table; emotion_id in emotions and rollups"
+
+COPY_BATCH_SIZE = 50000
+
+CREATE_LABELS_TABLE = """
+    CREATE TABLE IF NOT EXISTS emotion_labels (
+        id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        label VARCHAR(50) NOT NULL UNIQUE
+    )
+"""
+
+# New layouts, created as <table>_v5 and renamed over the old tables
+NEW_TABLES = {
+    "emotions": """
+        CREATE TABLE IF NOT EXISTS emotions_v5 (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            emotion_id SMALLINT UNSIGNED NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            confidence FLOAT NULL,
+            INDEX idx_emotions_user_timestamp (user_id, timestamp),
+            INDEX idx_emotions_user_emotion (user_id, emotion_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (emotion_id) REFERENCES emotion_labels(id)
+        )
+    """,
+    "emotion_totals": """
+        CREATE TABLE IF NOT EXISTS emotion_totals_v5 (
+            emotion_id SMALLINT UNSIGNED NOT NULL PRIMARY KEY,
+            count BIGINT NOT NULL DEFAULT 0,
+            FOREIGN KEY (emotion_id) REFERENCES emotion_labels(id)
+        )
+    """,
+    "emotion_user_totals": """
+        CREATE TABLE IF NOT EXISTS emotion_user_totals_v5 (
+            user_id INT NOT NULL,
+            emotion_id SMALLINT UNSIGNED NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, emotion_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (emotion_id) REFERENCES emotion_labels(id)
+        )
+    """,
+    "emotion_rollups": """
+        CREATE TABLE IF NOT EXISTS emotion_rollups_v5 (
+            user_id INT NOT NULL,
+            granularity ENUM('hour', 'day') NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            emotion_id SMALLINT UNSIGNED NOT NULL,
+            count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket_start, emotion_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (emotion_id) REFERENCES emotion_labels(id)
+        )
+    """,
+}
+
+COPY_COLUMNS = {
+    "emotions": ("id, user_id, emotion_id, timestamp, confidence", "t.id, t.user_id, l.id, t.timestamp, t.confidence"),
+    "emotion_totals": ("emotion_id, count", "l.id, t.count"),
+    "emotion_user_totals": ("user_id, emotion_id, count", "t.user_id, l.id, t.count"),
+    "emotion_rollups": ("user_id, granularity, bucket_start, emotion_id, count",
+                        "t.user_id, t.granularity, t.bucket_start, l.id, t.count"),
+}
+
+
+async def _is_converted(database, table: str) -> bool:
+    return bool(await database.fetch_val("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = :table AND column_name = 'emotion_id'
+    """, {"table": table}))
+
+
+async def _copy(database, table: str):
+    columns, select = COPY_COLUMNS[table]
+    query = f"""
+        INSERT INTO {table}_v5 ({columns})
+        SELECT {select} FROM {table} t JOIN emotion_labels l ON l.label = t.emotion
+    """
+    if table != "emotions":
+        await database.execute(f"DELETE FROM {table}_v5")
+        await database.execute(query)
+        return
+
+    after = await database.fetch_val("SELECT COALESCE(MAX(id), 0) FROM emotions_v5")
+    last = await database.fetch_val("SELECT COALESCE(MAX(id), 0) FROM emotions")
+    while after < last:
+        await database.execute(query + " WHERE t.id > :after AND t.id <= :upto",
+                               {"after": after, "upto": after + COPY_BATCH_SIZE})
+        after += COPY_BATCH_SIZE
+
+
+async def upgrade(database):
+    await database.execute(CREATE_LABELS_TABLE)
+    values = {f"label_{i}": label for i, label in enumerate(DEFAULT_LABELS)}
+    await database.execute(
+        f"INSERT IGNORE INTO emotion_labels (label) VALUES ({'), ('.join(':' + name for name in values)})", values
+    )
+
+    for table, create in NEW_TABLES.items():
+        if await _is_converted(database, table):
+            continue
+        await database.execute(f"INSERT IGNORE INTO emotion_labels (label) SELECT DISTINCT emotion FROM {table}")
+        await database.execute(create)
+        await _copy(database, table)
+        await database.execute(f"RENAME TABLE {table} TO {table}_v4, {table}_v5 TO {table}")
+        await database.execute(f"DROP TABLE {table}_v4")
@@ -0,0 +1,38 @@
+"""
+Queue for background account and record deletions (see utils.deletion_jobs).
+
+`deletion_jobs` has one row per request with its progress; the ids of a record deletion
+are listed in `deletion_job_items`. Neither references users, so a job outlives the
+account it deleted and its status can still be read afterwards.
+"""
+VERSION = 6
+DESCRIPTION = "deletion_jobs and deletion_job_items tables"
+
+
+async def upgrade(database):
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS deletion_jobs (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind ENUM('user', 'records') NOT NULL,
+            user_id INT NOT NULL,
+            status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+            rows_total BIGINT NOT NULL DEFAULT 0,
+            rows_deleted BIGINT NOT NULL DEFAULT 0,
+            cursor_id INT NOT NULL DEFAULT 0,
+            attempts INT NOT NULL DEFAULT 0,
+            error VARCHAR(255) NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP NULL,
+            INDEX idx_deletion_jobs_status (status, id),
+            INDEX idx_deletion_jobs_user (user_id, kind, status)
+        )
+    """)
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS deletion_job_items (
+            job_id BIGINT NOT NULL,
+            record_id INT NOT NULL,
+            PRIMARY KEY (job_id, record_id),
+            FOREIGN KEY (job_id) REFERENCES deletion_jobs(id) ON DELETE CASCADE
+        )
+    """)
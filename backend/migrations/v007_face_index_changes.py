@@ -0,0 +1,18 @@
+"""
+Change log for the in-memory face index: one row per user whose descriptor was stored,
+cleared or deleted. Each worker replays the rows after the last one it has applied, so
+workers stay in step with each other and a saved snapshot can be brought up to date.
+"""
+VERSION = 7
+DESCRIPTION = "face_index_changes table"
+
+
+async def upgrade(database):
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS face_index_changes (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_face_index_changes_created (created_at)
+        )
+    """)
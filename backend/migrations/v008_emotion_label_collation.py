@@ -0,0 +1,18 @@
+"""
+Case-sensitive emotion labels.
+
+emotion_labels.label had the server's default case-insensitive collation, so registering
+"Happy" after "happy" was swallowed by INSERT IGNORE and left the writer without an id for
+it. A binary collation keeps such labels distinct. Labels that still compare equal (the
+collation ignores trailing spaces) share the existing row's id; see EmotionLabels.ids.
+v005 had already merged case variants of the old label strings into one label each.
+"""
+VERSION = 8
+DESCRIPTION = "binary collation for emotion_labels.label"
+
+
+async def upgrade(database):
+    await database.execute("""
+        ALTER TABLE emotion_labels
+        MODIFY label VARCHAR(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL
+    """)
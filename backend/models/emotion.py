@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 from sqlalchemy import DateTime
 
@@ -8,3 +10,4 @@ class Emotion(BaseModel):
     user_id: int
     emotion: str
     timestamp: DateTime
+    confidence: Optional[float] = None
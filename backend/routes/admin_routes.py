@@ -1,105 +1,400 @@
-from fastapi import APIRouter, HTTPException, Header,Query
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.exc import SQLAlchemyError
-from config import database
-from utils.jwt_handler import decode_jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from config import database, settings
+from schemas.admin_schemas import FaceIdentifyRequest
+from utils.analytics import (
+    cohort_comparison, default_window, daily_distribution, fetch_cohorts, fetch_daily_columns, mood_series,
+    summarize_counts,
+)
+from utils.auth import require_admin, require_admin_query_token, auth_cache_metrics, verify_token
+from utils.date_utils import to_utc_naive
+from utils.emotion_labels import emotion_labels
+from utils.event_hub import DROPPED, SubscriberLimit, event_hub
+from utils.face_index import face_index
+from utils.pagination import encode_cursor, decode_cursor
+from utils.password_hashing import password_hasher
+from utils.read_replicas import read_router
+from utils.request_metrics import request_profiler
+from utils.response_cache import response_cache
+from utils.serialization import dumps
+from utils.write_buffer import emotion_buffer
 
 admin_router = APIRouter()
 
 
+EXPORT_BATCH_SIZE = 5000
+MAX_PAGE_SIZE = 10000
+
+EmotionRow = namedtuple("EmotionRow", "id user_id email emotion timestamp")
+
+
+async def _fetch_emotion_page(after: Optional[list], limit: int):
+    """
+    Fetch one keyset page of emotions ordered by (user_id, timestamp, id).
+    `after` is the (user_id, timestamp, id) of the last row already returned.
+    """
+    where = ""
+    values = {"limit": limit}
+    if after is not None:
+        where = """
+            WHERE emotions.user_id > :user_id
+               OR (emotions.user_id = :user_id AND emotions.timestamp > :timestamp)
+               OR (emotions.user_id = :user_id AND emotions.timestamp = :timestamp AND emotions.id > :id)
+        """
+        values.update({"user_id": after[0], "timestamp": after[1], "id": after[2]})
+
+    query = f"""
+        SELECT 
+            emotions.id,
+            emotions.user_id, 
+            users.email, 
+            emotions.emotion_id, 
+            emotions.timestamp 
+        FROM emotions
+        JOIN users ON emotions.user_id = users.id
+        {where}
+        ORDER BY emotions.user_id, emotions.timestamp, emotions.id
+        LIMIT :limit
+    """
+    rows = await read_router.database().fetch_all(query, values)
+    labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+    return [EmotionRow(row["id"], row["user_id"], row["email"], labels[row["emotion_id"]], row["timestamp"])
+            for row in rows]
+
+
+def _group_rows(rows, layout: str = "rows"):
+    """
+    Group consecutive rows (already ordered by user_id) into per-user entries. With
+    layout="columns" each user's emotions are {"emotion": [...], "timestamp": [...]}.
+    """
+    grouped_data = []
+    for row in rows:
+        if not grouped_data or grouped_data[-1]["user_id"] != row.user_id:
+            grouped_data.append({
+                "user_id": row.user_id,
+                "email": row.email,
+                "emotions": {"emotion": [], "timestamp": []} if layout == "columns" else []
+            })
+        emotions = grouped_data[-1]["emotions"]
+        if layout == "columns":
+            emotions["emotion"].append(row.emotion)
+            emotions["timestamp"].append(row.timestamp)
+        else:
+            emotions.append({
+                "emotion": row.emotion,
+                "timestamp": row.timestamp
+            })
+    return grouped_data
+
+
+def _extend_group(group: dict, more: dict):
+    if isinstance(group["emotions"], dict):
+        for field, values in more["emotions"].items():
+            group["emotions"][field].extend(values)
+    else:
+        group["emotions"].extend(more["emotions"])
+
+
+async def _iterate_emotion_pages():
+    """
+    Walk the whole emotions table page by page so only one batch is held in memory.
+    """
+    after = None
+    while True:
+        rows = await _fetch_emotion_page(after, EXPORT_BATCH_SIZE)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last = rows[-1]
+        after = [last.user_id, last.timestamp, last.id]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def _ndjson_export():
+    # One line per chunk of a user's emotions; a user spanning several pages yields several lines.
+    async for rows in _iterate_emotion_pages():
+        for group in _group_rows(rows):
+            yield dumps(group) + b"\n"
+
+
+async def _csv_export():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["user_id", "email", "emotion", "timestamp"])
+    async for rows in _iterate_emotion_pages():
+        for row in rows:
+            writer.writerow([row.user_id, row.email, row.emotion, _json_default(row.timestamp)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
 @admin_router.get("/get_all_emotion")
-async def get_emotion(authorization: str = Header(...)):
+async def get_emotion(
+        request: Request,
+        admin: dict = Depends(require_admin),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for keyset pagination"),
+        cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+        layout: str = Query("rows", pattern="^(rows|columns)$", description="Each user's emotions as objects or arrays"),
+):
     """
     API to get all user emotion data from the database, grouped by user_id.
+    When `limit` is given the result is paginated on (user_id, timestamp, id) and
+    `next_cursor` points at the following page. Responses are cached until the next
+    emotion write and carry an ETag for conditional requests. `layout=columns` and
+    Accept: application/msgpack give chart clients a more compact response.
+    """
+    after = decode_cursor(cursor, 3) if cursor else None
+
+    async def compute():
+        try:
+            if limit is None and cursor is None:
+                # Legacy unpaginated response, assembled page by page
+                grouped_data = []
+                async for rows in _iterate_emotion_pages():
+                    for group in _group_rows(rows, layout):
+                        if grouped_data and grouped_data[-1]["user_id"] == group["user_id"]:
+                            _extend_group(grouped_data[-1], group)
+                        else:
+                            grouped_data.append(group)
+                return {"data": grouped_data}
+
+            page_size = limit or EXPORT_BATCH_SIZE
+            rows = await _fetch_emotion_page(after, page_size)
+
+            next_cursor = None
+            if len(rows) == page_size:
+                last = rows[-1]
+                next_cursor = encode_cursor(last.user_id, last.timestamp, last.id)
+
+            return {"data": _group_rows(rows, layout), "next_cursor": next_cursor}
+
+        except SQLAlchemyError as e:
+            raise HTTPException(status_code=500, detail="Database error occurred") from e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch emotion data: {str(e)}")
+
+    return await response_cache.respond(request, "all_emotion", compute, read_router.cache_seconds)
+
+
+@admin_router.get("/export_emotion")
+async def export_emotion(
+        admin: dict = Depends(require_admin),
+        format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Export format: ndjson or csv"),
+):
+    """
+    API to stream every user's emotion data as NDJSON (grouped per user) or CSV.
+    Rows are read in keyset batches, so memory stays flat regardless of table size.
+    """
+    if format == "csv":
+        return StreamingResponse(
+            _csv_export(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=emotions.csv"},
+        )
+    return StreamingResponse(_ndjson_export(), media_type="application/x-ndjson")
+
+
+@admin_router.websocket("/ws/emotions")
+async def emotion_events_ws(websocket: WebSocket):
+    """
+    Live feed of new emotions and per-emotion count deltas.
+    Browsers can't set headers on a WebSocket, so the token comes as ?token=.
     """
     try:
-        # Extract and validate the token
-        if not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Invalid token format")
-        token = authorization.split(" ")[1]
-        user = decode_jwt(token)
-        if not user.get("role") or not user["role"]:
-            raise HTTPException(status_code=403, detail="Access forbidden: Admins only")
-
-        # Fetch data from the database
-        query = """
-            SELECT 
-                emotions.user_id, 
-                users.email, 
-                emotions.emotion, 
-                emotions.timestamp 
-            FROM emotions
-            JOIN users ON emotions.user_id = users.id
-            ORDER BY emotions.user_id, emotions.timestamp
-        """
-        rows = await database.fetch_all(query)
+        await require_admin(verify_token(websocket.query_params.get("token", "")))
+        subscription = event_hub.subscribe()
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    except SubscriberLimit:
+        await websocket.close(code=1013)
+        return
 
-        # Group data by user_id
-        grouped_data = {}
-        for row in rows:
-            user_id = row["user_id"]
-            if user_id not in grouped_data:
-                grouped_data[user_id] = {
-                    "user_id": user_id,
-                    "email": row["email"],
-                    "emotions": []
-                }
-            grouped_data[user_id]["emotions"].append({
-                "emotion": row["emotion"],
-                "timestamp": row["timestamp"]
-            })
+    await websocket.accept()
+    try:
+        while True:
+            message = await subscription.next(settings.EVENT_STREAM_HEARTBEAT_SECONDS)
+            await websocket.send_text(message)
+            if message is DROPPED:
+                await websocket.close(code=1013)
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
 
-        return {"data": list(grouped_data.values())}
 
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail="Database error occurred") from e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch emotion data: {str(e)}")
+@admin_router.get("/stream/emotions")
+async def emotion_events_sse(admin: dict = Depends(require_admin_query_token)):
+    """
+    The same live feed as /ws/emotions as Server-Sent Events, one JSON message per event.
+    """
+    if event_hub.full:
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+
+    async def stream():
+        try:
+            subscription = event_hub.subscribe()
+        except SubscriberLimit:
+            yield f"data: {DROPPED}\n\n"
+            return
+        try:
+            while True:
+                message = await subscription.next(settings.EVENT_STREAM_HEARTBEAT_SECONDS)
+                yield f"data: {message}\n\n"
+                if message is DROPPED:
+                    return
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @admin_router.get("/get_emotion_stats")
-async def get_emotion_stats():
+async def get_emotion_stats(request: Request, admin: dict = Depends(require_admin)):
     """
     API to get aggregated emotion statistics from the database.
     This includes total emotions, most common emotions, and mood analysis.
+    Responses are cached until the next emotion write and carry an ETag.
     """
     query = """
-        SELECT emotion, COUNT(*) AS count
-        FROM emotions
-        GROUP BY emotion
+        SELECT emotion_id, count
+        FROM emotion_totals
+        WHERE count > 0
         ORDER BY count DESC
     """
     params = {}
 
-    try:
-        rows = await database.fetch_all(query, params)
-
-        # Adding sentiment analysis if applicable
-        emotions = {row['emotion']: row['count'] for row in rows}
+    async def compute():
+        try:
+            rows = await read_router.database().fetch_all(query, params)
+            labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+            stats = [{"emotion": labels[row["emotion_id"]], "count": row["count"]} for row in rows]
+            summary = summarize_counts({row['emotion']: row['count'] for row in stats})
+            return {"emotion_stats": stats, **summary}
+        except SQLAlchemyError as e:
+            raise HTTPException(status_code=500, detail="Database error occurred") from e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch emotion stats: {str(e)}")
 
-        # Calculate most frequent emotion (for example: dominant emotion)
-        dominant_emotion = max(emotions, key=emotions.get, default=None)
+    return await response_cache.respond(request, "emotion_stats", compute, read_router.cache_seconds)
 
-        # Calculate mood balance (positive vs negative emotions, if applicable)
-        positive_emotions = ['happy', 'joyful', 'excited']  # Example positive emotions
-        negative_emotions = ['sad', 'angry', 'anxious']  # Example negative emotions
-
-        positive_count = sum(emotions.get(emotion, 0) for emotion in positive_emotions)
-        negative_count = sum(emotions.get(emotion, 0) for emotion in negative_emotions)
-
-        mood_balance = "Neutral"
-        if positive_count > negative_count:
-            mood_balance = "Positive"
-        elif negative_count > positive_count:
-            mood_balance = "Negative"
 
+@admin_router.get("/get_mood_trends")
+async def get_mood_trends(
+        start: Optional[datetime] = Query(None, alias="from", description="Start of the window (default: 90 days ago)"),
+        end: Optional[datetime] = Query(None, alias="to", description="End of the window (default: now)"),
+        window: int = Query(7, ge=1, le=90, description="Rolling mood window in days"),
+        admin: dict = Depends(require_admin),
+):
+    """
+    API to get mood trends across all users plus a comparison of signup-month cohorts.
+    """
+    start, end = default_window(to_utc_naive(start), to_utc_naive(end))
+    try:
+        columns = await fetch_daily_columns(None, start, end)
+        user_ids, user_cohorts = await fetch_cohorts()
         return {
-            "emotion_stats": rows,
-            "dominant_emotion": dominant_emotion,
-            "mood_balance": mood_balance,
-            "positive_count": positive_count,
-            "negative_count": negative_count
+            "distribution": daily_distribution(columns),
+            "mood": mood_series(columns, window),
+            "cohorts": cohort_comparison(columns, user_ids, user_cohorts),
         }
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail="Database error occurred") from e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch emotion stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch mood trends: {str(e)}")
+
+
+@admin_router.get("/ingest_metrics")
+async def get_ingest_metrics(admin: dict = Depends(require_admin)):
+    """
+    API to inspect the emotion write-behind buffer: queue depth, flush counts and latency.
+    """
+    return emotion_buffer.metrics()
+
+
+@admin_router.get("/auth_metrics")
+async def get_auth_metrics(admin: dict = Depends(require_admin)):
+    """
+    API to inspect the password hashing pool and the token/user caches.
+    """
+    return {"password_hashing": password_hasher.metrics(), **auth_cache_metrics()}
+
+
+@admin_router.get("/cache_metrics")
+async def get_cache_metrics(admin: dict = Depends(require_admin)):
+    """
+    API to inspect the admin response cache: backend, hit ratio and 304s served.
+    """
+    return response_cache.metrics()
+
+
+@admin_router.get("/stream_metrics")
+async def get_stream_metrics(admin: dict = Depends(require_admin)):
+    """
+    API to inspect the live emotion stream: subscribers, fan-out and dropped slow consumers.
+    """
+    return event_hub.metrics()
+
+
+@admin_router.get("/profile", response_class=PlainTextResponse)
+async def get_profile(
+        admin: dict = Depends(require_admin),
+        route: Optional[str] = Query(None, description="Route path template, e.g. /auth/login (default: all)"),
+):
+    """
+    API to download sampled request stacks in folded format for flamegraph.pl or speedscope.
+    Profiling is enabled with PROFILE_ROUTES.
+    """
+    return PlainTextResponse(request_profiler.folded(route))
+
+
+@admin_router.post("/identify_face")
+async def identify_face(request: FaceIdentifyRequest, admin: dict = Depends(require_admin)):
+    """
+    API to identify a face among all users by its 128-d descriptor.
+    Returns the k closest users with their distance and whether it is within the match threshold.
+    """
+    matches = await run_in_threadpool(face_index.search, request.descriptor, request.k)
+    if not matches:
+        return {"matches": []}
+
+    values = {f"id_{i}": user_id for i, (user_id, _) in enumerate(matches)}
+    rows = await database.fetch_all(
+        f"SELECT id, email FROM users WHERE id IN ({', '.join(':' + name for name in values)})", values
+    )
+    emails = {row["id"]: row["email"] for row in rows}
+    return {
+        "matches": [
+            {
+                "user_id": user_id,
+                "email": emails.get(user_id),
+                "distance": distance,
+                "match": distance <= settings.FACE_MATCH_THRESHOLD,
+            }
+            for user_id, distance in matches
+        ]
+    }
@@ -1,42 +1,39 @@
+import logging
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from schemas.auth_schemas import RegisterRequest, FaceDataRequest, TokenResponse, LoginRequest
+from utils.auth import get_token_claims
 from utils.jwt_handler import create_jwt
-import os
-import base64
-from config import database, settings
-from passlib.context import CryptContext
+from config import database
+from utils.password_hashing import password_hasher, PasswordPoolBusy
+from utils.rate_limit import rate_limiter
+from utils.face_index import index_user_descriptor
+from utils.storage import save_base64
+
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 auth_router = APIRouter()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-SECRET_KEY = settings.SECRET_KEY
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid token",
-            )
-        return email
-    except JWTError:
+async def get_current_user(claims: dict = Depends(get_token_claims)):
+    email: str = claims.get("sub")
+    if email is None:
         raise HTTPException(
             status_code=401,
             detail="Invalid token",
         )
+    return email
 
 
 # User Registration (Save user details to the database)
 @auth_router.post("/register")
 async def register(user_data: RegisterRequest):
-    hashed_password = pwd_context.hash(user_data.password)
+    await rate_limiter.limit_user("/auth/register", user_data.email.lower())
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     user_data.password = hashed_password  # password hashed version
 
     query = """
@@ -50,31 +47,26 @@ async def register(user_data: RegisterRequest):
         if "1062" in str(e):  # MySQL error code 1062 indicates a duplicate entry
             raise HTTPException(status_code=400, detail="Email already registered")
         else:
-            print(f"Error occurred: {e}")  # For debugging
+            logger.exception("Failed to register %s", user_data.email)
             raise HTTPException(status_code=500, detail=f"Internal Server Error {e}")
 
 
 @auth_router.post("/register/face-data", response_model=TokenResponse)
-async def register_face_data(face_data: FaceDataRequest):
+async def register_face_data(face_data: FaceDataRequest, background_tasks: BackgroundTasks):
     email = face_data.email
     face_data_encoded = face_data.face_data
 
-    face_dir = "face_data/"
-    os.makedirs(face_dir, exist_ok=True)
-    file_name = email.split('@')[0]  # Adjust to handle email properly
-
-    face_path = os.path.join(face_dir, f"{file_name}.png")
-
     try:
-        # Decode and save the base64 image
-        with open(face_path, "wb") as image_file:
-            image_file.write(base64.b64decode(face_data_encoded))
+        # Decode and store the base64 image under its content hash
+        stored = await save_base64(face_data_encoded)
 
-        # Update user with face data path
+        # Update user with face data path; the descriptor is recomputed for the new image
         update_query = """
-            UPDATE users SET face_data_path = :face_path WHERE email = :email
+            UPDATE users
+            SET face_data_path = :face_path, face_image_hash = :hash, face_descriptor = NULL
+            WHERE email = :email
         """
-        await database.execute(update_query, {"face_path": face_path, "email": email})
+        await database.execute(update_query, {"face_path": stored.path, "hash": stored.content_hash, "email": email})
 
         # Fetch user details
         query = "SELECT id, email, isAdmin FROM users WHERE email = :email"
@@ -82,6 +74,8 @@ async def register_face_data(face_data: FaceDataRequest):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
+        background_tasks.add_task(index_user_descriptor, user["id"], stored.path, stored.content_hash)
+
         # Generate JWT token
         payload = {
             "sub": user["email"],
@@ -93,9 +87,10 @@ async def register_face_data(face_data: FaceDataRequest):
 
         return {"token": token}
 
-    except Exception as e:
-        # Enhanced error logging
-        print(f"Error occurred: {repr(e)}")
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Failed to store face data for %s", email)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
@@ -103,17 +98,29 @@ async def register_face_data(face_data: FaceDataRequest):
 async def login(user_data: LoginRequest):
     email = user_data.email
     password = user_data.password
+    await rate_limiter.limit_user("/auth/login", email.lower())
 
     # Fetch user details
     query = "SELECT id, email, isAdmin, password FROM users WHERE email = :email"
     user = await database.fetch_one(query, {"email": email})
 
-    if not user or not pwd_context.verify(password, user["password"]):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(password, user["password"])
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    # Update last login
-    update_query = "UPDATE users SET last_login = :date WHERE email = :email"
-    await database.execute(update_query, {"date": datetime.utcnow().isoformat(), "email": email})
+    # Update last login, replacing the hash if BCRYPT_ROUNDS changed since it was made
+    if new_hash:
+        update_query = "UPDATE users SET last_login = :date, password = :password WHERE email = :email"
+        await database.execute(update_query, {"date": datetime.utcnow().isoformat(), "password": new_hash,
+                                              "email": email})
+    else:
+        update_query = "UPDATE users SET last_login = :date WHERE email = :email"
+        await database.execute(update_query, {"date": datetime.utcnow().isoformat(), "email": email})
 
     # Generate JWT token with additional claims
     payload = {"sub": user["email"], "role": bool(user["isAdmin"]), "id": user["id"], "iat": datetime.utcnow()}
@@ -1,17 +1,46 @@
-import os
+import logging
+from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Form, HTTPException, Query, Header, UploadFile, File
-from pydantic import EmailStr
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, Header, HTTPException, Query, Request, UploadFile, File
+from pydantic import EmailStr, ValidationError
 from sqlalchemy.exc import SQLAlchemyError
-from starlette.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, FileResponse, Response
+
+from config import database, settings
+from schemas.user_schemas import (
+    EmotionRequest, EmotionRecord, EmotionBatchRequest, RecordDeletionRequest, UpdateProfileResponse,
+)
+
+from utils.analytics import (
+    default_window, daily_distribution, fetch_daily_columns, fetch_transition_matrix, label_totals, mood_series,
+    streaks, summarize_counts,
+)
+from utils.auth import get_token_claims, get_current_user_record, invalidate_user
+from utils.date_utils import to_utc_naive
+from utils.deletion_jobs import enqueue_record_deletion, enqueue_user_deletion, get_job
+from utils.emotion_labels import emotion_labels
+from utils.emotion_history import fetch_raw_history, fetch_bucketed_history, fetch_daily_summaries, shape_rows
+from utils.emotion_writer import write_emotions
+from utils.face_index import face_index, index_user_descriptor
+from utils.rate_limit import rate_limiter
+from utils.read_replicas import read_router
+from utils.response_cache import response_cache
+from utils.serialization import render
+from utils.retention import cached_watermark
+from utils.storage import save_upload, thumbnail_for
+from utils.write_buffer import emotion_buffer, BufferFull, BufferStopped
+
+logger = logging.getLogger(__name__)
 
-from config import database
-from schemas.user_schemas import EmotionRequest, UpdateProfileResponse
+user_router = APIRouter()
 
-from utils.jwt_handler import decode_jwt
+# Client clocks may run slightly ahead of the server
+MAX_CLOCK_SKEW = timedelta(minutes=5)
 
-user_router = APIRouter()
+DEFAULT_HISTORY_PAGE = 500
+MAX_HISTORY_PAGE = 5000
 
 
 @user_router.post("/add_emotion")
@@ -19,14 +48,19 @@ async def add_emotion(useremotion: EmotionRequest):
     """
     API to add a user's emotion data to the database.
     """
-    print(useremotion.userId, useremotion.emotion)
+    await rate_limiter.limit_user("/user/add_emotion", useremotion.userId)
+    row = {"user_id": useremotion.userId, "emotion": useremotion.emotion, "timestamp": datetime.utcnow()}
+    if emotion_buffer.running:
+        try:
+            await emotion_buffer.enqueue(row)
+            return {"message": "Emotion data added successfully"}
+        except BufferFull:
+            raise HTTPException(status_code=429, detail="Too many emotions queued, retry shortly")
+        except BufferStopped:
+            pass  # Shutting down; write it directly
 
-    query = """
-        INSERT INTO emotions (user_id, emotion)
-        VALUES (:user_id, :emotion)
-    """
     try:
-        await database.execute(query, {"user_id": useremotion.userId, "emotion": useremotion.emotion})
+        await write_emotions([row])
         return {"message": "Emotion data added successfully"}
 
     except SQLAlchemyError as e:
@@ -35,164 +69,241 @@ async def add_emotion(useremotion: EmotionRequest):
         raise HTTPException(status_code=500, detail=f"Failed to add emotion: {str(e)}")
 
 
-@user_router.get("/get_emotion")
-async def get_emotion(user_id: str = Query(..., description="The ID of the user to fetch emotion data for")):
+@user_router.post("/add_emotions")
+async def add_emotions(batch: EmotionBatchRequest):
     """
-    API to get a user's emotion data from the database.
+    API to add a batch of emotion records for one user in a single transaction.
+    Invalid records are reported per index and skipped; valid ones are still stored.
     """
+    await rate_limiter.limit_user("/user/add_emotions", batch.userId)
+    now = datetime.utcnow()
+    rows = []
+    results = []
+    for index, item in enumerate(batch.emotions):
+        try:
+            record = EmotionRecord.model_validate(item)
+        except ValidationError as e:
+            results.append({
+                "index": index,
+                "status": "error",
+                "errors": [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()],
+            })
+            continue
+
+        timestamp = to_utc_naive(record.timestamp) or now
+        if timestamp > now + MAX_CLOCK_SKEW:
+            results.append({"index": index, "status": "error", "errors": ["timestamp: in the future"]})
+            continue
+
+        rows.append({
+            "user_id": batch.userId,
+            "emotion": record.emotion,
+            "timestamp": timestamp,
+            "confidence": record.confidence,
+        })
+        results.append({"index": index, "status": "ok"})
 
-    query = """
-        SELECT ROW_NUMBER() OVER (ORDER BY timestamp ASC) AS id, emotion, timestamp FROM emotions WHERE user_id = :user_id
+    try:
+        inserted = await write_emotions(rows)
+        return {"inserted": inserted, "rejected": len(results) - inserted, "results": results}
+
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail="Database error occurred") from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to add emotions: {str(e)}")
+
+
+@user_router.get("/get_emotion")
+async def get_emotion(
+        request: Request,
+        user_id: int = Query(..., description="The ID of the user to fetch emotion data for"),
+        start: Optional[datetime] = Query(None, alias="from", description="Only include emotions at or after this time"),
+        end: Optional[datetime] = Query(None, alias="to", description="Only include emotions before this time"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE, description="Maximum rows or buckets to return"),
+        cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+        resolution: str = Query("raw", pattern="^(raw|hourly|daily)$", description="raw rows or hourly/daily buckets"),
+        order: str = Query("asc", pattern="^(asc|desc)$", description="Sort by time ascending or descending"),
+        layout: str = Query("rows", pattern="^(rows|columns)$", description="Raw rows as objects or as one array per field"),
+):
+    """
+    API to get a user's emotion data from the database.
+    Without any window parameters the full history is returned as before; with from/to/limit
+    the response is a single page plus `next_cursor`. `resolution=hourly|daily` returns
+    buckets with counts per emotion instead of raw rows. `layout=columns` and
+    Accept: application/msgpack give chart clients a more compact response.
     """
+    windowed = any(value is not None for value in (start, end, limit, cursor)) or resolution != "raw"
+    db = read_router.database(user_id)
     try:
-        rows = await database.fetch_all(query, {"user_id": user_id})
-        return {"emotion": rows}
+        # Raw rows before the watermark were archived; that part of the history comes from daily summaries
+        watermark = await cached_watermark() if resolution == "raw" else None
+        if not windowed:
+            query = """
+                SELECT ROW_NUMBER() OVER (ORDER BY timestamp ASC) AS id, emotion_id, timestamp FROM emotions WHERE user_id = :user_id
+            """
+            values = {"user_id": user_id}
+            if watermark is not None:
+                query += " AND timestamp >= :watermark"
+                values["watermark"] = watermark
+            rows = await db.fetch_all(query, values)
+            labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+            rows = shape_rows([(row["id"], labels[row["emotion_id"]], row["timestamp"]) for row in rows],
+                              ("id", "emotion", "timestamp"), layout)
+            if watermark is None:
+                return render(request, {"emotion": rows})
+            summaries = await fetch_daily_summaries(user_id, None, None, watermark, db=db)
+            return render(request, {"emotion": rows, "compacted_before": watermark, "daily_summaries": summaries})
+
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        descending = order == "desc"
+        if resolution == "raw":
+            raw_start = start if watermark is None or (start is not None and start >= watermark) else watermark
+            rows, next_cursor = await fetch_raw_history(
+                user_id, raw_start, end, limit or DEFAULT_HISTORY_PAGE, cursor, descending, db, layout
+            )
+            if watermark is None:
+                return render(request, {"emotion": rows, "next_cursor": next_cursor})
+            # Summaries go with the first page only
+            summaries = [] if cursor else await fetch_daily_summaries(user_id, start, end, watermark,
+                                                                      descending, db)
+            return render(request, {"emotion": rows, "next_cursor": next_cursor, "compacted_before": watermark,
+                                    "daily_summaries": summaries})
+
+        buckets, next_cursor = await fetch_bucketed_history(
+            user_id, resolution, start, end, limit or DEFAULT_HISTORY_PAGE, cursor, descending, db
+        )
+        return render(request, {"resolution": resolution, "buckets": buckets, "next_cursor": next_cursor})
 
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail="Database error occurred") from e
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch emotion: {str(e)}")
 
 
 @user_router.get("/get_emotion_stats")
 async def get_emotion_stats(
-        user_id: str = Query(None, description="The ID of the user to fetch aggregated emotion data for"),
+        user_id: int = Query(..., description="The ID of the user to fetch aggregated emotion data for"),
 ):
     """
     API to get aggregated emotion statistics from the database within a date range.
     """
     query = """
-            SELECT emotion, COUNT(*) AS count
-            FROM emotions
-            WHERE user_id = :user_id
-            GROUP BY emotion
+            SELECT emotion_id, count
+            FROM emotion_user_totals
+            WHERE user_id = :user_id AND count > 0
             ORDER BY count DESC
         """
     try:
-        rows = await database.fetch_all(query, {"user_id": user_id})
-
-        # Adding sentiment analysis if applicable
-        emotions = {row['emotion']: row['count'] for row in rows}
-
-        # Calculate most frequent emotion (for example: dominant emotion)
-        dominant_emotion = max(emotions, key=emotions.get, default=None)
-
-        # Calculate mood balance (positive vs negative emotions, if applicable)
-        positive_emotions = ['happy', 'joyful', 'excited']  # Example positive emotions
-        negative_emotions = ['sad', 'angry', 'anxious']  # Example negative emotions
-
-        positive_count = sum(emotions.get(emotion, 0) for emotion in positive_emotions)
-        negative_count = sum(emotions.get(emotion, 0) for emotion in negative_emotions)
-
-        mood_balance = "Neutral"
-        if positive_count > negative_count:
-            mood_balance = "Positive"
-        elif negative_count > positive_count:
-            mood_balance = "Negative"
-
-        return {
-            "emotion_stats": rows,
-            "dominant_emotion": dominant_emotion,
-            "mood_balance": mood_balance,
-            "positive_count": positive_count,
-            "negative_count": negative_count
-        }
+        rows = await read_router.database(user_id).fetch_all(query, {"user_id": user_id})
+        labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+        rows = [{"emotion": labels[row["emotion_id"]], "count": row["count"]} for row in rows]
+        summary = summarize_counts({row['emotion']: row['count'] for row in rows})
+        return {"emotion_stats": rows, **summary}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail="Database error occurred") from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch emotion stats: {str(e)}")
     
 
-@user_router.get("/get_user_profile")
-async def get_user_profile(authorization: str = Header(..., description="Authorization token")):
+@user_router.get("/get_mood_trends")
+async def get_mood_trends(
+        user_id: int = Query(..., description="The ID of the user to analyse"),
+        start: Optional[datetime] = Query(None, alias="from", description="Start of the window (default: 90 days ago)"),
+        end: Optional[datetime] = Query(None, alias="to", description="End of the window (default: now)"),
+        window: int = Query(7, ge=1, le=90, description="Rolling mood window in days"),
+):
     """
-    API to get profile picture from the database.
+    API to get a user's mood trends: daily emotion distribution, daily and rolling mood
+    scores, streaks and the emotion transition matrix.
     """
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-        # Extract token from header
-    token = authorization.split(" ")[1]
-
-    # Decode token to get email
-    user = decode_jwt(token)
-
-    # Query to fetch user details by email
-    query = """
-            SELECT face_data_path
-            FROM users
-            WHERE email = :email
-        """
+    start, end = default_window(to_utc_naive(start), to_utc_naive(end))
     try:
-        result = dict(await database.fetch_one(query, {"email": user.get("sub")}))
-        if not result:
-            raise HTTPException(status_code=404, detail="User not found")
-        return f"http://127.0.0.1:8000/static/{result["face_data_path"]}"
+        columns = await fetch_daily_columns(user_id, start, end)
+        return {
+            "summary": summarize_counts(label_totals(columns)),
+            "distribution": daily_distribution(columns),
+            "mood": mood_series(columns, window),
+            "streaks": streaks(columns),
+            "transitions": await fetch_transition_matrix(user_id, start, end),
+        }
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail="Database error occurred") from e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch user profile picture: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch mood trends: {str(e)}")
 
-@user_router.get("/get_user_details")
-async def get_user_details(authorization: str = Header(..., description="Authorization token")):
+
+@user_router.get("/get_user_profile")
+async def get_user_profile(user: dict = Depends(get_current_user_record)):
     """
-    API to get user details from the database.
+    API to get profile picture from the database.
     """
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-        # Extract token from header
-    token = authorization.split(" ")[1]
+    return f"http://127.0.0.1:8000/static/{user['face_data_path']}"
 
-    # Decode token to get email
-    user = decode_jwt(token)
 
-    # Query to fetch user details by email
+@user_router.get("/get_user_details")
+async def get_user_details(user: dict = Depends(get_current_user_record)):
+    """
+    API to get user details from the database.
+    """
+    user.pop("isAdmin", None)
+    file_path = user["face_data_path"]
+    public_url = f"http://127.0.0.1:8000/static/{file_path}"
+    user["face_data_path"] = public_url
+    thumbnail = thumbnail_for(file_path)
+    user["thumbnail_path"] = f"http://127.0.0.1:8000/static/{thumbnail}" if thumbnail else None
+    return {"user_details": user}
+
+
+@user_router.get("/get_face_descriptor")
+async def get_face_descriptor(
+        claims: dict = Depends(get_token_claims),
+        if_none_match: Optional[str] = Header(None),
+):
+    """
+    API to get the precomputed 128-d face descriptor of the user's profile image as
+    512 bytes of little-endian float32. The ETag is the image's content hash, and
+    X-Match-Threshold the distance to match it at, which differs from the browser's own.
+    Returns 404 while no descriptor is available or FACE_SERVER_DESCRIPTOR_THRESHOLD is unset,
+    so clients fall back to the image.
+    """
+    threshold = settings.FACE_SERVER_DESCRIPTOR_THRESHOLD
+    if threshold is None:
+        raise HTTPException(status_code=404, detail="Face descriptor not available")
     query = """
-            SELECT id, name, email, face_data_path
+            SELECT face_descriptor, face_image_hash
             FROM users
-            WHERE email = :email
+            WHERE id = :user_id
         """
     try:
-        result = await database.fetch_one(query, {"email": user.get("sub")})
-        if not result:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        user = dict(result)
-        file_path = user["face_data_path"]
-        public_url = f"http://127.0.0.1:8000/static/{file_path}"
-        user["face_data_path"] = public_url
-        return {"user_details": user}
-
+        result = await database.fetch_one(query, {"user_id": claims.get("id")})
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail="Database error occurred") from e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch user details: {str(e)}")
+    if not result or result["face_descriptor"] is None:
+        raise HTTPException(status_code=404, detail="Face descriptor not available")
+
+    etag = f'"{result["face_image_hash"]}"'
+    headers = {"ETag": etag, "X-Image-Hash": result["face_image_hash"], "X-Match-Threshold": str(threshold),
+               "Cache-Control": "private, no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=bytes(result["face_descriptor"]), media_type="application/octet-stream", headers=headers)
+
 
 @user_router.post("/update_profile", response_model=UpdateProfileResponse)
 async def update_profile(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     email: str = Form(...),
     profilePic: Optional[UploadFile] = File(None),
-    authorization: str = Header(..., description="Authorization token")
+    user_data: dict = Depends(get_token_claims)
 ):
     """
     API to update user profile details (name, email, profile picture).
     :return: Updated user details
     """
 
-    # Check if the authorization header contains Bearer token
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    # Extract token from the authorization header
-    token = authorization.split(" ")[1]
-
-    # Decode JWT token to extract user information (e.g., email)
-    user_data = decode_jwt(token)
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
     try:
         # Update name and email in the database if provided
         if name or email:
@@ -204,28 +315,27 @@ async def update_profile(
             """
             try:
                 await database.execute(update_query, {"name": name, "email": email, "user_id": user_data["id"]})
-            except Exception as e:
-                print(f"Database update failed: {e}")
+            except Exception:
+                logger.exception("Profile update failed for user %s", user_data["id"])
                 raise HTTPException(status_code=500, detail="Database update failed")
         if profilePic:
-            face_dir = "face_data/"
-            os.makedirs(face_dir, exist_ok=True)
-            file_name = email.split('@')[0]  # Use email as part of filename
-    
-            face_path = os.path.join(face_dir, f"{file_name}.png")
-    
-            # Decode and save the base64 image
-            with open(face_path, "wb") as image_file:
-                image_file.write(await profilePic.read())
-    
-            # Update the face data path in the database
+            # Stream the upload to disk under its content hash
+            stored = await save_upload(profilePic)
+
+            # Update the face data path in the database; the descriptor is recomputed for the new image
             update_query_face = """
                 UPDATE users
-                SET face_data_path = :face_path
+                SET face_data_path = :face_path, face_image_hash = :hash, face_descriptor = NULL
                 WHERE email = :email
             """
-            await database.execute(update_query_face, {"face_path": face_path, "email": email})
-
+            await database.execute(update_query_face, {"face_path": stored.path, "hash": stored.content_hash,
+                                                       "email": email})
+            background_tasks.add_task(index_user_descriptor, user_data["id"], stored.path, stored.content_hash)
+
+        invalidate_user(user_data["id"])
+        if email:
+            # Admin listings include the email
+            await response_cache.invalidate()
         return JSONResponse(
             status_code=200,
             content={
@@ -233,44 +343,107 @@ async def update_profile(
             },
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(e)
+        logger.exception("Failed to update profile for user %s", user_data["id"])
         raise HTTPException(status_code=500, detail=f"Failed to update profile: {str(e)}")
 
-@user_router.delete("/delete")
-async def delete_account(email: EmailStr):
+async def _own_user_id(email: str, claims: dict) -> int:
+    """
+    Id of the user with `email`, which must be the token's user.
     """
-    Deletes a user account based on the provided email.
+    user_id = await database.fetch_val("SELECT id FROM users WHERE email = :email", {"email": email})
+    if user_id is None or user_id != claims.get("id"):
+        raise HTTPException(status_code=403, detail="Access forbidden: not your account")
+    return user_id
+
+
+@user_router.delete("/delete", status_code=202)
+async def delete_account(email: EmailStr, claims: dict = Depends(get_token_claims)):
+    """
+    Queues the deletion of the caller's account and all its data.
+
+    Emotions are removed in small batches in the background (see utils.deletion_jobs), then
+    the account itself and its profile image. Poll /user/deletion_status with the returned
+    job id for progress.
 
     Args:
         email (str): The email address of the user to be deleted.
 
     Returns:
-        dict: A message confirming the deletion or an error message.
+        dict: The deletion job id and a confirmation message.
     """
-    # Check if the user exists
-    query = "SELECT * FROM users WHERE email = :email"
-    user = await database.fetch_one(query=query, values={"email": email})
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        user_id = await _own_user_id(email, claims)
+        job_id = await enqueue_user_deletion(user_id)
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail="Database error occurred") from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue account deletion: {str(e)}")
+    # Stop face login matching the account right away
+    await run_in_threadpool(face_index.remove, user_id)
 
-    # Delete the user
-    delete_query = "DELETE FROM users WHERE email = :email"
-    await database.execute(query=delete_query, values={"email": email})
+    return {
+        "message": f"Deletion of the account associated with {email} has been queued.",
+        "job_id": job_id,
+    }
 
-    return {"message": f"Account associated with {email} has been deleted successfully."}
 
-# TODO implement Remove record API
-@user_router.delete("/remove")
-async def delete_record(email: EmailStr, id):
+@user_router.delete("/remove", status_code=202)
+async def delete_record(request: RecordDeletionRequest, claims: dict = Depends(get_token_claims)):
     """
-    Deletes a user record based on the provided email.
+    Queues the deletion of a batch of the caller's emotion records.
 
     Args:
-        email (str): The email address of the user to be deleted.
+        request (RecordDeletionRequest): The user's email and the ids of the records to delete.
 
     Returns:
-        dict: A message confirming the deletion or an error message.
+        dict: The deletion job id and a confirmation message.
+    """
+    if len(request.ids) > settings.DELETION_MAX_RECORDS:
+        raise HTTPException(status_code=422,
+                            detail=f"At most {settings.DELETION_MAX_RECORDS} records can be deleted per request")
+    try:
+        user_id = await _own_user_id(request.email, claims)
+        job_id = await enqueue_record_deletion(user_id, request.ids)
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail="Database error occurred") from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue record deletion: {str(e)}")
+
+    return {"message": f"Deletion of {len(set(request.ids))} records has been queued.", "job_id": job_id}
+
+
+@user_router.get("/deletion_status")
+async def get_deletion_status(
+        job_id: int = Query(..., description="Job id returned by /user/delete or /user/remove"),
+        claims: dict = Depends(get_token_claims),
+):
     """
-    return {"message": f"Account associated with {email} has been deleted successfully."}
\ No newline at end of file
+    Progress of one of the caller's account or record deletion jobs.
+    """
+    try:
+        job = await get_job(job_id)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail="Database error occurred") from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch deletion status: {str(e)}")
+    if job is None or job["user_id"] != claims.get("id"):
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "rows_total": job["rows_total"],
+        "rows_deleted": job["rows_deleted"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "finished_at": job["finished_at"],
+    }
@@ -0,0 +1,8 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class FaceIdentifyRequest(BaseModel):
+    descriptor: List[float] = Field(..., min_length=128, max_length=128)
+    k: int = Field(1, ge=1, le=20)
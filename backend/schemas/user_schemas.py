@@ -1,9 +1,47 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, EmailStr, Field, field_validator
+
+from config import get_settings
+
+MAX_EMOTION_BATCH = 1000
+MAX_EMOTION_LENGTH = 50  # emotion_labels.label is VARCHAR(50)
+
+
+def _known_emotion(emotion: str) -> str:
+    labels = get_settings().EMOTION_LABELS
+    if emotion not in labels:
+        raise ValueError(f"unknown emotion, expected one of: {', '.join(labels)}")
+    return emotion
 
 
 class EmotionRequest(BaseModel):
-    emotion: str
+    emotion: str = Field(..., min_length=1, max_length=MAX_EMOTION_LENGTH)
     userId: int
 
+    _check_emotion = field_validator("emotion")(_known_emotion)
+
+
+class EmotionRecord(BaseModel):
+    emotion: str = Field(..., min_length=1, max_length=MAX_EMOTION_LENGTH)
+    timestamp: Optional[datetime] = None
+    confidence: Optional[float] = Field(None, ge=0, le=1)
+
+    _check_emotion = field_validator("emotion")(_known_emotion)
+
+
+class EmotionBatchRequest(BaseModel):
+    userId: int
+    # Items are validated one by one in the handler so a bad record doesn't reject the batch
+    emotions: List[Any] = Field(..., min_length=1, max_length=MAX_EMOTION_BATCH)
+
+
 class UpdateProfileResponse(BaseModel):
-    message: str
\ No newline at end of file
+    message: str
+
+
+class RecordDeletionRequest(BaseModel):
+    email: EmailStr
+    # Emotion record ids; ids that don't belong to the user are skipped
+    ids: List[int] = Field(..., min_length=1)
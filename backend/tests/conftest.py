@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The app reads its settings on first use; give the tests something to read when no .env
+# is present. Tests that need MySQL skip themselves unless DATABASE_URL points at one.
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from main import create_app
+from routes import admin_routes
+from routes.admin_routes import EmotionRow
+from utils.jwt_handler import create_jwt
+from utils.pagination import decode_cursor, encode_cursor
+from utils.response_cache import response_cache
+
+START = datetime(2024, 1, 1)
+ROWS = [EmotionRow(i, user_id, f"user{user_id}@example.com", "happy", START + timedelta(minutes=i))
+        for i, user_id in enumerate([1, 1, 1, 2, 2, 3], start=1)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fetch_page(after, limit):
+        return [row for row in ROWS
+                if after is None or (row.user_id, row.timestamp, row.id) > tuple(after)][:limit]
+
+    monkeypatch.setattr(admin_routes, "_fetch_emotion_page", fetch_page)
+    monkeypatch.setattr(admin_routes, "EXPORT_BATCH_SIZE", 2)
+    asyncio.run(response_cache.invalidate())
+    token = create_jwt({"sub": "admin@example.com", "role": True, "id": 1})
+    return TestClient(create_app(), headers={"Authorization": f"Bearer {token}"})
+
+
+def test_cursor_round_trip_keeps_datetimes():
+    cursor = encode_cursor(3, START, 9)
+    assert decode_cursor(cursor, 3) == [3, START, 9]
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor, 2)
+    assert excinfo.value.status_code == 400
+
+
+def test_pages_follow_next_cursor_to_the_end(client):
+    seen = []
+    params = {"limit": 4}
+    while True:
+        page = client.get("/admin/get_all_emotion", params=params).json()
+        seen += [(group["user_id"], len(group["emotions"])) for group in page["data"]]
+        if page["next_cursor"] is None:
+            break
+        params = {"limit": 4, "cursor": page["next_cursor"]}
+    # User 2 straddles the page boundary
+    assert seen == [(1, 3), (2, 1), (2, 1), (3, 1)]
+    assert client.get("/admin/get_all_emotion", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_unpaginated_response_merges_users_split_across_batches(client):
+    data = client.get("/admin/get_all_emotion", params={"layout": "columns"}).json()["data"]
+    assert [(group["user_id"], len(group["emotions"]["emotion"])) for group in data] == [(1, 3), (2, 2), (3, 1)]
+
+
+def test_exports_stream_every_row(client):
+    lines = client.get("/admin/export_emotion").text.splitlines()
+    assert sum(len(json.loads(line)["emotions"]) for line in lines) == len(ROWS)
+
+    csv_lines = client.get("/admin/export_emotion", params={"format": "csv"}).text.splitlines()
+    assert csv_lines[0] == "user_id,email,emotion,timestamp"
+    assert csv_lines[1:] == [f"{row.user_id},{row.email},happy,{row.timestamp.isoformat()}" for row in ROWS]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from utils.analytics import (
+    _daily_columns, cohort_comparison, daily_distribution, encode_labels, label_totals, mood_series, streaks,
+    summarize_counts, transition_matrix,
+)
+
+DAY0 = 19723  # 2024-01-01 as days since the epoch
+
+
+def columns(*entries):
+    """
+    (user_id, day offset, emotion, count) tuples as DailyColumns.
+    """
+    user_ids, days, emotions, counts = zip(*entries)
+    return _daily_columns(user_ids, [DAY0 + day for day in days], list(emotions), counts)
+
+
+def test_encode_labels_sorts_the_dictionary():
+    labels, codes = encode_labels(["sad", "happy", "sad", "neutral"])
+    assert labels == ["happy", "neutral", "sad"]
+    assert codes.tolist() == [2, 0, 2, 1]
+
+
+def test_summarize_counts_scores_by_valence():
+    summary = summarize_counts({"happy": 3, "sad": 1, "neutral": 4})
+    assert summary["dominant_emotion"] == "neutral"
+    assert (summary["positive_count"], summary["negative_count"]) == (3, 1)
+    assert summary["mood_balance"] == "Positive"
+    assert summary["mood_score"] == 0.25
+    assert summarize_counts({})["dominant_emotion"] is None
+
+
+def test_daily_series_fill_gaps_in_the_calendar():
+    data = columns((1, 0, "happy", 2), (1, 0, "sad", 2), (1, 2, "happy", 1), (2, 2, "sad", 3))
+
+    assert label_totals(data) == {"happy": 3, "sad": 5}
+    distribution = daily_distribution(data)
+    assert distribution["days"] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert distribution["counts"] == [[2, 2], [0, 0], [1, 3]]
+
+    series = mood_series(data, window=2)
+    assert series["mood"] == [0.0, None, -0.5]
+    # The rolling window skips the empty day rather than counting it as neutral
+    assert series["rolling_mood"] == [0.0, 0.0, -0.5]
+
+
+def test_streaks_count_consecutive_days():
+    data = columns((1, 0, "happy", 1), (1, 1, "happy", 1), (1, 2, "sad", 1), (1, 4, "happy", 1), (1, 5, "happy", 1),
+                   (1, 6, "happy", 1))
+    assert streaks(data) == {
+        "recording": {"longest": 3, "current": 3},
+        "positive": {"longest": 3, "current": 3},
+        "negative": {"longest": 1, "current": 0},
+    }
+
+
+def test_empty_columns_give_empty_results():
+    empty = _daily_columns([], [], [], [])
+    assert daily_distribution(empty)["counts"] == []
+    assert mood_series(empty, 7)["mood"] == []
+    assert streaks(empty)["recording"] == {"longest": 0, "current": 0}
+    assert transition_matrix([])["counts"] == []
+
+
+def test_transition_matrix_counts_consecutive_pairs():
+    result = transition_matrix(["happy", "sad", "happy", "happy"])
+    assert result["labels"] == ["happy", "sad"]
+    assert result["counts"] == [[1, 1], [1, 0]]
+    assert result["probabilities"] == [[0.5, 0.5], [1.0, 0.0]]
+
+
+def test_cohorts_group_users_by_signup_month():
+    data = columns((1, 0, "happy", 2), (2, 0, "sad", 2), (3, 1, "happy", 4), (9, 1, "sad", 5))
+    result = cohort_comparison(data, np.array([1, 2, 3]), np.array(["2024-01", "2024-01", "2024-02"], dtype=object))
+    # User 9 has no account row and is left out
+    assert [(row["cohort"], row["active_users"], row["total"], row["mood_score"]) for row in result] == [
+        ("2024-01", 2, 4, 0.0), ("2024-02", 1, 4, 1.0),
+    ]
+    assert result[0]["distribution"] == {"happy": 0.5, "sad": 0.5}
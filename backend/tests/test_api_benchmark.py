@@ -0,0 +1,63 @@
+import asyncio
+import random
+
+import httpx
+
+from benchmarks.api_benchmark import compare, percentile, run_scenario, scenarios
+
+
+def test_percentile_picks_the_rank_in_a_sorted_list():
+    ordered = list(range(1, 101))
+    assert (percentile(ordered, 50), percentile(ordered, 99), percentile(ordered, 100)) == (51, 100, 100)
+    assert percentile([7], 95) == 7
+
+
+def test_run_scenario_counts_every_request_and_its_status():
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(429 if len(seen) % 5 == 0 else 200)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://bench") as client:
+            return await run_scenario(client, lambda c: c.get("/user/get_emotion"), requests=20, concurrency=4,
+                                      warmup=3)
+
+    result = asyncio.run(run())
+    assert len(seen) == 23
+    assert result["requests"] == 20
+    assert sum(result["statuses"].values()) == 20
+    assert result["errors"] == result["statuses"].get("429", 0) > 0
+    latency = result["latency_ms"]
+    assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+
+
+def test_scenarios_are_reproducible_for_a_seed():
+    def requests_for(seed):
+        sent = []
+
+        def handler(request):
+            sent.append(str(request.url))
+            return httpx.Response(200)
+
+        async def run():
+            chosen = scenarios([1, 2, 3], ["a@example.com"], {}, random.Random(seed))
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://bench") as client:
+                for _ in range(5):
+                    await chosen["get_emotion"](client)
+        asyncio.run(run())
+        return sent
+
+    assert requests_for(1) == requests_for(1)
+
+
+def test_compare_reports_changes_against_the_baseline(capsys):
+    def endpoint(p50, p99, rps):
+        return {"latency_ms": {"p50": p50, "p99": p99}, "throughput_rps": rps}
+
+    compare({"endpoints": {"login": endpoint(5, 20, 300), "register": endpoint(9, 30, 50)}},
+            {"endpoints": {"login": endpoint(10, 40, 150)}})
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 2  # header and login; register has no baseline
+    assert "-50.0%" in lines[1] and "+100.0%" in lines[1]
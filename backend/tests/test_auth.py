@@ -0,0 +1,71 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from utils import auth
+from utils.auth import get_current_user_record, invalidate_user, verify_token
+from utils.jwt_handler import create_jwt, decode_jwt
+from utils.ttl_cache import TTLCache
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    calls = []
+
+    def counting_decode(token):
+        calls.append(token)
+        return decode_jwt(token)
+
+    monkeypatch.setattr(auth, "decode_jwt", counting_decode)
+    monkeypatch.setattr(auth, "token_cache", TTLCache(16, 60))
+    monkeypatch.setattr(auth, "user_cache", TTLCache(16, 60))
+    return calls
+
+
+def test_verified_tokens_are_served_from_the_cache(decodes):
+    token = create_jwt({"sub": "a@example.com", "role": False, "id": 1})
+    assert verify_token(token)["id"] == 1
+    assert verify_token(token)["id"] == 1
+    assert len(decodes) == 1
+
+
+def test_cached_claims_are_not_used_past_their_expiry(decodes):
+    token = create_jwt({"sub": "a@example.com", "role": False, "id": 1})
+    verify_token(token)
+    [(key, (claims, expires_at))] = auth.token_cache._data.items()
+    auth.token_cache._data[key] = ({**claims, "exp": time.time() - 1}, expires_at)
+
+    verify_token(token)
+    assert len(decodes) == 2
+
+
+def test_invalid_and_expired_tokens_are_rejected(decodes):
+    expired = create_jwt({"sub": "a@example.com", "id": 1}, expires_delta=timedelta(minutes=-1))
+    for token in (expired, "not-a-token"):
+        with pytest.raises(HTTPException) as excinfo:
+            verify_token(token)
+        assert excinfo.value.status_code == 401
+    assert auth.token_cache.stats()["size"] == 0
+
+
+def test_user_rows_are_cached_until_invalidated(decodes, monkeypatch):
+    fetches = []
+
+    async def fetch_one(query, values):
+        fetches.append(values["user_id"])
+        return {"id": values["user_id"], "name": "A", "email": "a@example.com", "face_data_path": None, "isAdmin": 0}
+
+    monkeypatch.setattr(auth.database, "fetch_one", fetch_one)
+    claims = {"id": 1}
+
+    first = asyncio.run(get_current_user_record(claims))
+    first["name"] = "changed by the caller"
+    assert asyncio.run(get_current_user_record(claims))["name"] == "A"
+    assert fetches == [1]
+
+    invalidate_user(1)
+    asyncio.run(get_current_user_record(claims))
+    assert fetches == [1, 1]
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def loaded_rows(monkeypatch):
+    rows = []
+
+    async def fetch_all(query, values):
+        return [{"id": 1, "email": email} for email in values.values() if email == "user@example.com"]
+
+    async def bulk_insert_emotions(batch):
+        rows.extend(batch)
+        return len(batch)
+
+    async def invalidate():
+        pass
+
+    monkeypatch.setattr(cli.database, "fetch_all", fetch_all)
+    monkeypatch.setattr(cli, "bulk_insert_emotions", bulk_insert_emotions)
+    monkeypatch.setattr(cli.response_cache, "invalidate", invalidate)
+    return rows
+
+
+def write_ndjson(tmp_path):
+    path = tmp_path / "emotions.ndjson"
+    path.write_text("\n".join([
+        '{"email": "user@example.com", "emotion": "happy"}',
+        '{"email": "user@example.com", "emotion": ',
+        '["user@example.com", "sad"]',
+        '{"email": "user@example.com", "emotion": ["sad"]}',
+        '{"email": "user@example.com", "emotion": "sad", "confidence": 0.5}',
+    ]) + "\n")
+    return str(path)
+
+
+def test_import_rejects_bad_ndjson_lines_and_keeps_the_rest(tmp_path, loaded_rows):
+    records = cli.read_records(write_ndjson(tmp_path), "ndjson")
+    result = asyncio.run(cli.import_records(records, batch_size=2, progress=None))
+    assert (result["loaded"], result["rejected"]) == (2, 3)
+    assert [row["emotion"] for row in loaded_rows] == ["happy", "sad"]
+
+
+def test_strict_import_reports_the_bad_line(tmp_path, loaded_rows):
+    records = cli.read_records(write_ndjson(tmp_path), "ndjson")
+    with pytest.raises(cli.RecordError, match="record 2: invalid JSON"):
+        asyncio.run(cli.import_records(records, strict=True, progress=None))
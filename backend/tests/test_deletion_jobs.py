@@ -0,0 +1,137 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from utils import deletion_jobs
+from utils.deletion_jobs import DeletionWorker, run_deletion_jobs
+
+
+class FakeDatabase:
+    """
+    A records deletion job and its emotion rows in memory. `failures` makes that many emotion
+    DELETEs raise, as a lost connection would.
+    """
+    def __init__(self, job, items, emotion_ids):
+        self.job = {"kind": "records", "user_id": 1, "status": "queued", "rows_total": len(items),
+                    "rows_deleted": 0, "cursor_id": 0, "attempts": 0, "error": None, **job}
+        self.items = list(items)
+        self.emotions = {emotion_id: {"id": emotion_id, "user_id": 1, "emotion_id": 1, "timestamp": None}
+                         for emotion_id in emotion_ids}
+        self.failures = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetch_val(self, query, values):
+        assert "GET_LOCK" in query
+        return 1
+
+    async def fetch_one(self, query, values):
+        active = self.job["status"] in ("queued", "running") and self.job["id"] > values["after_id"]
+        return dict(self.job) if active else None
+
+    async def fetch_all(self, query, values):
+        if "deletion_job_items" in query:
+            return [{"record_id": record_id} for record_id in self.items if record_id > values["after"]][:values["limit"]]
+        ids = [value for name, value in values.items() if name.startswith("id_")]
+        return [self.emotions[i] for i in ids if i in self.emotions and self.emotions[i]["user_id"] == values["user_id"]]
+
+    async def execute(self, query, values):
+        if "DELETE FROM emotions" in query:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("lost connection")
+            for emotion_id in values.values():
+                self.emotions.pop(emotion_id, None)
+        elif "attempts = attempts + 1" in query:
+            self.job.update(status="running", attempts=self.job["attempts"] + 1)
+        elif "cursor_id = :after" in query:
+            self.job.update(rows_deleted=self.job["rows_deleted"] + values["count"], cursor_id=values["after"])
+        elif "status = 'done'" in query:
+            self.job.update(status="done", error=None)
+        elif "status = :status" in query:
+            self.job.update(status=values["status"], error=values["error"])
+        elif "DELETE FROM deletion_job_items" in query:
+            self.items = []
+
+
+@pytest.fixture(autouse=True)
+def fake_env(monkeypatch):
+    async def subtract_rollups(rows):
+        pass
+
+    async def invalidate():
+        pass
+
+    monkeypatch.setattr(deletion_jobs, "subtract_rollups", subtract_rollups)
+    monkeypatch.setattr(deletion_jobs.response_cache, "invalidate", invalidate)
+    monkeypatch.setattr(deletion_jobs.read_router, "mark_write", lambda user_ids: None)
+    monkeypatch.setattr(deletion_jobs.settings, "DELETION_BATCH_SIZE", 2)
+    monkeypatch.setattr(deletion_jobs.settings, "DELETION_BATCH_PAUSE_MS", 0)
+    monkeypatch.setattr(deletion_jobs.settings, "DELETION_MAX_ATTEMPTS", 3)
+
+
+def run(db, worker=None):
+    return asyncio.run(run_deletion_jobs(worker or DeletionWorker(1), db))
+
+
+def test_an_interrupted_job_resumes_after_its_cursor():
+    # Batches up to record 2 were committed before the restart
+    db = FakeDatabase({"id": 5, "status": "running", "cursor_id": 2, "rows_deleted": 2, "attempts": 1},
+                      items=[1, 2, 3, 4, 5], emotion_ids=[1, 2, 3, 4, 5])
+
+    assert run(db) == 3
+    assert sorted(db.emotions) == [1, 2]
+    assert db.job["status"] == "done"
+    assert db.job["rows_deleted"] == 5
+    assert db.job["cursor_id"] == 5
+    assert db.items == []
+
+
+def test_a_failed_batch_is_retried_from_the_last_committed_one():
+    db = FakeDatabase({"id": 5}, items=[1, 2, 3, 4], emotion_ids=[1, 2, 3, 4])
+    worker = DeletionWorker(1)
+    original = db.execute
+    deletes = []
+
+    async def fail_second_batch(query, values):
+        if "DELETE FROM emotions" in query:
+            deletes.append(values)
+            db.failures = int(len(deletes) == 2)
+        return await original(query, values)
+
+    db.execute = fail_second_batch
+    run(db, worker)
+    assert db.job["status"] == "running"
+    assert db.job["cursor_id"] == 2
+    assert db.job["rows_deleted"] == 2
+    assert "lost connection" in db.job["error"]
+    assert sorted(db.emotions) == [3, 4]
+    assert worker.failures == 1
+
+    assert run(db, worker) == 2
+    assert db.job["status"] == "done"
+    assert db.job["attempts"] == 2
+    assert db.job["error"] is None
+    assert db.emotions == {}
+
+
+def test_a_job_is_marked_failed_after_max_attempts():
+    db = FakeDatabase({"id": 5}, items=[1], emotion_ids=[1])
+    db.failures = 10
+
+    for attempt in range(1, 4):
+        assert run(db) == 0
+        assert db.job["attempts"] == attempt
+    assert db.job["status"] == "failed"
+
+    # Failed jobs are not picked up again
+    assert run(db) == 0
+    assert db.job["attempts"] == 3
+    assert db.emotions == {1: db.emotions[1]}
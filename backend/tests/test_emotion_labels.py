@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from utils.emotion_labels import EmotionLabels
+
+
+class FakeLabelTable:
+    """
+    emotion_labels with a UNIQUE label under `collate`, which maps a label to the key the
+    collation compares.
+    """
+
+    def __init__(self, collate):
+        self.collate = collate
+        self.rows = {}
+
+    async def execute(self, query, values):
+        for label in values.values():
+            if all(self.collate(label) != self.collate(existing) for existing in self.rows.values()):
+                self.rows[len(self.rows) + 1] = label
+
+    async def fetch_all(self, query):
+        return [{"id": emotion_id, "label": label} for emotion_id, label in self.rows.items()]
+
+    async def fetch_val(self, query, values):
+        return next((emotion_id for emotion_id, label in self.rows.items()
+                     if self.collate(label) == self.collate(values["label"])), None)
+
+
+def test_labels_equal_under_a_case_insensitive_collation_share_an_id():
+    db = FakeLabelTable(lambda label: label.rstrip().lower())
+    labels = EmotionLabels()
+    ids = asyncio.run(labels.ids({"happy"}, db))
+    ids = asyncio.run(labels.ids({"Happy", "happy ", "sad"}, db))
+    assert ids["Happy"] == ids["happy "] == ids["happy"]
+    assert ids["sad"] != ids["happy"]
+
+
+@pytest.mark.parametrize("labels_in_order", [["happy", "Happy"], ["Happy", "happy"]])
+def test_binary_collation_keeps_case_variants_apart(labels_in_order):
+    db = FakeLabelTable(lambda label: label.rstrip())
+    labels = EmotionLabels()
+    for label in labels_in_order:
+        asyncio.run(labels.ids({label}, db))
+    names = asyncio.run(labels.names([1, 2], db))
+    assert sorted(names.values()) == ["Happy", "happy"]
+
+
+def test_overlong_labels_are_refused_before_they_reach_the_table():
+    db = FakeLabelTable(lambda label: label)
+    with pytest.raises(ValueError):
+        asyncio.run(EmotionLabels().ids({"x" * 51}, db))
+    assert db.rows == {}
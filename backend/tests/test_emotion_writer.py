@@ -0,0 +1,100 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+from routes import user_routes
+from utils import emotion_writer
+from utils.emotion_writer import write_emotions
+
+
+class FakeLabels:
+    async def ids(self, labels):
+        return {label: index for index, label in enumerate(sorted(labels), start=1)}
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    executed = []
+    rolled_up = []
+
+    @asynccontextmanager
+    async def transaction():
+        executed.append("BEGIN")
+        yield
+        executed.append("COMMIT")
+
+    async def execute(query, values):
+        executed.append(len(values) // 4)
+
+    async def apply_rollups(rows):
+        rolled_up.extend(rows)
+
+    async def invalidate():
+        pass
+
+    monkeypatch.setattr(emotion_writer.database, "transaction", transaction)
+    monkeypatch.setattr(emotion_writer.database, "execute", execute)
+    monkeypatch.setattr(emotion_writer, "emotion_labels", FakeLabels())
+    monkeypatch.setattr(emotion_writer, "apply_rollups", apply_rollups)
+    monkeypatch.setattr(emotion_writer.response_cache, "invalidate", invalidate)
+    monkeypatch.setattr(emotion_writer.read_router, "mark_write", lambda user_ids: None)
+    monkeypatch.setattr(emotion_writer.event_hub, "publish_rows", lambda rows: None)
+    monkeypatch.setattr(emotion_writer, "INSERT_CHUNK_SIZE", 2)
+    return executed, rolled_up
+
+
+def test_rows_are_inserted_in_chunks_inside_one_transaction(statements):
+    executed, rolled_up = statements
+    rows = [{"user_id": 1, "emotion": "happy", "timestamp": datetime(2024, 1, 1)} for _ in range(5)]
+
+    assert asyncio.run(write_emotions(rows)) == 5
+    # Rows per multi-row INSERT
+    assert executed == ["BEGIN", 2, 2, 1, "COMMIT"]
+    assert rolled_up == rows
+
+
+def test_cached_responses_are_invalidated_after_the_commit(statements, monkeypatch):
+    executed, _ = statements
+
+    async def invalidate():
+        executed.append("INVALIDATE")
+
+    monkeypatch.setattr(emotion_writer.response_cache, "invalidate", invalidate)
+    asyncio.run(write_emotions([{"user_id": 1, "emotion": "sad", "timestamp": datetime(2024, 1, 1)}]))
+    assert executed == ["BEGIN", 1, "COMMIT", "INVALIDATE"]
+
+
+def test_an_empty_batch_writes_nothing(statements):
+    executed, _ = statements
+    assert asyncio.run(write_emotions([])) == 0
+    assert executed == []
+
+
+def test_add_emotions_stores_valid_records_and_reports_the_rest(monkeypatch):
+    written = []
+
+    async def fake_write(rows):
+        written.extend(rows)
+        return len(rows)
+
+    monkeypatch.setattr(user_routes, "write_emotions", fake_write)
+    client = TestClient(create_app())
+    future = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    response = client.post("/user/add_emotions", json={"userId": 3, "emotions": [
+        {"emotion": "happy"},
+        {"emotion": "bored"},
+        {"emotion": "sad", "timestamp": future},
+        {"emotion": "sad", "confidence": 0.5},
+        "not a record",
+    ]})
+
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["inserted"], body["rejected"]) == (2, 3)
+    assert [result["status"] for result in body["results"]] == ["ok", "error", "error", "ok", "error"]
+    assert body["results"][2]["errors"] == ["timestamp: in the future"]
+    assert [(row["user_id"], row["emotion"], row["confidence"]) for row in written] == [(3, "happy", None), (3, "sad", 0.5)]
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from main import create_app
+from routes import admin_routes
+from utils.event_hub import DROPPED, HEARTBEAT, EventHub, SubscriberLimit
+from utils.jwt_handler import create_jwt
+
+ROWS = [
+    {"user_id": 1, "emotion": "happy", "timestamp": datetime(2024, 1, 1, 12), "confidence": 0.9},
+    {"user_id": 2, "emotion": "happy", "timestamp": datetime(2024, 1, 1, 12, 1)},
+]
+
+
+def test_every_subscriber_gets_the_batch_and_its_delta():
+    hub = EventHub(queue_size=4, max_subscribers=2)
+
+    async def run():
+        first, second = hub.subscribe(), hub.subscribe()
+        hub.publish_rows(ROWS)
+        return await first.next(1), await second.next(1)
+
+    first, second = asyncio.run(run())
+    assert first is second  # encoded once, shared by every queue
+    message = json.loads(first)
+    assert message["delta"] == {"happy": 2}
+    assert [event["user_id"] for event in message["events"]] == [1, 2]
+    assert hub.metrics()["messages_delivered"] == 2
+
+
+def test_a_slow_consumer_is_dropped_without_holding_up_others():
+    hub = EventHub(queue_size=2, max_subscribers=2)
+
+    async def run():
+        slow, fast = hub.subscribe(), hub.subscribe()
+        received = []
+        for _ in range(3):
+            hub.publish_rows(ROWS)
+            received.append(await fast.next(1))
+        return slow, received
+
+    slow, received = asyncio.run(run())
+    assert slow.dropped
+    assert asyncio.run(slow.next(0.01)) == DROPPED
+    assert len(received) == 3
+    assert hub.metrics()["subscribers"] == 1
+    assert hub.metrics()["subscribers_dropped"] == 1
+
+
+def test_subscribers_are_capped_and_idle_ones_get_heartbeats():
+    hub = EventHub(queue_size=2, max_subscribers=1)
+
+    async def run():
+        subscription = hub.subscribe()
+        with pytest.raises(SubscriberLimit):
+            hub.subscribe()
+        heartbeat = await subscription.next(0.01)
+        subscription.close()
+        hub.subscribe()
+        return heartbeat
+
+    assert asyncio.run(run()) == HEARTBEAT
+
+
+def test_websocket_feed_requires_an_admin_token(monkeypatch):
+    monkeypatch.setattr(admin_routes, "event_hub", EventHub(queue_size=2, max_subscribers=1))
+    monkeypatch.setattr(admin_routes.settings, "EVENT_STREAM_HEARTBEAT_SECONDS", 0.01)
+    client = TestClient(create_app())
+
+    user = create_jwt({"sub": "a@example.com", "role": False, "id": 2})
+    with pytest.raises(WebSocketDisconnect) as excinfo:
+        with client.websocket_connect(f"/admin/ws/emotions?token={user}") as websocket:
+            websocket.receive_text()
+    assert excinfo.value.code == 1008
+
+    admin = create_jwt({"sub": "admin@example.com", "role": True, "id": 1})
+    with client.websocket_connect(f"/admin/ws/emotions?token={admin}") as websocket:
+        assert websocket.receive_text() == HEARTBEAT
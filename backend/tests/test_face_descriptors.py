@@ -0,0 +1,18 @@
+import numpy as np
+
+from utils.face_descriptors import DESCRIPTOR_DIM, decode_descriptor, descriptor_distances, encode_descriptor
+
+
+def test_descriptor_round_trip():
+    descriptor = np.random.default_rng(0).normal(size=DESCRIPTOR_DIM).astype(np.float32)
+    assert np.array_equal(decode_descriptor(encode_descriptor(descriptor)), descriptor)
+
+
+def test_descriptor_distances_pair_images_on_the_diagonal():
+    rng = np.random.default_rng(1)
+    server = rng.normal(scale=0.1, size=(2, DESCRIPTOR_DIM))
+    client = server + 0.001
+    distances = descriptor_distances(server, client.tolist())
+    assert distances.shape == (2, 2)
+    assert np.allclose(np.diag(distances), 0.001 * np.sqrt(DESCRIPTOR_DIM), atol=1e-5)
+    assert np.isclose(distances[0, 1], np.linalg.norm(server[0].astype(np.float32) - client[1].astype(np.float32)))
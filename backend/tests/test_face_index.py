@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import numpy as np
+
+from utils import face_index as face_index_module
+from utils.face_descriptors import DESCRIPTOR_DIM, encode_descriptor
+from utils.face_index import CURRENT_FILE, SNAPSHOT_DIR, FaceIndex, sync_face_index
+
+
+def build_index(count: int, seed: int = 0) -> FaceIndex:
+    index = FaceIndex()
+    vectors = np.random.default_rng(seed).normal(size=(count, DESCRIPTOR_DIM)).astype(np.float32)
+    index.build(np.arange(1, count + 1, dtype=np.int64), vectors)
+    return index
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_index(5)
+    index.change_id = 7
+    index.save(str(tmp_path))
+
+    loaded = FaceIndex()
+    assert loaded.load(str(tmp_path))
+    assert len(loaded) == 5
+    assert loaded.change_id == 7
+    assert loaded.checksum() == index.checksum()
+    assert os.listdir(tmp_path / SNAPSHOT_DIR) == [(tmp_path / CURRENT_FILE).read_text()]
+
+
+def test_load_rejects_a_snapshot_that_fails_its_checksum(tmp_path):
+    build_index(5).save(str(tmp_path))
+    snapshot = tmp_path / SNAPSHOT_DIR / (tmp_path / CURRENT_FILE).read_text()
+    vectors = np.load(snapshot / "vectors.npy")
+    vectors[0, 0] += 1
+    np.save(snapshot / "vectors.npy", vectors)
+
+    assert not FaceIndex().load(str(tmp_path))
+
+
+def test_save_keeps_a_snapshot_with_later_changes(tmp_path):
+    newer = build_index(5)
+    newer.change_id = 10
+    newer.save(str(tmp_path))
+    older = build_index(3, seed=1)
+    older.change_id = 4
+    older.save(str(tmp_path))
+
+    loaded = FaceIndex()
+    assert loaded.load(str(tmp_path))
+    assert loaded.change_id == 10
+    assert len(os.listdir(tmp_path / SNAPSHOT_DIR)) == 1
+
+
+class FakeDatabase:
+    def __init__(self, changes, descriptors):
+        self.changes = changes
+        self.descriptors = descriptors
+
+    async def fetch_all(self, query, values):
+        if "face_index_changes" in query:
+            return [{"id": change_id, "user_id": user_id} for change_id, user_id in self.changes
+                    if change_id > values["after"]][:values["limit"]]
+        return [{"id": user_id, "face_descriptor": self.descriptors[user_id]}
+                for user_id in values.values() if user_id in self.descriptors]
+
+
+def test_sync_applies_logged_changes():
+    index = build_index(3)
+    index.change_id = 1
+    descriptor = np.full(DESCRIPTOR_DIM, 0.5, dtype=np.float32)
+    db = FakeDatabase([(1, 1), (2, 2), (3, 9)], {9: encode_descriptor(descriptor)})
+
+    assert asyncio.run(sync_face_index(index, db)) == 2
+    assert index.change_id == 3
+    assert len(index) == 3
+    assert index.search(descriptor)[0][0] == 9
+    assert asyncio.run(sync_face_index(index, db)) == 0
+
+
+def test_training_runs_kmeans_without_holding_the_lock(monkeypatch):
+    index = build_index(64)
+    index.ivf_min_size = 65
+    lock_held_during_kmeans = []
+    nearest = face_index_module._nearest
+
+    def checking_nearest(vectors, centroids, count):
+        if index._training:
+            lock_held_during_kmeans.append(index._lock._is_owned())
+        return nearest(vectors, centroids, count)
+
+    monkeypatch.setattr(face_index_module, "_nearest", checking_nearest)
+    index.add(100, np.zeros(DESCRIPTOR_DIM, dtype=np.float32))
+    assert index.partitioned
+    assert lock_held_during_kmeans and not any(lock_held_during_kmeans)
+    assert index.search(np.zeros(DESCRIPTOR_DIM, dtype=np.float32))[0][0] == 100
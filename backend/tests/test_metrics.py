@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from config import settings
+from main import create_app
+from utils.jwt_handler import create_jwt
+
+client = TestClient(create_app())
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_metrics_requires_a_token():
+    assert client.get("/metrics").status_code == 401
+    user_token = create_jwt({"sub": "user@example.com", "role": False, "id": 1})
+    assert client.get("/metrics", headers=bearer(user_token)).status_code == 403
+
+
+def test_metrics_accepts_an_admin_token():
+    admin_token = create_jwt({"sub": "admin@example.com", "role": True, "id": 1})
+    response = client.get("/metrics", headers=bearer(admin_token))
+    assert response.status_code == 200
+    assert "emotion_tracker_" in response.text
+
+
+def test_metrics_accepts_the_scrape_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers=bearer("scrape-secret")).status_code == 200
+    assert client.get("/metrics", headers=bearer("wrong")).status_code == 401
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.context import CryptContext
+
+from utils.password_hashing import PasswordHasher, PasswordPoolBusy, get_pwd_context, password_hasher
+
+
+def test_hash_then_verify_through_the_shared_hasher():
+    async def run():
+        hashed = await password_hasher.hash("correct horse")
+        return hashed, await password_hasher.verify_and_update("correct horse", hashed), \
+            await password_hasher.verify_and_update("wrong", hashed)
+
+    hashed, (valid, new_hash), (invalid, _) = asyncio.run(run())
+    assert hashed.startswith("$2")
+    assert valid and new_hash is None
+    assert not invalid
+    assert password_hasher.metrics()["completed"] >= 3
+
+
+def test_hashes_with_another_work_factor_are_flagged_for_rehash():
+    old = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("pw")
+    hasher = PasswordHasher(get_pwd_context, workers=1, max_queue=1)
+    valid, new_hash = asyncio.run(hasher.verify_and_update("pw", old))
+    hasher.shutdown()
+    assert valid
+    assert new_hash is not None and new_hash != old
+
+
+class BlockingContext:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.release.wait(5)
+        return "hashed:" + password
+
+
+def test_calls_beyond_the_queue_bound_fail_fast_without_blocking_the_loop():
+    context = BlockingContext()
+    hasher = PasswordHasher(lambda: context, workers=1, max_queue=1)
+
+    async def run():
+        running = [asyncio.create_task(hasher.hash("a")), asyncio.create_task(hasher.hash("b"))]
+        await asyncio.sleep(0.05)  # the loop keeps running while both wait on the pool
+        metrics = hasher.metrics()
+        with pytest.raises(PasswordPoolBusy):
+            await hasher.hash("c")
+        context.release.set()
+        return metrics, await asyncio.gather(*running)
+
+    metrics, hashes = asyncio.run(run())
+    hasher.shutdown()
+    assert (metrics["active"], metrics["queued"]) == (1, 1)
+    assert hashes == ["hashed:a", "hashed:b"]
+    assert hasher.metrics()["rejected"] == 1
@@ -0,0 +1,29 @@
+"""
+EXPLAIN guard for the hot emotion queries; needs DATABASE_URL to point at a MySQL database
+(the schema is migrated first).
+"""
+import asyncio
+import os
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.environ["DATABASE_URL"].startswith("mysql"), reason="needs a MySQL DATABASE_URL"
+)
+
+
+def test_hot_queries_use_an_index():
+    from config import database
+    from utils.migrations import run_migrations
+    from utils.query_plans import check_query_plans
+
+    async def check():
+        await database.connect()
+        try:
+            await run_migrations()
+            return await check_query_plans()
+        finally:
+            await database.disconnect()
+
+    violations = asyncio.run(check())
+    assert violations == [], [f"{name}: full scan of {table}" for name, table, _ in violations]
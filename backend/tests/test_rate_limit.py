@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from utils import rate_limit
+from utils.jwt_handler import create_jwt
+from utils.rate_limit import (
+    AUTH, AUTH_IP, HEAVY, READ, WRITE, AdmissionControlMiddleware, MemoryRateLimitBackend, RateLimiter, route_class,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_the_burst_then_refills_at_the_rate(clock):
+    backend = MemoryRateLimitBackend(100)
+    take = lambda: asyncio.run(backend.take("key", rate=2, burst=3))
+    assert [take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take() == pytest.approx(0.5)
+
+    clock[0] += 0.25
+    assert take() == pytest.approx(0.25)
+    clock[0] += 0.25
+    assert take() == 0.0
+
+    clock[0] += 60
+    assert [take() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_route_class():
+    assert route_class("/auth/login") == AUTH
+    assert route_class("/admin/get_all_emotion") == HEAVY
+    assert route_class("/user/add_emotion") == WRITE
+    assert route_class("/user/get_user_profile") == READ
+    assert route_class("/metrics") is None
+    assert route_class("/static/uploads/face.jpg") is None
+
+
+def scope(headers=(), client=("10.0.0.1", 1234), path="/user/get_user_profile"):
+    return {"type": "http", "path": path, "client": client,
+            "headers": [(name.encode(), value.encode()) for name, value in headers]}
+
+
+def test_client_key():
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {}, {})
+    token = create_jwt({"sub": "user@example.com", "role": False, "id": 42})
+    assert limiter.client_key(scope([("authorization", f"Bearer {token}")])) == "user:42"
+    assert limiter.client_key(scope([("authorization", "Bearer not-a-token")])) == "ip:10.0.0.1"
+    assert limiter.client_key(scope([("x-forwarded-for", "203.0.113.5, 10.0.0.2")])) == "ip:10.0.0.1"
+    assert limiter.client_key(scope(client=None)) == "ip:unknown"
+
+    limiter.trust_forwarded = True
+    assert limiter.client_key(scope([("x-forwarded-for", "203.0.113.5, 10.0.0.2")])) == "ip:203.0.113.5"
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def get(app, path, count=1):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path) for _ in range(count)]
+    return asyncio.run(run())
+
+
+def test_middleware_answers_429_once_the_bucket_is_empty(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {READ: [1, 2]}, {})
+    responses = get(AdmissionControlMiddleware(ok_app, limiter), "/user/get_user_profile", count=3)
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers["retry-after"] == "1"
+    assert limiter.rate_limited[READ] == 1
+
+    # Exempt paths are never limited
+    assert [r.status_code for r in get(AdmissionControlMiddleware(ok_app, limiter), "/metrics", count=3)] == [200] * 3
+
+
+def test_middleware_answers_503_when_the_class_is_full():
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {}, {HEAVY: 1})
+
+    async def run():
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            entered.set()
+            await release.wait()
+            await ok_app(scope, receive, send)
+
+        transport = httpx.ASGITransport(app=AdmissionControlMiddleware(slow_app, limiter))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/user/get_emotion"))
+            await entered.wait()
+            second = await client.get("/user/get_emotion")
+            release.set()
+            return (await first), second
+
+    first, second = asyncio.run(run())
+    assert (first.status_code, second.status_code) == (200, 503)
+    assert second.json() == {"detail": "Server busy, try again later"}
+    assert limiter.in_flight[HEAVY] == 0
+    assert limiter.shed[HEAVY] == 1
+
+
+def test_disabled_limiter_admits_everything(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {READ: [1, 1]}, {READ: 1}, enabled=False)
+    responses = get(AdmissionControlMiddleware(ok_app, limiter), "/user/get_user_profile", count=3)
+    assert [response.status_code for response in responses] == [200] * 3
+
+
+def test_logins_from_one_address_use_the_per_ip_auth_limit(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {AUTH: [1, 1], AUTH_IP: [1, 3]}, {})
+    responses = get(AdmissionControlMiddleware(ok_app, limiter), "/auth/login", count=4)
+    assert [response.status_code for response in responses] == [200, 200, 200, 429]
+    assert limiter.rate_limited[AUTH_IP] == 1
+
+
+def test_login_accounts_have_their_own_buckets(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend(100), {AUTH: [1, 1]}, {})
+    asyncio.run(limiter.limit_user("/auth/login", "a@example.com"))
+    asyncio.run(limiter.limit_user("/auth/login", "b@example.com"))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limiter.limit_user("/auth/login", "a@example.com"))
+    assert raised.value.status_code == 429
@@ -0,0 +1,118 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from config import database
+from main import create_app
+from utils.jwt_handler import create_jwt
+from utils.read_replicas import ReplicaRouter, read_router
+
+
+class FakeUrl:
+    def __init__(self, name):
+        self.obscure_password = name
+
+
+class FakeDatabase:
+    def __init__(self, name, up=True):
+        self.url = FakeUrl(name)
+        self.up = up
+        self.is_connected = False
+
+    async def connect(self):
+        if not self.up:
+            raise ConnectionError("refused")
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def fetch_val(self, query):
+        if not self.up:
+            raise ConnectionError("gone away")
+        return 1
+
+
+def make_router(*replicas, sticky_seconds=60):
+    return ReplicaRouter(FakeDatabase("primary"), list(replicas), sticky_seconds=sticky_seconds,
+                         health_interval=60, health_timeout=1)
+
+
+def connect(router):
+    async def run():
+        await router.connect()
+        await router.disconnect()
+    asyncio.run(run())
+
+
+def test_reads_rotate_over_healthy_replicas():
+    first, second = FakeDatabase("first"), FakeDatabase("second")
+    router = make_router(first, second)
+    connect(router)
+    assert [router.database() for _ in range(4)] == [first, second, first, second]
+    assert router.metrics()["replica_reads"] == 4
+
+
+def test_unhealthy_replicas_are_skipped_until_they_answer():
+    first, second = FakeDatabase("first"), FakeDatabase("second", up=False)
+    router = make_router(first, second)
+    connect(router)
+    assert [router.database() for _ in range(3)] == [first, first, first]
+    assert router.metrics()["healthy"] == 1
+
+    first.up = False
+    second.up = True
+    connect(router)
+    assert router.database() is second
+
+
+def test_reads_fall_back_to_the_primary():
+    router = make_router(FakeDatabase("replica", up=False))
+    connect(router)
+    assert router.database() is router.primary
+    assert router.metrics()["primary_fallback_reads"] == 1
+
+
+def test_writers_read_from_the_primary_while_pinned():
+    replica = FakeDatabase("replica")
+    router = make_router(replica)
+    connect(router)
+    router.mark_write([7])
+    assert router.database(7) is router.primary
+    assert router.database("7") is router.primary
+    assert router.database(8) is replica
+    assert router.metrics()["sticky_reads"] == 2
+
+
+def test_without_replicas_everything_reads_from_the_primary():
+    router = make_router()
+    connect(router)
+    router.mark_write([7])
+    assert router.database() is router.database(7) is router.primary
+
+
+def test_admin_stats_are_read_through_the_router(monkeypatch):
+    class Replica:
+        async def fetch_all(self, query, values=None):
+            return [{"emotion_id": 1, "count": 3}]
+
+    async def fetch_labels(query, values=None):
+        return [{"id": 1, "label": "happy"}]
+
+    monkeypatch.setattr(database, "fetch_all", fetch_labels)
+    monkeypatch.setattr(read_router, "database", lambda user_id=None: Replica())
+    client = TestClient(create_app())
+    assert client.get("/admin/get_emotion_stats").status_code == 422  # no Authorization header
+    token = create_jwt({"sub": "admin@example.com", "role": True, "id": 1})
+    response = client.get("/admin/get_emotion_stats", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["emotion_stats"] == [{"emotion": "happy", "count": 3}]
+
+
+def test_cache_seconds_only_applies_with_replicas():
+    assert make_router(FakeDatabase("replica")).cache_seconds is None
+    router = ReplicaRouter(FakeDatabase("primary"), [FakeDatabase("replica")], sticky_seconds=5,
+                           health_interval=60, health_timeout=1, cache_seconds=10)
+    assert router.cache_seconds == 10
+    router.replicas = []
+    assert router.cache_seconds is None
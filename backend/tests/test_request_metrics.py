@@ -0,0 +1,67 @@
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.request_metrics import RequestMetricsMiddleware, UNMATCHED, request_seconds, requests_total
+from utils.sampling_profiler import SamplingProfiler
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def item(request):
+    return PlainTextResponse(request.path_params["item_id"])
+
+
+async def slow(request):
+    busy_wait(0.1)
+    return PlainTextResponse("done")
+
+
+async def boom(request):
+    raise RuntimeError("boom")
+
+
+def make_client(profiler=None):
+    app = Starlette(routes=[Route("/items/{item_id}", item), Route("/slow", slow), Route("/boom", boom)])
+    app.add_middleware(RequestMetricsMiddleware, profile_routes=["/slow"], profile_sample_rate=1.0,
+                       profiler=profiler)
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def count(method, route, status):
+    return requests_total._values.get((method, route, status), 0)
+
+
+def test_requests_are_labelled_by_route_template():
+    client = make_client()
+    before = count("GET", "/items/{item_id}", "200"), count("GET", UNMATCHED, "404"), count("GET", "/boom", "500")
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+    assert client.get("/boom").status_code == 500
+
+    after = count("GET", "/items/{item_id}", "200"), count("GET", UNMATCHED, "404"), count("GET", "/boom", "500")
+    assert [b - a for a, b in zip(before, after)] == [2, 1, 1]
+    assert ("GET", "/items/1") not in request_seconds._series
+    assert request_seconds._series[("GET", "/items/{item_id}")][-1] >= 2
+
+
+def test_sampled_requests_are_profiled_per_route():
+    profiler = SamplingProfiler(interval_ms=1)
+    client = make_client(profiler)
+    client.get("/items/1")
+    client.get("/slow")
+
+    assert profiler.requests_profiled == 1
+    folded = profiler.folded("/slow")
+    assert "test_request_metrics.py:slow" in folded
+    assert "test_request_metrics.py:busy_wait" in folded
+    assert profiler.folded("/items/{item_id}") == ""
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from utils import response_cache as response_cache_module
+from utils.response_cache import MemoryCacheBackend, ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def request(etag=None, query=b""):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/admin/get_emotion_stats", "query_string": query,
+                    "headers": headers})
+
+
+def serve(cache, compute, max_age=None, etag=None, query=b""):
+    return asyncio.run(cache.respond(request(etag, query), "stats", compute, max_age))
+
+
+def counting():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"calls": len(calls)}
+    return compute, calls
+
+
+def test_bodies_are_reused_until_the_generation_changes(clock):
+    cache = ResponseCache(MemoryCacheBackend(10, 300), ttl=300, max_entry_bytes=1 << 20)
+    compute, calls = counting()
+    first = serve(cache, compute)
+    clock[0] += 200
+    assert serve(cache, compute).body == first.body
+    assert serve(cache, compute, etag=first.headers["etag"]).status_code == 304
+    asyncio.run(cache.invalidate())
+    serve(cache, compute)
+    assert len(calls) == 2
+
+
+def test_max_age_bounds_how_long_a_body_is_served(clock):
+    cache = ResponseCache(MemoryCacheBackend(10, 300), ttl=300, max_entry_bytes=1 << 20)
+    compute, calls = counting()
+    first = serve(cache, compute, max_age=10)
+    assert serve(cache, compute, max_age=10).body == first.body
+    clock[0] += 10
+    second = serve(cache, compute, max_age=10)
+    assert len(calls) == 2
+    assert second.headers["etag"] != first.headers["etag"]
+    assert serve(cache, compute, max_age=10, etag=first.headers["etag"]).status_code == 200
+
+
+def test_memory_backend_is_bounded_by_total_body_size():
+    backend = MemoryCacheBackend(100, 300, max_bytes=10)
+
+    async def run():
+        for key in "abc":
+            await backend.set(key, b"xxxx", 300)
+        return [await backend.get(key) for key in "abc"]
+
+    assert asyncio.run(run()) == [None, b"xxxx", b"xxxx"]
+    assert backend.stats()["bytes"] == 8
+
+
+def test_query_strings_are_cached_separately_and_large_bodies_not_at_all(clock):
+    cache = ResponseCache(MemoryCacheBackend(10, 300), ttl=300, max_entry_bytes=1 << 20)
+    compute, calls = counting()
+    serve(cache, compute, query=b"limit=10")
+    serve(cache, compute, query=b"limit=20")
+    serve(cache, compute, query=b"limit=10")
+    assert len(calls) == 2
+
+    small = ResponseCache(MemoryCacheBackend(10, 300), ttl=300, max_entry_bytes=4)
+    compute, calls = counting()
+    serve(small, compute)
+    serve(small, compute)
+    assert len(calls) == 2
+
+
+def test_an_unavailable_backend_falls_back_to_computing(clock):
+    class DownBackend(MemoryCacheBackend):
+        async def get_generation(self):
+            raise ConnectionError("cache down")
+
+    cache = ResponseCache(DownBackend(10, 300), ttl=300, max_entry_bytes=1 << 20)
+    compute, calls = counting()
+    response = serve(cache, compute)
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert cache.metrics()["errors"] == 1
@@ -0,0 +1,120 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import retention
+from utils.rollups import DAY, bucket_start
+
+
+class FakeLabels:
+    async def names(self, ids):
+        return {emotion_id: f"label{emotion_id}" for emotion_id in ids}
+
+
+class FakeConnection:
+    """
+    Holds emotion rows in memory and records every statement in order.
+    """
+    def __init__(self, rows, lock_free=True):
+        self.rows = {row["id"]: row for row in rows}
+        self.lock_free = lock_free
+        self.watermark = None
+        self.rows_archived = 0
+        self.events = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def connection(self):
+        return self
+
+    async def fetch_val(self, query, values):
+        assert "GET_LOCK" in query
+        self.events.append("lock")
+        return 1 if self.lock_free else 0
+
+    async def fetch_all(self, query, values):
+        rows = sorted((row for row in self.rows.values()
+                       if row["id"] > values["after_id"] and row["timestamp"] < values["cutoff"]),
+                      key=lambda row: row["id"])
+        return rows[:values["limit"]]
+
+    async def execute(self, query, values):
+        if "INSERT INTO retention_state" in query:
+            self.watermark = max(self.watermark or values["cutoff"], values["cutoff"])
+            self.events.append("watermark")
+        elif "DELETE FROM emotions" in query:
+            assert self.watermark is not None, "rows deleted before the watermark moved"
+            for row_id in values.values():
+                del self.rows[row_id]
+            self.events.append(("delete", sorted(values.values())))
+        elif "rows_archived" in query:
+            self.rows_archived += values["count"]
+        elif "RELEASE_LOCK" in query:
+            self.events.append("unlock")
+
+
+@pytest.fixture
+def fake_env(monkeypatch, tmp_path):
+    invalidated = []
+
+    async def invalidate():
+        invalidated.append(True)
+
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(retention, "emotion_labels", FakeLabels())
+    monkeypatch.setattr(retention.response_cache, "invalidate", invalidate)
+    monkeypatch.setattr(retention.settings, "RETENTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(retention.settings, "RETENTION_BATCH_PAUSE_MS", 0)
+    monkeypatch.setattr(retention.settings, "RETENTION_RAW_DAYS", 30)
+    return tmp_path, invalidated
+
+
+def emotion(row_id, age_days):
+    return {"id": row_id, "user_id": 1, "emotion_id": 2, "confidence": None,
+            "timestamp": datetime.utcnow() - timedelta(days=age_days)}
+
+
+def test_archives_then_deletes_old_rows_after_moving_the_watermark(fake_env):
+    archive_dir, invalidated = fake_env
+    db = FakeConnection([emotion(1, 40), emotion(2, 35), emotion(3, 5), emotion(4, 31), emotion(5, 60)])
+
+    assert asyncio.run(retention.run_retention(db)) == 4
+    assert db.watermark == bucket_start(datetime.utcnow() - timedelta(days=30), DAY)
+    assert db.events == ["lock", "watermark", ("delete", [1, 2]), ("delete", [4, 5]), "unlock"]
+    assert list(db.rows) == [3]
+    assert db.rows_archived == 4
+    assert invalidated == [True]
+
+    [archive] = list(archive_dir.iterdir())
+    with gzip.open(archive, "rt") as f:
+        archived = [json.loads(line) for line in f]
+    assert [row["id"] for row in archived] == [1, 2, 4, 5]
+    assert archived[0]["emotion"] == "label2"
+
+
+def test_keeps_rows_when_the_archive_cannot_be_written(fake_env, monkeypatch):
+    def failing_append(path, rows):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(retention, "_append_archive", failing_append)
+    db = FakeConnection([emotion(1, 40)])
+
+    with pytest.raises(OSError):
+        asyncio.run(retention.run_retention(db))
+    assert list(db.rows) == [1]
+    assert db.events == ["lock", "watermark", "unlock"]
+
+
+def test_skips_the_run_when_another_worker_holds_the_lock(fake_env):
+    db = FakeConnection([emotion(1, 40)], lock_free=False)
+
+    assert asyncio.run(retention.run_retention(db)) is None
+    assert db.watermark is None
+    assert list(db.rows) == [1]
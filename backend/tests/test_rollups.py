@@ -0,0 +1,66 @@
+import asyncio
+import re
+from datetime import datetime
+
+import pytest
+
+from utils import rollups
+from utils.rollups import DAY, HOUR, apply_rollups, bucket_start, subtract_rollups
+
+
+class FakeLabels:
+    async def ids(self, labels):
+        return {label: {"happy": 1, "sad": 2}[label] for label in labels}
+
+
+@pytest.fixture
+def upserts(monkeypatch):
+    """
+    Collect the counts each statement adds, per table in execution order.
+    """
+    tables = []
+
+    async def execute(query, values):
+        table = re.search(r"INSERT INTO (\w+)", query).group(1)
+        columns = re.search(r"\(([^)]*)\)", query).group(1).split(", ")
+        count = len(values) // len(columns)
+        tables.append((table, {tuple(values[f"{column}_{i}"] for column in columns[:-1]): values[f"count_{i}"]
+                               for i in range(count)}))
+
+    monkeypatch.setattr(rollups.database, "execute", execute)
+    monkeypatch.setattr(rollups, "emotion_labels", FakeLabels())
+    return tables
+
+
+def test_bucket_start_truncates_to_the_hour_and_day():
+    timestamp = datetime(2024, 3, 5, 14, 37, 12, 500)
+    assert bucket_start(timestamp, HOUR) == datetime(2024, 3, 5, 14)
+    assert bucket_start(timestamp, DAY) == datetime(2024, 3, 5)
+
+
+def test_apply_rollups_adds_to_every_counter_in_lock_order(upserts):
+    rows = [
+        {"user_id": 1, "emotion": "happy", "timestamp": datetime(2024, 3, 5, 14, 1)},
+        {"user_id": 1, "emotion": "happy", "timestamp": datetime(2024, 3, 5, 15, 2)},
+        {"user_id": 2, "emotion": "sad", "timestamp": datetime(2024, 3, 5, 14, 3)},
+    ]
+    asyncio.run(apply_rollups(rows))
+
+    assert [table for table, _ in upserts] == ["emotion_rollups", "emotion_user_totals", "emotion_totals"]
+    buckets, user_totals, totals = (counts for _, counts in upserts)
+    assert buckets[(1, DAY, datetime(2024, 3, 5), 1)] == 2
+    assert buckets[(1, HOUR, datetime(2024, 3, 5, 14), 1)] == 1
+    assert buckets[(1, HOUR, datetime(2024, 3, 5, 15), 1)] == 1
+    assert user_totals == {(1, 1): 2, (2, 2): 1}
+    assert totals == {(1,): 2, (2,): 1}
+
+
+def test_subtract_rollups_takes_deleted_rows_back_out(upserts):
+    asyncio.run(subtract_rollups([{"user_id": 1, "emotion_id": 2, "timestamp": datetime(2024, 3, 5, 14, 1)}]))
+    assert upserts[-1] == ("emotion_totals", {(2,): -1})
+    assert upserts[1] == ("emotion_user_totals", {(1, 2): -1})
+
+
+def test_nothing_is_written_for_an_empty_batch(upserts):
+    asyncio.run(subtract_rollups([]))
+    assert upserts == []
@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from starlette.requests import Request
+
+from utils import serialization
+from utils.emotion_history import shape_rows
+from utils.serialization import JSON, MSGPACK, FastJSONResponse, dumps, negotiate, render, to_columns
+
+ROWS = [(1, "happy", datetime(2024, 1, 1, 12, 0, 5), 0.5), (2, "sad", datetime(2024, 1, 2), None)]
+FIELDS = ("id", "emotion", "timestamp", "confidence")
+
+
+def request(accept=""):
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                    "headers": [(b"accept", accept.encode())]})
+
+
+def test_dumps_matches_the_standard_encoding_for_row_values():
+    payload = {"emotion": shape_rows(ROWS, FIELDS), "count": Decimal("3"), "mood": np.float64(0.25), 7: "key"}
+    assert json.loads(dumps(payload)) == {
+        "emotion": [
+            {"id": 1, "emotion": "happy", "timestamp": "2024-01-01T12:00:05", "confidence": 0.5},
+            {"id": 2, "emotion": "sad", "timestamp": "2024-01-02T00:00:00", "confidence": None},
+        ],
+        "count": 3.0,
+        "mood": 0.25,
+        "7": "key",
+    }
+
+
+def test_columns_layout_transposes_rows():
+    assert shape_rows(ROWS, FIELDS, "columns") == {
+        "id": [1, 2], "emotion": ["happy", "sad"], "timestamp": [ROWS[0][2], ROWS[1][2]], "confidence": [0.5, None],
+    }
+    assert to_columns([], FIELDS) == {field: [] for field in FIELDS}
+
+
+def test_json_is_served_unless_msgpack_is_accepted_and_installed(monkeypatch):
+    monkeypatch.setattr(serialization, "msgpack", None)
+    assert negotiate(request("application/msgpack")) == JSON
+    response = render(request(), {"ok": True}, headers={"ETag": "x"})
+    assert response.media_type == JSON
+    assert response.headers["vary"] == "Accept" and response.headers["etag"] == "x"
+    assert FastJSONResponse({"at": ROWS[1][2]}).body == b'{"at":"2024-01-02T00:00:00"}'
+
+
+def test_msgpack_keeps_timestamps_as_iso_strings():
+    msgpack = pytest.importorskip("msgpack")
+    response = render(request("application/msgpack;q=1, application/json;q=0.5"), {"emotion": shape_rows(ROWS, FIELDS)})
+    assert response.media_type == MSGPACK
+    assert msgpack.unpackb(response.body)["emotion"][0]["timestamp"] == "2024-01-01T12:00:05"
@@ -0,0 +1,85 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from utils import storage
+from utils.storage import (
+    IMMUTABLE_CACHE_CONTROL, ContentHashedStaticFiles, delete_image, save_base64, save_upload, thumbnail_for,
+)
+
+
+@pytest.fixture
+def face_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "FACE_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    monkeypatch.setattr(storage, "CHUNK_SIZE", 64)
+    monkeypatch.setattr(storage, "BASE64_CHUNK_SIZE", 64)
+    return tmp_path
+
+
+def png_bytes(color="red") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_identical_images_share_one_content_addressed_file(face_dir):
+    data = png_bytes()
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    from_base64 = asyncio.run(save_base64(base64.b64encode(data).decode()))
+    uploaded = asyncio.run(save_upload(UploadFile(io.BytesIO(data), filename="me.jpg")))
+
+    assert from_base64 == uploaded
+    assert uploaded.content_hash == content_hash
+    assert uploaded.path == f"face_data/{content_hash}.png"
+    assert sorted(os.listdir(face_dir)) == [f"{content_hash}.png", "thumbs"]
+    assert (face_dir / f"{content_hash}.png").read_bytes() == data
+
+
+def test_thumbnails_are_bounded_to_the_configured_size(face_dir):
+    stored = asyncio.run(save_base64(base64.b64encode(png_bytes()).decode()))
+    assert thumbnail_for(stored.path) == stored.thumbnail_path
+    with Image.open(face_dir / "thumbs" / f"{stored.content_hash}.jpg") as thumbnail:
+        assert max(thumbnail.size) == storage.settings.THUMBNAIL_SIZE
+    assert thumbnail_for("face_data/legacy_upload.png") is None
+
+
+def test_a_failed_decode_leaves_no_partial_file(face_dir):
+    with pytest.raises(ValueError):
+        asyncio.run(save_base64("not base64!" * 20))
+    assert [name for name in os.listdir(face_dir) if name.endswith(".part")] == []
+
+
+def test_delete_image_stays_inside_the_face_data_dir(face_dir, tmp_path_factory):
+    stored = asyncio.run(save_base64(base64.b64encode(png_bytes("blue")).decode()))
+    outside = tmp_path_factory.mktemp("outside") / "keep.png"
+    outside.write_bytes(b"x")
+
+    asyncio.run(delete_image(f"face_data/../../{outside.parent.name}/keep.png"))
+    asyncio.run(delete_image(stored.path))
+    assert outside.exists()
+    assert os.listdir(face_dir / "thumbs") == []
+    assert not (face_dir / os.path.basename(stored.path)).exists()
+
+
+def test_content_hashed_files_are_served_as_immutable(face_dir):
+    stored = asyncio.run(save_base64(base64.b64encode(png_bytes()).decode()))
+    (face_dir / "legacy.png").write_bytes(b"x")
+    client = TestClient(Starlette(routes=[Mount("/static", ContentHashedStaticFiles(directory=str(face_dir)))]))
+
+    response = client.get(f"/static/{os.path.basename(stored.path)}")
+    assert response.headers["etag"] == f'"{stored.content_hash}"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    revalidated = client.get(f"/static/{os.path.basename(stored.path)}", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert "cache-control" not in client.get("/static/legacy.png").headers
@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+
+from main import create_app
+from routes import user_routes
+from utils.jwt_handler import create_jwt
+
+
+def test_get_emotion_rejects_a_non_numeric_user_id():
+    # Validation fails before the handler runs, so no database is needed
+    client = TestClient(create_app())
+    response = client.get("/user/get_emotion", params={"user_id": "abc"})
+    assert response.status_code == 422
+    assert client.get("/user/get_emotion_stats", params={"user_id": "abc"}).status_code == 422
+    assert client.get("/user/get_emotion_stats").status_code == 422
+
+
+def test_add_emotion_rejects_unknown_and_overlong_labels():
+    client = TestClient(create_app())
+    for emotion in ["Happy", "x" * 51, ""]:
+        response = client.post("/user/add_emotion", json={"userId": 1, "emotion": emotion})
+        assert response.status_code == 422
+
+
+def bearer(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {create_jwt({'sub': f'user{user_id}@example.com', 'role': False, 'id': user_id})}"}
+
+
+def test_deletion_routes_only_act_on_the_callers_account(monkeypatch):
+    queued = []
+
+    async def fetch_val(query, values):
+        return {"a@example.com": 1, "b@example.com": 2}.get(values["email"])
+
+    async def enqueue_user_deletion(user_id):
+        queued.append(user_id)
+        return 10
+
+    async def enqueue_record_deletion(user_id, ids):
+        queued.append(user_id)
+        return 11
+
+    async def get_job(job_id):
+        return {"id": job_id, "kind": "user", "user_id": 1, "status": "queued", "rows_total": None,
+                "rows_deleted": 0, "error": None, "created_at": None, "updated_at": None, "finished_at": None}
+
+    monkeypatch.setattr(user_routes.database, "fetch_val", fetch_val)
+    monkeypatch.setattr(user_routes, "enqueue_user_deletion", enqueue_user_deletion)
+    monkeypatch.setattr(user_routes, "enqueue_record_deletion", enqueue_record_deletion)
+    monkeypatch.setattr(user_routes, "get_job", get_job)
+    client = TestClient(create_app())
+
+    assert client.delete("/user/delete", params={"email": "a@example.com"}).status_code == 422
+    assert client.delete("/user/delete", params={"email": "b@example.com"}, headers=bearer(1)).status_code == 403
+    assert client.request("DELETE", "/user/remove", json={"email": "b@example.com", "ids": [5]},
+                          headers=bearer(1)).status_code == 403
+    assert client.get("/user/deletion_status", params={"job_id": 10}, headers=bearer(2)).status_code == 404
+    assert queued == []
+
+    assert client.delete("/user/delete", params={"email": "a@example.com"}, headers=bearer(1)).json()["job_id"] == 10
+    assert client.request("DELETE", "/user/remove", json={"email": "a@example.com", "ids": [5]},
+                          headers=bearer(1)).json()["job_id"] == 11
+    assert client.get("/user/deletion_status", params={"job_id": 10}, headers=bearer(1)).json()["status"] == "queued"
+    assert queued == [1, 1]
+
+
+def test_face_descriptor_is_only_served_with_a_calibrated_threshold(monkeypatch):
+    blob = bytes(512)
+
+    async def fetch_one(query, values):
+        return {"face_descriptor": blob, "face_image_hash": "abc"}
+
+    monkeypatch.setattr(user_routes.database, "fetch_one", fetch_one)
+    client = TestClient(create_app())
+
+    monkeypatch.setattr(user_routes.settings, "FACE_SERVER_DESCRIPTOR_THRESHOLD", None)
+    assert client.get("/user/get_face_descriptor", headers=bearer(1)).status_code == 404
+
+    monkeypatch.setattr(user_routes.settings, "FACE_SERVER_DESCRIPTOR_THRESHOLD", 0.5)
+    response = client.get("/user/get_face_descriptor", headers=bearer(1))
+    assert response.content == blob
+    assert response.headers["x-match-threshold"] == "0.5"
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from pymysql.err import IntegrityError, OperationalError
+
+import utils.write_buffer as write_buffer
+from utils.write_buffer import BufferStopped, EmotionWriteBuffer
+
+
+def test_failed_flush_drops_only_the_bad_rows(monkeypatch):
+    written = []
+
+    async def fake_write(rows):
+        if any(row["user_id"] == 999 for row in rows):
+            raise IntegrityError(1452, "foreign key constraint fails")
+        written.extend(rows)
+        return len(rows)
+
+    monkeypatch.setattr(write_buffer, "write_emotions", fake_write)
+    buffer = EmotionWriteBuffer(capacity=100, batch_size=50, flush_interval_ms=10, block_when_full=False)
+    batch = [{"user_id": 999 if i in (3, 17) else i, "emotion": "happy"} for i in range(20)]
+
+    asyncio.run(buffer._flush(batch))
+
+    assert [row["user_id"] for row in written] == [i for i in range(20) if i not in (3, 17)]
+    assert buffer.rows_flushed == 18
+    assert buffer.rows_failed == 2
+    assert buffer.flushes == 1
+
+
+def test_connection_errors_retry_the_whole_batch(monkeypatch):
+    calls = []
+
+    async def flaky_write(rows):
+        calls.append(len(rows))
+        if len(calls) <= 2:
+            raise OperationalError(2013, "Lost connection to MySQL server during query")
+        return len(rows)
+
+    monkeypatch.setattr(write_buffer, "write_emotions", flaky_write)
+    monkeypatch.setattr(write_buffer, "RETRY_BASE_SECONDS", 0)
+    buffer = EmotionWriteBuffer(capacity=100, batch_size=50, flush_interval_ms=10, block_when_full=False)
+
+    asyncio.run(buffer._flush([{"user_id": i, "emotion": "happy"} for i in range(20)]))
+
+    assert calls == [20, 20, 20]
+    assert (buffer.rows_flushed, buffer.rows_failed, buffer.batch_splits, buffer.batch_retries) == (20, 0, 0, 2)
+
+
+def test_stop_flushes_rows_waiting_for_space_and_refuses_new_ones(monkeypatch):
+    written = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def slow_write(rows):
+            await gate.wait()
+            written.extend(row["user_id"] for row in rows)
+            return len(rows)
+
+        monkeypatch.setattr(write_buffer, "write_emotions", slow_write)
+        buffer = EmotionWriteBuffer(capacity=1, batch_size=1, flush_interval_ms=10, block_when_full=True)
+        await buffer.start()
+        await buffer.enqueue({"user_id": 1})
+        await asyncio.sleep(0)  # the writer takes row 1 and waits on the gate
+        await buffer.enqueue({"user_id": 2})
+        waiting = asyncio.create_task(buffer.enqueue({"user_id": 3}))
+        await asyncio.sleep(0)
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0)
+        with pytest.raises(BufferStopped):
+            await buffer.enqueue({"user_id": 4})
+        gate.set()
+        await asyncio.gather(waiting, stopping)
+
+    asyncio.run(run())
+    assert written == [1, 2, 3]
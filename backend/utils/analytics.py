@@ -0,0 +1,288 @@
+"""
+Mood analytics shared by the user and admin routers.
+
+Rows are pulled in columnar form (one NumPy array per column) and every statistic is
+computed with vectorized operations instead of per-row Python loops. Emotion labels are
+scored with one valence mapping, EMOTION_VALENCE in Settings, which defaults to the seven
+face-api.js expression labels.
+
+Per-day statistics read the daily rollups; only transition matrices need raw rows.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import database, settings
+from utils.emotion_labels import emotion_labels
+
+DEFAULT_WINDOW_DAYS = 90
+
+
+@dataclass
+class DailyColumns:
+    user_ids: np.ndarray  # int64
+    days: np.ndarray  # datetime64[D]
+    codes: np.ndarray  # index into labels
+    counts: np.ndarray  # int64
+    labels: List[str]
+
+
+def valence_of(labels) -> np.ndarray:
+    valence = settings.EMOTION_VALENCE
+    return np.array([valence.get(label, 0.0) for label in labels], dtype=np.float64)
+
+
+def summarize_counts(counts: Dict[str, int]) -> dict:
+    """
+    Dominant emotion, positive/negative totals and overall mood for a label -> count map.
+    """
+    labels = list(counts)
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(labels))
+    valence = valence_of(labels)
+    total = values.sum()
+
+    positive_count = int(values[valence > 0].sum())
+    negative_count = int(values[valence < 0].sum())
+    mood_balance = "Neutral"
+    if positive_count > negative_count:
+        mood_balance = "Positive"
+    elif negative_count > positive_count:
+        mood_balance = "Negative"
+
+    return {
+        "dominant_emotion": labels[int(values.argmax())] if labels else None,
+        "mood_balance": mood_balance,
+        "positive_count": positive_count,
+        "negative_count": negative_count,
+        "mood_score": float(values @ valence / total) if total else 0.0,
+    }
+
+
+def default_window(start: Optional[datetime], end: Optional[datetime]):
+    if start is None:
+        start = (end or datetime.utcnow()) - timedelta(days=DEFAULT_WINDOW_DAYS)
+    return start, end
+
+
+async def fetch_daily_columns(user_id: Optional[int], start: datetime, end: Optional[datetime]) -> DailyColumns:
+    """
+    Daily per-emotion counts from the rollups, for one user or everyone.
+    """
+    conditions = ["granularity = 'day'", "bucket_start >= :start"]
+    values = {"start": start.replace(hour=0, minute=0, second=0, microsecond=0)}
+    if user_id is not None:
+        conditions.append("user_id = :user_id")
+        values["user_id"] = user_id
+    if end is not None:
+        conditions.append("bucket_start < :end")
+        values["end"] = end
+
+    query = f"""
+        SELECT user_id, DATEDIFF(bucket_start, '1970-01-01') AS day, emotion_id, count
+        FROM emotion_rollups
+        WHERE {" AND ".join(conditions)} AND count > 0
+    """
+    rows = await database.fetch_all(query, values)
+    labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+    return _daily_columns(
+        [row["user_id"] for row in rows],
+        [row["day"] for row in rows],
+        [labels[row["emotion_id"]] for row in rows],
+        [row["count"] for row in rows],
+    )
+
+
+def _daily_columns(user_ids, epoch_days, emotions, counts) -> DailyColumns:
+    labels, codes = encode_labels(emotions)
+    return DailyColumns(
+        user_ids=np.asarray(user_ids, dtype=np.int64),
+        days=np.asarray(epoch_days, dtype=np.int64).astype("datetime64[D]"),
+        codes=codes,
+        counts=np.asarray(counts, dtype=np.int64),
+        labels=labels,
+    )
+
+
+def encode_labels(emotions):
+    """
+    Dictionary-encode a sequence of labels into (sorted labels, int64 codes).
+    Much cheaper than np.unique on an object array for the handful of labels we have.
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(emotion, len(index)) for emotion in emotions),
+                        dtype=np.int64, count=len(emotions))
+    labels = sorted(index)
+    remap = np.array([labels.index(label) for label in index], dtype=np.int64)
+    return labels, remap[codes] if len(codes) else codes
+
+
+def label_totals(columns: DailyColumns) -> Dict[str, int]:
+    totals = np.bincount(columns.codes, weights=columns.counts, minlength=len(columns.labels))
+    return dict(zip(columns.labels, totals.astype(np.int64).tolist()))
+
+
+def _calendar_index(days: np.ndarray):
+    """
+    Map days onto a dense calendar from the first to the last day with data.
+    """
+    first = days.min()
+    index = (days - first).astype(np.int64)
+    calendar = first + np.arange(index.max() + 1)
+    return index, calendar
+
+
+def _nan_to_none(values: np.ndarray):
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def daily_distribution(columns: DailyColumns) -> dict:
+    """
+    Emotion counts per calendar day as a (days x labels) matrix.
+    """
+    if len(columns.counts) == 0:
+        return {"days": [], "labels": columns.labels, "counts": []}
+    index, calendar = _calendar_index(columns.days)
+    matrix = np.zeros((len(calendar), len(columns.labels)), dtype=np.int64)
+    np.add.at(matrix, (index, columns.codes), columns.counts)
+    return {"days": calendar.astype(str).tolist(), "labels": columns.labels, "counts": matrix.tolist()}
+
+
+def mood_series(columns: DailyColumns, window: int) -> dict:
+    """
+    Mean valence per calendar day and its rolling mean over `window` days.
+    Days without data are null in the daily series and skipped by the rolling mean.
+    """
+    if len(columns.counts) == 0:
+        return {"days": [], "mood": [], "rolling_mood": []}
+    index, calendar = _calendar_index(columns.days)
+    weights = columns.counts * valence_of(columns.labels)[columns.codes]
+    sums = np.bincount(index, weights=weights, minlength=len(calendar))
+    totals = np.bincount(index, weights=columns.counts, minlength=len(calendar))
+
+    cumulative_sums = np.concatenate(([0.0], np.cumsum(sums)))
+    cumulative_totals = np.concatenate(([0.0], np.cumsum(totals)))
+    starts = np.maximum(np.arange(1, len(calendar) + 1) - window, 0)
+    ends = np.arange(1, len(calendar) + 1)
+    window_sums = cumulative_sums[ends] - cumulative_sums[starts]
+    window_totals = cumulative_totals[ends] - cumulative_totals[starts]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = np.where(totals > 0, sums / totals, np.nan)
+        rolling = np.where(window_totals > 0, window_sums / window_totals, np.nan)
+    return {"days": calendar.astype(str).tolist(), "mood": _nan_to_none(daily), "rolling_mood": _nan_to_none(rolling)}
+
+
+def _runs(mask: np.ndarray):
+    """
+    Longest run of True values and the length of the run ending at the last element.
+    """
+    if not mask.any():
+        return 0, 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    current = int(lengths[-1]) if ends[-1] == len(mask) else 0
+    return int(lengths.max()), current
+
+
+def streaks(columns: DailyColumns) -> dict:
+    """
+    Longest and current streaks of recording days, positive-mood days and negative-mood days.
+    """
+    if len(columns.counts) == 0:
+        empty = {"longest": 0, "current": 0}
+        return {"recording": empty, "positive": empty, "negative": empty}
+    index, calendar = _calendar_index(columns.days)
+    weights = columns.counts * valence_of(columns.labels)[columns.codes]
+    sums = np.bincount(index, weights=weights, minlength=len(calendar))
+    totals = np.bincount(index, weights=columns.counts, minlength=len(calendar))
+
+    result = {}
+    for name, mask in (("recording", totals > 0), ("positive", sums > 0), ("negative", sums < 0)):
+        longest, current = _runs(mask)
+        result[name] = {"longest": longest, "current": current}
+    return result
+
+
+async def fetch_transition_matrix(user_id: int, start: datetime, end: Optional[datetime]) -> dict:
+    """
+    Counts and row-normalized probabilities of moving from one recorded emotion to the next.
+    """
+    conditions = ["user_id = :user_id", "timestamp >= :start"]
+    values = {"user_id": user_id, "start": start}
+    if end is not None:
+        conditions.append("timestamp < :end")
+        values["end"] = end
+    query = f"""
+        SELECT emotion_id FROM emotions
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp, id
+    """
+    rows = await database.fetch_all(query, values)
+    labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+    return transition_matrix([labels[row["emotion_id"]] for row in rows])
+
+
+def transition_matrix(emotions) -> dict:
+    if len(emotions) == 0:
+        return {"labels": [], "counts": [], "probabilities": []}
+    labels, codes = encode_labels(emotions)
+    size = len(labels)
+    counts = np.bincount(codes[:-1] * size + codes[1:], minlength=size * size).reshape(size, size)
+    row_totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = np.where(row_totals > 0, counts / row_totals, 0.0)
+    return {
+        "labels": labels,
+        "counts": counts.tolist(),
+        "probabilities": probabilities.round(4).tolist(),
+    }
+
+
+async def fetch_cohorts():
+    """
+    Sorted user ids and their cohort (signup month) labels.
+    """
+    rows = await database.fetch_all("""
+        SELECT id, DATE_FORMAT(account_created, '%Y-%m') AS cohort
+        FROM users
+        ORDER BY id
+    """)
+    return (np.asarray([row["id"] for row in rows], dtype=np.int64),
+            np.asarray([row["cohort"] or "unknown" for row in rows], dtype=object))
+
+
+def cohort_comparison(columns: DailyColumns, user_ids: np.ndarray, user_cohorts: np.ndarray) -> list:
+    """
+    Per signup-month cohort: active users, emotion totals, mean mood and label distribution.
+    """
+    if len(columns.counts) == 0 or len(user_ids) == 0:
+        return []
+    positions = np.clip(np.searchsorted(user_ids, columns.user_ids), 0, len(user_ids) - 1)
+    known = user_ids[positions] == columns.user_ids
+    cohort_labels, cohort_codes = encode_labels(user_cohorts[positions[known]])
+    counts = columns.counts[known]
+    codes = columns.codes[known]
+    size = len(cohort_labels)
+
+    totals = np.bincount(cohort_codes, weights=counts, minlength=size)
+    mood = np.bincount(cohort_codes, weights=counts * valence_of(columns.labels)[codes], minlength=size)
+    distribution = np.zeros((size, len(columns.labels)))
+    np.add.at(distribution, (cohort_codes, codes), counts)
+    pairs = np.unique(np.stack([cohort_codes, columns.user_ids[known]]), axis=1)
+    active_users = np.bincount(pairs[0], minlength=size)
+
+    return [
+        {
+            "cohort": str(cohort_labels[i]),
+            "active_users": int(active_users[i]),
+            "total": int(totals[i]),
+            "mood_score": float(mood[i] / totals[i]) if totals[i] else 0.0,
+            "distribution": dict(zip(columns.labels, (distribution[i] / totals[i]).round(4).tolist()))
+            if totals[i] else {},
+        }
+        for i in range(size)
+    ]
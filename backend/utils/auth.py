@@ -0,0 +1,99 @@
+"""
+Shared FastAPI auth dependencies.
+
+Verified token claims are cached by SHA-256 of the token until the earlier of the token's
+`exp` and AUTH_TOKEN_CACHE_TTL, so repeat requests skip the HMAC check. User rows are
+cached for AUTH_USER_CACHE_TTL seconds and must be invalidated on profile changes.
+"""
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Query
+
+from config import database, settings
+from utils.jwt_handler import decode_jwt
+from utils.ttl_cache import TTLCache
+
+token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+user_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def verify_token(token: str) -> dict:
+    """
+    Return the claims of a valid token, using the cache when possible.
+    Raises 401 for invalid or expired tokens.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        if claims.get("exp", 0) > time.time():
+            return claims
+        token_cache.pop(key)
+
+    claims = decode_jwt(token)
+    if not claims:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.set(key, claims, ttl=claims.get("exp", 0) - time.time())
+    return claims
+
+
+async def get_token_claims(authorization: str = Header(..., description="Authorization token")) -> dict:
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    return verify_token(authorization.split(" ")[1])
+
+
+async def require_admin(claims: dict = Depends(get_token_claims)) -> dict:
+    if not claims.get("role"):
+        raise HTTPException(status_code=403, detail="Access forbidden: Admins only")
+    return claims
+
+
+async def require_admin_query_token(
+        token: str = Query(..., description="Access token, for clients that cannot set headers (WebSocket, EventSource)"),
+) -> dict:
+    return await require_admin(verify_token(token))
+
+
+async def require_metrics_access(authorization: Optional[str] = Header(None)):
+    """
+    Allow METRICS_TOKEN as a bearer token, otherwise require an admin token.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    token = authorization.split(" ")[1]
+    if settings.METRICS_TOKEN and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return
+    await require_admin(verify_token(token))
+
+
+async def get_current_user_record(claims: dict = Depends(get_token_claims)) -> dict:
+    """
+    Return the id, name, email, face_data_path and isAdmin of the token's user.
+    """
+    user_id = claims.get("id")
+    user = user_cache.get(user_id)
+    if user is not None:
+        return dict(user)
+
+    query = """
+            SELECT id, name, email, face_data_path, isAdmin
+            FROM users
+            WHERE id = :user_id
+        """
+    result = await database.fetch_one(query, {"user_id": user_id})
+    if not result:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = dict(result)
+    user_cache.set(user_id, user)
+    return dict(user)
+
+
+def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+
+
+def auth_cache_metrics() -> dict:
+    return {"token_cache": token_cache.stats(), "user_cache": user_cache.stats()}
@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Convert an aware datetime to naive UTC, the form stored in the database.
+    Naive values are assumed to already be UTC and are returned unchanged.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,359 @@
+"""
+Background account and record deletion.
+
+Deleting a user used to be one `DELETE FROM users` whose ON DELETE CASCADE removed every
+emotion row in a single transaction, holding row locks that stalled concurrent writers for
+as long as it took. Deletions are now queued in `deletion_jobs` and carried out here:
+
+* kind 'user'    - all of a user's emotions, then their per-user rollups, then the user row
+                   and, when no other account shares it, their face image and thumbnail
+* kind 'records' - the emotion ids listed in `deletion_job_items`, if they belong to the user
+
+Emotions are deleted DELETION_BATCH_SIZE at a time, each batch in its own short transaction
+that also takes the rows out of the rollups (utils.rollups.subtract_rollups) and records the
+job's progress, with a DELETION_BATCH_PAUSE_MS pause between batches. A job interrupted by a
+restart picks up where its last committed batch left off. A failed batch is retried on the
+next poll, up to DELETION_MAX_ATTEMPTS times, before the job is marked failed.
+
+The worker started in main.startup polls for queued jobs every DELETION_POLL_SECONDS (and
+immediately after an enqueue in the same process); a MySQL named lock keeps a job from being
+run by two workers at once.
+
+    python -m utils.deletion_jobs run      # work through the queue now
+    python -m utils.deletion_jobs status   # count jobs by status
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import Iterable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from config import database, settings
+from utils.auth import invalidate_user
+from utils.face_descriptors import record_descriptor_change
+from utils.face_index import face_index
+from utils.migrations import run_migrations
+from utils.read_replicas import read_router
+from utils.response_cache import response_cache
+from utils.rollups import remove_user_rollups, subtract_rollups
+from utils.storage import delete_image
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = "emotion_tracker_deletions"
+USER = "user"
+RECORDS = "records"
+ACTIVE_STATUSES = ("queued", "running")
+
+# Rows per multi-row INSERT of job items
+ITEM_CHUNK_SIZE = 1000
+
+JOB_COLUMNS = """
+    id, kind, user_id, status, rows_total, rows_deleted, cursor_id, attempts, error,
+    created_at, updated_at, finished_at
+"""
+
+
+def _in_clause(name: str, values) -> tuple:
+    params = {f"{name}_{i}": value for i, value in enumerate(values)}
+    return ", ".join(":" + key for key in params), params
+
+
+async def get_job(job_id: int, db=database):
+    return await db.fetch_one(f"SELECT {JOB_COLUMNS} FROM deletion_jobs WHERE id = :id", {"id": job_id})
+
+
+async def enqueue_user_deletion(user_id: int, db=database) -> int:
+    """
+    Queue the deletion of a user and all their data. Returns the job id; a user who already
+    has a deletion queued or running gets that job back.
+    """
+    statuses, values = _in_clause("status", ACTIVE_STATUSES)
+    existing = await db.fetch_val(f"""
+        SELECT id FROM deletion_jobs
+        WHERE user_id = :user_id AND kind = 'user' AND status IN ({statuses})
+        ORDER BY id LIMIT 1
+    """, {"user_id": user_id, **values})
+    if existing:
+        return existing
+    rows_total = await db.fetch_val("SELECT COUNT(*) FROM emotions WHERE user_id = :user_id", {"user_id": user_id})
+    job_id = await db.execute("""
+        INSERT INTO deletion_jobs (kind, user_id, rows_total) VALUES ('user', :user_id, :rows_total)
+    """, {"user_id": user_id, "rows_total": rows_total})
+    deletion_worker.wake()
+    return job_id
+
+
+async def enqueue_record_deletion(user_id: int, record_ids: Iterable[int], db=database) -> int:
+    """
+    Queue the deletion of some of a user's emotion records. Returns the job id.
+    """
+    record_ids = sorted(set(record_ids))
+    async with db.transaction():
+        job_id = await db.execute("""
+            INSERT INTO deletion_jobs (kind, user_id, rows_total) VALUES ('records', :user_id, :rows_total)
+        """, {"user_id": user_id, "rows_total": len(record_ids)})
+        for start in range(0, len(record_ids), ITEM_CHUNK_SIZE):
+            chunk = record_ids[start:start + ITEM_CHUNK_SIZE]
+            values = {"job_id": job_id}
+            values.update({f"record_id_{i}": record_id for i, record_id in enumerate(chunk)})
+            placeholders = ", ".join(f"(:job_id, :record_id_{i})" for i in range(len(chunk)))
+            await db.execute(f"INSERT INTO deletion_job_items (job_id, record_id) VALUES {placeholders}", values)
+    deletion_worker.wake()
+    return job_id
+
+
+async def _delete_batch(connection, rows) -> int:
+    """
+    Delete selected emotion rows and take them out of the rollups, inside the batch transaction.
+    """
+    if rows:
+        ids, values = _in_clause("id", [row["id"] for row in rows])
+        await connection.execute(f"DELETE FROM emotions WHERE id IN ({ids})", values)
+        await subtract_rollups(rows)
+    return len(rows)
+
+
+async def _run_user_job(connection, job, worker) -> int:
+    user_id = job["user_id"]
+    deleted = 0
+    # Oldest first along (user_id, timestamp); rows written while the job runs are picked up too
+    while True:
+        async with connection.transaction():
+            rows = await connection.fetch_all("""
+                SELECT id, user_id, emotion_id, timestamp FROM emotions
+                WHERE user_id = :user_id
+                ORDER BY timestamp
+                LIMIT :limit
+                FOR UPDATE
+            """, {"user_id": user_id, "limit": settings.DELETION_BATCH_SIZE})
+            if not rows:
+                break
+            count = await _delete_batch(connection, rows)
+            await connection.execute(
+                "UPDATE deletion_jobs SET rows_deleted = rows_deleted + :count WHERE id = :id",
+                {"count": count, "id": job["id"]},
+            )
+        deleted += count
+        worker.batch_done(count)
+        await asyncio.sleep(settings.DELETION_BATCH_PAUSE_MS / 1000)
+
+    # Hourly and daily buckets left over (history before the retention watermark has no raw rows)
+    while True:
+        await connection.execute("DELETE FROM emotion_rollups WHERE user_id = :user_id LIMIT :limit",
+                                 {"user_id": user_id, "limit": settings.DELETION_BATCH_SIZE})
+        if not await connection.fetch_val("SELECT ROW_COUNT()"):
+            break
+        await asyncio.sleep(settings.DELETION_BATCH_PAUSE_MS / 1000)
+
+    async with connection.transaction():
+        user = await connection.fetch_one("SELECT face_data_path FROM users WHERE id = :user_id FOR UPDATE",
+                                          {"user_id": user_id})
+        if user is not None:
+            await remove_user_rollups(user_id)
+            await connection.execute("DELETE FROM users WHERE id = :user_id", {"user_id": user_id})
+            await record_descriptor_change(user_id, connection)
+        await _finish(connection, job)
+
+    invalidate_user(user_id)
+    await run_in_threadpool(face_index.remove, user_id)
+    if user is not None and user["face_data_path"]:
+        shared = await connection.fetch_val("SELECT COUNT(*) FROM users WHERE face_data_path = :path",
+                                            {"path": user["face_data_path"]})
+        if not shared:
+            await delete_image(user["face_data_path"])
+    return deleted
+
+
+async def _run_records_job(connection, job, worker) -> int:
+    after = job["cursor_id"]
+    deleted = 0
+    while True:
+        async with connection.transaction():
+            record_ids = [row["record_id"] for row in await connection.fetch_all("""
+                SELECT record_id FROM deletion_job_items
+                WHERE job_id = :job_id AND record_id > :after
+                ORDER BY record_id
+                LIMIT :limit
+            """, {"job_id": job["id"], "after": after, "limit": settings.DELETION_BATCH_SIZE})]
+            if not record_ids:
+                break
+            ids, values = _in_clause("id", record_ids)
+            rows = await connection.fetch_all(f"""
+                SELECT id, user_id, emotion_id, timestamp FROM emotions
+                WHERE user_id = :user_id AND id IN ({ids})
+                FOR UPDATE
+            """, {"user_id": job["user_id"], **values})
+            count = await _delete_batch(connection, rows)
+            after = record_ids[-1]
+            await connection.execute("""
+                UPDATE deletion_jobs SET rows_deleted = rows_deleted + :count, cursor_id = :after WHERE id = :id
+            """, {"count": count, "after": after, "id": job["id"]})
+        deleted += count
+        worker.batch_done(count)
+        if count:
+            read_router.mark_write([job["user_id"]])
+        await asyncio.sleep(settings.DELETION_BATCH_PAUSE_MS / 1000)
+
+    async with connection.transaction():
+        await connection.execute("DELETE FROM deletion_job_items WHERE job_id = :id", {"id": job["id"]})
+        await _finish(connection, job)
+    return deleted
+
+
+async def _finish(connection, job):
+    await connection.execute("""
+        UPDATE deletion_jobs SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = :id
+    """, {"id": job["id"]})
+
+
+JOB_RUNNERS = {
+    USER: _run_user_job,
+    RECORDS: _run_records_job,
+}
+
+
+async def run_deletion_jobs(worker=None, db=database) -> Optional[int]:
+    """
+    Run queued and interrupted jobs, oldest first, until none are left.
+    Returns the number of emotion rows deleted, or None when another worker holds the lock.
+    """
+    worker = worker or deletion_worker
+    async with db.connection() as connection:
+        if not await connection.fetch_val("SELECT GET_LOCK(:name, 0)", {"name": LOCK_NAME}):
+            return None
+        deleted = 0
+        after_id = 0
+        try:
+            # One pass over the queue in id order; a job that fails is retried on the next pass
+            while True:
+                statuses, values = _in_clause("status", ACTIVE_STATUSES)
+                job = await connection.fetch_one(f"""
+                    SELECT {JOB_COLUMNS} FROM deletion_jobs
+                    WHERE status IN ({statuses}) AND id > :after_id
+                    ORDER BY id LIMIT 1
+                """, {**values, "after_id": after_id})
+                if job is None:
+                    break
+                after_id = job["id"]
+                await connection.execute(
+                    "UPDATE deletion_jobs SET status = 'running', attempts = attempts + 1 WHERE id = :id",
+                    {"id": job["id"]},
+                )
+                try:
+                    deleted += await JOB_RUNNERS[job["kind"]](connection, job, worker)
+                    worker.jobs_completed += 1
+                except Exception as e:
+                    worker.failures += 1
+                    logger.exception("Deletion job %d failed", job["id"])
+                    failed = job["attempts"] + 1 >= settings.DELETION_MAX_ATTEMPTS
+                    await connection.execute(
+                        "UPDATE deletion_jobs SET status = :status, error = :error WHERE id = :id",
+                        {"status": "failed" if failed else "running", "error": repr(e)[:255], "id": job["id"]},
+                    )
+        finally:
+            await connection.execute("SELECT RELEASE_LOCK(:name)", {"name": LOCK_NAME})
+    if deleted:
+        await response_cache.invalidate()
+    return deleted
+
+
+class DeletionWorker:
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._task = None
+        self._wake = None
+        self.runs = 0
+        self.failures = 0
+        self.jobs_completed = 0
+        self.batches = 0
+        self.rows_deleted = 0
+        self.last_batch_rows = 0
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop between batches; the job in progress resumes from its last batch on the next start.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def batch_done(self, rows: int):
+        self.batches += 1
+        self.rows_deleted += rows
+        self.last_batch_rows = rows
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await run_deletion_jobs(self)
+                self.runs += 1
+            except Exception:
+                self.failures += 1
+                logger.exception("Deletion worker run failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "jobs_completed": self.jobs_completed,
+            "batches": self.batches,
+            "rows_deleted": self.rows_deleted,
+            "last_batch_rows": self.last_batch_rows,
+        }
+
+
+deletion_worker = DeletionWorker(settings.DELETION_POLL_SECONDS)
+
+
+async def _main(argv):
+    if argv[1:] not in (["run"], ["status"]):
+        print("usage: python -m utils.deletion_jobs [run|status]")
+        return 2
+    await database.connect()
+    try:
+        await run_migrations()
+        if argv[1] == "run":
+            started = time.perf_counter()
+            deleted = await run_deletion_jobs()
+            if deleted is None:
+                print("Another worker is running deletion jobs")
+            else:
+                print(f"Deleted {deleted} emotions in {time.perf_counter() - started:.1f} s")
+        else:
+            rows = await database.fetch_all("""
+                SELECT status, COUNT(*) AS jobs, SUM(rows_deleted) AS rows_deleted
+                FROM deletion_jobs GROUP BY status
+            """)
+            if not rows:
+                print("No deletion jobs")
+            for row in rows:
+                print(f"{row['status']:<8} {row['jobs']} jobs, {row['rows_deleted']} rows deleted")
+    finally:
+        await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
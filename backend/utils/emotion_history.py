@@ -0,0 +1,138 @@
+"""
+Windowed reads of a single user's emotion history.
+
+Raw rows are paged with a keyset cursor on (timestamp, id); hourly and daily views are read
+from the emotion_rollups table, so their cost depends on the number of buckets in the window
+and not on how many emotions the user has recorded.
+
+Raw rows before the retention watermark have been archived, so raw reads stop at the
+watermark and callers add daily summaries for the part of the window before it.
+
+Every read takes the database to run on, so callers can send it to a read replica.
+Raw rows come back as one dict per row or, with layout="columns", one list per field.
+"""
+from datetime import datetime
+from typing import Optional
+
+from config import database
+from utils.emotion_labels import emotion_labels
+from utils.pagination import encode_cursor, decode_cursor
+from utils.rollups import HOUR, DAY, bucket_start
+from utils.serialization import to_columns
+
+RESOLUTIONS = {"hourly": HOUR, "daily": DAY}
+
+RAW_FIELDS = ("id", "emotion", "timestamp", "confidence")
+
+# Upper bound on the daily summaries returned for the compacted part of a window (~10 years)
+MAX_SUMMARY_DAYS = 3660
+
+
+def shape_rows(items, fields, layout: str = "rows"):
+    """
+    Row tuples as a list of dicts, or as one list per field for layout="columns".
+    """
+    if layout == "columns":
+        return to_columns(items, fields)
+    return [dict(zip(fields, item)) for item in items]
+
+
+async def fetch_raw_history(user_id: int, start: Optional[datetime], end: Optional[datetime],
+                            limit: int, cursor: Optional[str], descending: bool, db=database,
+                            layout: str = "rows"):
+    """
+    Return one page of raw emotions in [start, end) and the cursor for the next page.
+    """
+    conditions = ["user_id = :user_id"]
+    values = {"user_id": user_id, "limit": limit}
+    if start is not None:
+        conditions.append("timestamp >= :start")
+        values["start"] = start
+    if end is not None:
+        conditions.append("timestamp < :end")
+        values["end"] = end
+    if cursor:
+        after_timestamp, after_id = decode_cursor(cursor, 2)
+        op = "<" if descending else ">"
+        conditions.append(f"(timestamp {op} :after_timestamp OR (timestamp = :after_timestamp AND id {op} :after_id))")
+        values.update({"after_timestamp": after_timestamp, "after_id": after_id})
+
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+        SELECT id, emotion_id, timestamp, confidence
+        FROM emotions
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp {direction}, id {direction}
+        LIMIT :limit
+    """
+    rows = await db.fetch_all(query, values)
+    labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    items = [(row["id"], labels[row["emotion_id"]], row["timestamp"], row["confidence"]) for row in rows]
+    return shape_rows(items, RAW_FIELDS, layout), next_cursor
+
+
+async def fetch_bucketed_history(user_id: int, resolution: str, start: Optional[datetime],
+                                 end: Optional[datetime], limit: int, cursor: Optional[str],
+                                 descending: bool, db=database):
+    """
+    Return up to `limit` hourly or daily buckets in [start, end), each with counts per emotion.
+    """
+    granularity = RESOLUTIONS[resolution]
+    conditions = ["user_id = :user_id", "granularity = :granularity"]
+    values = {"user_id": user_id, "granularity": granularity, "limit": limit}
+    if start is not None:
+        conditions.append("bucket_start >= :start")
+        values["start"] = bucket_start(start, granularity)
+    if end is not None:
+        conditions.append("bucket_start < :end")
+        values["end"] = end
+    if cursor:
+        (after,) = decode_cursor(cursor, 1)
+        conditions.append(f"bucket_start {'<' if descending else '>'} :after")
+        values["after"] = after
+
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+        SELECT r.bucket_start, r.emotion_id, r.count
+        FROM emotion_rollups r
+        JOIN (
+            SELECT DISTINCT bucket_start
+            FROM emotion_rollups
+            WHERE {" AND ".join(conditions)}
+            ORDER BY bucket_start {direction}
+            LIMIT :limit
+        ) AS page ON page.bucket_start = r.bucket_start
+        WHERE r.user_id = :user_id AND r.granularity = :granularity AND r.count > 0
+        ORDER BY r.bucket_start {direction}
+    """
+    rows = await db.fetch_all(query, values)
+    labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+
+    buckets = []
+    for row in rows:
+        if not buckets or buckets[-1]["bucket_start"] != row["bucket_start"]:
+            buckets.append({"bucket_start": row["bucket_start"], "total": 0, "counts": {}})
+        buckets[-1]["counts"][labels[row["emotion_id"]]] = row["count"]
+        buckets[-1]["total"] += row["count"]
+
+    next_cursor = None
+    if len(buckets) == limit:
+        next_cursor = encode_cursor(buckets[-1]["bucket_start"])
+    return buckets, next_cursor
+
+
+async def fetch_daily_summaries(user_id: int, start: Optional[datetime], end: Optional[datetime],
+                                watermark: Optional[datetime], descending: bool = False, db=database):
+    """
+    Daily buckets for the part of [start, end) that lies before the retention watermark.
+    """
+    if watermark is None or (start is not None and start >= watermark):
+        return []
+    end = watermark if end is None else min(end, watermark)
+    buckets, _ = await fetch_bucketed_history(user_id, "daily", start, end, MAX_SUMMARY_DAYS, None, descending,
+                                              db)
+    return buckets
@@ -0,0 +1,69 @@
+"""
+Label <-> id map for the emotion_labels lookup table.
+
+Emotions and their rollups store a SMALLINT emotion_id instead of the label string. The map
+is loaded once at startup; writers translate labels to ids and readers translate ids back,
+so API payloads still carry labels. A label the map hasn't seen (a new one, or one added by
+another worker) costs one round trip and is cached from then on. Labels are case-sensitive
+(binary collation, migration v008).
+"""
+from typing import Dict, Iterable
+
+from config import database
+
+# face-api.js expressions, seeded first so they get the lowest ids
+DEFAULT_LABELS = ["neutral", "happy", "sad", "angry", "fearful", "disgusted", "surprised"]
+MAX_LABEL_LENGTH = 50
+
+
+class EmotionLabels:
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._labels: Dict[int, str] = {}
+        self.loaded = False
+
+    async def load(self, db=database):
+        rows = await db.fetch_all("SELECT id, label FROM emotion_labels")
+        for row in rows:
+            self._ids[row["label"]] = row["id"]
+            self._labels[row["id"]] = row["label"]
+        self.loaded = True
+
+    async def ids(self, labels: Iterable[str], db=database) -> Dict[str, int]:
+        """
+        Map labels to ids, registering labels that don't have one yet.
+        """
+        missing = {label for label in labels if label not in self._ids}
+        too_long = [label for label in missing if len(label) > MAX_LABEL_LENGTH]
+        if too_long:
+            # The column would truncate them into another label
+            raise ValueError(f"Emotion labels longer than {MAX_LABEL_LENGTH} characters: {too_long!r}")
+        if missing:
+            values = {f"label_{i}": label for i, label in enumerate(missing)}
+            await db.execute(
+                f"INSERT IGNORE INTO emotion_labels (label) VALUES ({'), ('.join(':' + name for name in values)})",
+                values,
+            )
+            await self.load(db)
+            # A label the collation treats as equal to a registered one (e.g. with trailing
+            # spaces) was ignored by the insert; it shares that label's id
+            for label in missing - self._ids.keys():
+                emotion_id = await db.fetch_val("SELECT id FROM emotion_labels WHERE label = :label", {"label": label})
+                if emotion_id is None:
+                    raise RuntimeError(f"Emotion label {label!r} could not be registered")
+                self._ids[label] = emotion_id
+        return self._ids
+
+    async def names(self, ids: Iterable[int], db=database) -> Dict[int, str]:
+        """
+        Map ids back to labels, reloading once if another worker registered new labels.
+        """
+        if not self.loaded or any(emotion_id not in self._labels for emotion_id in ids):
+            await self.load(db)
+        return self._labels
+
+    def metrics(self) -> dict:
+        return {"labels": len(self._ids)}
+
+
+emotion_labels = EmotionLabels()
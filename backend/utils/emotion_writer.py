@@ -0,0 +1,66 @@
+from config import database
+from utils.emotion_labels import emotion_labels
+from utils.event_hub import event_hub
+from utils.read_replicas import read_router
+from utils.response_cache import response_cache
+from utils.rollups import apply_rollups
+
+# Rows per INSERT statement; keeps statements well under max_allowed_packet
+INSERT_CHUNK_SIZE = 500
+
+
+async def write_emotions(rows):
+    """
+    Insert emotion rows with multi-row INSERTs and update the rollups, all in one transaction,
+    then invalidate the cached admin responses and publish the rows to live subscribers.
+    Each row is a mapping with user_id, emotion, timestamp and an optional confidence.
+    """
+    if not rows:
+        return 0
+
+    label_ids = await emotion_labels.ids({row["emotion"] for row in rows})
+    async with database.transaction():
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            chunk = rows[start:start + INSERT_CHUNK_SIZE]
+            placeholders = []
+            values = {}
+            for i, row in enumerate(chunk):
+                placeholders.append(f"(:user_id_{i}, :emotion_id_{i}, :timestamp_{i}, :confidence_{i})")
+                values[f"user_id_{i}"] = row["user_id"]
+                values[f"emotion_id_{i}"] = label_ids[row["emotion"]]
+                values[f"timestamp_{i}"] = row["timestamp"]
+                values[f"confidence_{i}"] = row.get("confidence")
+
+            query = f"""
+                INSERT INTO emotions (user_id, emotion_id, timestamp, confidence)
+                VALUES {", ".join(placeholders)}
+            """
+            await database.execute(query, values)
+        await apply_rollups(rows)
+    read_router.mark_write({row["user_id"] for row in rows})
+    await response_cache.invalidate()
+    event_hub.publish_rows(rows)
+    return len(rows)
+
+
+async def bulk_insert_emotions(rows):
+    """
+    Bulk-load path for imports: rows go to the driver's executemany, which packs them into
+    multi-row INSERTs up to max_stmt_length without compiling a bind parameter per value,
+    and the rollups are updated in the same transaction. Unlike write_emotions it doesn't
+    notify caches or live subscribers; callers invalidate once when the load is done.
+    """
+    if not rows:
+        return 0
+
+    label_ids = await emotion_labels.ids({row["emotion"] for row in rows})
+    params = [(row["user_id"], label_ids[row["emotion"]], row["timestamp"], row.get("confidence")) for row in rows]
+    async with database.connection() as connection:
+        async with connection.transaction():
+            async with connection.raw_connection.cursor() as cursor:
+                await cursor.executemany(
+                    "INSERT INTO emotions (user_id, emotion_id, timestamp, confidence) VALUES (%s, %s, %s, %s)",
+                    params,
+                )
+            await apply_rollups(rows)
+    return len(rows)
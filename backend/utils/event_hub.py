@@ -0,0 +1,134 @@
+"""
+In-process pub/sub hub for live emotion events.
+
+write_emotions publishes every committed batch here. Each batch is encoded to JSON once,
+together with its per-emotion count delta, and the same string is handed to every
+subscriber's bounded queue, so fan-out costs one put_nowait per connection and no database
+queries. Dashboards apply the deltas to a snapshot from /admin/get_emotion_stats.
+
+A subscriber whose queue fills up is a slow consumer: its queue is discarded and it is told
+it was dropped, instead of letting it hold events (and memory) for everyone else. Idle
+subscribers get a heartbeat every EVENT_STREAM_HEARTBEAT_SECONDS.
+
+Each worker only sees the writes it committed itself; with several uvicorn workers run one
+stream worker or put a broker in front of publish().
+"""
+import asyncio
+import json
+from collections import Counter
+
+from config import settings
+
+HEARTBEAT = json.dumps({"type": "heartbeat"})
+DROPPED = json.dumps({"type": "dropped", "reason": "slow consumer"})
+
+
+class SubscriberLimit(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, hub: "EventHub", queue_size: int):
+        self._hub = hub
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    async def next(self, timeout: float) -> str:
+        """
+        Wait for the next message; returns a heartbeat after `timeout` idle seconds and
+        DROPPED (once) when the hub gave up on this subscriber.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return HEARTBEAT
+
+    def _offer(self, message: str) -> bool:
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _drop(self):
+        self.dropped = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(DROPPED)
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class EventHub:
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self.events_published = 0
+        self.messages_published = 0
+        self.messages_delivered = 0
+        self.subscribers_dropped = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    def subscribe(self) -> Subscription:
+        if self.full:
+            raise SubscriberLimit()
+        subscription = Subscription(self, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish_rows(self, rows):
+        """
+        Publish committed emotion rows as one message with their per-emotion delta.
+        """
+        if not rows:
+            return
+        self.events_published += len(rows)
+        if not self._subscribers:
+            return
+        message = json.dumps({
+            "type": "emotions",
+            "events": [
+                {
+                    "user_id": row["user_id"],
+                    "emotion": row["emotion"],
+                    "timestamp": row["timestamp"].isoformat(),
+                    "confidence": row.get("confidence"),
+                }
+                for row in rows
+            ],
+            "delta": Counter(row["emotion"] for row in rows),
+        })
+        self.publish(message)
+
+    def publish(self, message: str):
+        self.messages_published += 1
+        for subscription in list(self._subscribers):
+            if subscription._offer(message):
+                self.messages_delivered += 1
+            else:
+                # Slow consumer: stop queueing for it and let its stream close
+                self._subscribers.discard(subscription)
+                subscription._drop()
+                self.subscribers_dropped += 1
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "queue_size": self.queue_size,
+            "events_published": self.events_published,
+            "messages_published": self.messages_published,
+            "messages_delivered": self.messages_delivered,
+            "subscribers_dropped": self.subscribers_dropped,
+        }
+
+
+event_hub = EventHub(settings.EVENT_STREAM_QUEUE_SIZE, settings.EVENT_STREAM_MAX_SUBSCRIBERS)
@@ -0,0 +1,189 @@
+"""
+Server-side face descriptors for profile images.
+
+When a profile image is stored, its 128-d descriptor is computed once in the background and
+saved on the user row as a 512-byte float32 blob, tagged with the image's content hash.
+Clients fetch just the descriptor instead of decoding the image and running detection,
+landmarks and recognition on it.
+
+Descriptors come from the `face_recognition` package (dlib's ResNet model, which
+face-api.js's recognition net is ported from; it builds dlib, so installing it needs CMake and
+a C++ compiler, so it is kept out of requirements.txt: `pip install -r requirements-face.txt`).
+Without it no descriptor is stored and clients fall back to the profile image.
+
+The two implementations share the network weights but not the detector and face alignment, so
+their descriptors for the same photo are close rather than identical. Faces are aligned with
+the 68-point landmark model, as face-api.js does. Clients only get server descriptors once
+FACE_SERVER_DESCRIPTOR_THRESHOLD is set, and match them at that distance rather than the
+browser's FACE_MATCH_THRESHOLD. To calibrate it, `compare` prints the distance between the server
+descriptor and a face-api.js descriptor of the same image (export it in the browser with
+`JSON.stringify(Array.from(result.descriptor))` after `detectSingleFace(...).withFaceLandmarks()
+.withFaceDescriptor()`), and fails when it exceeds the threshold. Pick one that accepts every
+same-person pair with a margin but stays below the closest other image.
+
+    python -m utils.face_descriptors backfill                      # descriptors for existing images
+    python -m utils.face_descriptors compare a.jpg a.json [b.jpg b.json ...]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from config import database, settings
+from utils.storage import BASE_DIR, CONTENT_HASH_RE
+
+try:
+    import face_recognition
+except ImportError:  # Descriptors are optional
+    face_recognition = None
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTOR_DIM = 128
+DESCRIPTOR_BYTES = DESCRIPTOR_DIM * 4
+
+
+def encode_descriptor(descriptor) -> bytes:
+    return np.asarray(descriptor, dtype="<f4").reshape(DESCRIPTOR_DIM).tobytes()
+
+
+def decode_descriptor(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f4", count=DESCRIPTOR_DIM)
+
+
+def compute_descriptor(image_path: str) -> Optional[bytes]:
+    """
+    Return the descriptor of the first face in the image, or None if there is no face or
+    the recognition model isn't installed.
+    """
+    if face_recognition is None:
+        return None
+    image = face_recognition.load_image_file(image_path)
+    encodings = face_recognition.face_encodings(image, model="large")
+    if not encodings:
+        return None
+    return encode_descriptor(encodings[0])
+
+
+async def record_descriptor_change(user_id: int, db=database):
+    """
+    Log that a user's descriptor was stored, cleared or deleted, so every worker's face
+    index picks it up (see utils.face_index.sync_face_index).
+    """
+    await db.execute("INSERT INTO face_index_changes (user_id) VALUES (:user_id)", {"user_id": user_id})
+
+
+async def update_user_descriptor(user_id: int, face_data_path: str, content_hash: str):
+    """
+    Compute and store the descriptor for a user's newly stored profile image.
+    Returns the stored descriptor blob, or None when none could be computed.
+    """
+    # An identical image may already have been processed for another user
+    blob = await database.fetch_val("""
+        SELECT face_descriptor FROM users
+        WHERE face_image_hash = :hash AND face_descriptor IS NOT NULL
+        LIMIT 1
+    """, {"hash": content_hash})
+    if blob is None:
+        try:
+            blob = await run_in_threadpool(compute_descriptor, os.path.join(BASE_DIR, face_data_path))
+        except Exception:
+            logger.exception("Failed to compute face descriptor for user %s", user_id)
+            return None
+    if blob is None:
+        return None
+
+    # Only store it if the user hasn't replaced the image in the meantime
+    await database.execute("""
+        UPDATE users SET face_descriptor = :descriptor
+        WHERE id = :user_id AND face_image_hash = :hash
+    """, {"descriptor": blob, "user_id": user_id, "hash": content_hash})
+    await record_descriptor_change(user_id)
+    return blob
+
+
+async def backfill_descriptors():
+    rows = await database.fetch_all("""
+        SELECT id, face_data_path, face_image_hash FROM users
+        WHERE face_data_path IS NOT NULL AND face_descriptor IS NULL
+    """)
+    for row in rows:
+        content_hash = row["face_image_hash"]
+        if not content_hash:
+            stem = os.path.splitext(os.path.basename(row["face_data_path"]))[0]
+            if not CONTENT_HASH_RE.fullmatch(stem):
+                continue  # Legacy image; re-upload it to get a descriptor
+            content_hash = stem
+            await database.execute("UPDATE users SET face_image_hash = :hash WHERE id = :user_id",
+                                   {"hash": content_hash, "user_id": row["id"]})
+        await update_user_descriptor(row["id"], row["face_data_path"], content_hash)
+    return len(rows)
+
+
+def descriptor_distances(server, client) -> np.ndarray:
+    """
+    Euclidean distances (what face-api.js's FaceMatcher uses) between every server
+    descriptor and every client descriptor; the diagonal pairs up the same image.
+    """
+    server = np.asarray(server, dtype=np.float32).reshape(-1, DESCRIPTOR_DIM)
+    client = np.asarray(client, dtype=np.float32).reshape(-1, DESCRIPTOR_DIM)
+    return np.linalg.norm(server[:, None, :] - client[None, :, :], axis=2)
+
+
+def compare_descriptors(pairs) -> int:
+    """
+    Print server vs client descriptor distances for (image, client descriptor JSON) pairs.
+    Returns the number of images whose two descriptors would not match each other.
+    """
+    server = []
+    client = []
+    for image_path, descriptor_path in pairs:
+        blob = compute_descriptor(image_path)
+        if blob is None:
+            print(f"{image_path}: no face found")
+            return len(pairs)
+        server.append(decode_descriptor(blob))
+        with open(descriptor_path) as f:
+            client.append(json.load(f))
+
+    distances = descriptor_distances(server, client)
+    threshold = settings.FACE_SERVER_DESCRIPTOR_THRESHOLD or settings.FACE_MATCH_THRESHOLD
+    mismatches = 0
+    for i, (image_path, _) in enumerate(pairs):
+        same = distances[i, i]
+        mismatches += same > threshold
+        others = [distances[i, j] for j in range(len(pairs)) if j != i]
+        closest = f", closest other image {min(others):.3f}" if others else ""
+        print(f"{image_path}: server vs client {same:.3f} ({'match' if same <= threshold else 'NO MATCH'} "
+              f"at {threshold}){closest}")
+    return int(mismatches)
+
+
+async def _main(argv):
+    if len(argv) > 2 and argv[1] == "compare" and len(argv) % 2 == 0:
+        if face_recognition is None:
+            print("face_recognition is not installed")
+            return 1
+        return 1 if compare_descriptors(list(zip(argv[2::2], argv[3::2]))) else 0
+    if argv[1:] != ["backfill"]:
+        print("usage: python -m utils.face_descriptors backfill")
+        print("       python -m utils.face_descriptors compare IMAGE CLIENT_DESCRIPTOR.json [...]")
+        return 2
+    if face_recognition is None:
+        print("face_recognition is not installed")
+        return 1
+    await database.connect()
+    try:
+        print(f"Processed {await backfill_descriptors()} users")
+    finally:
+        await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
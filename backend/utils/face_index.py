@@ -0,0 +1,482 @@
+"""
+In-memory 1:N face identification index over the stored profile descriptors.
+
+Descriptors live in one contiguous float32 matrix and queries use vectorized squared-L2
+distances over it. Past FACE_INDEX_IVF_MIN_SIZE entries the index also trains a coarse
+k-means quantizer (IVF) and only scans the FACE_INDEX_NPROBE closest partitions.
+
+Each worker keeps its own copy. Every descriptor change is logged in face_index_changes
+(utils.face_descriptors.record_descriptor_change), and a background task replays new log rows
+every FACE_INDEX_SYNC_SECONDS, so a change made by one worker (a profile image upload, an
+account deletion run by whichever worker holds the deletion lock) reaches all of them.
+
+The matrix is saved as a snapshot directory under FACE_INDEX_DIR/snapshots, written under a
+per-process temporary name and then published by atomically replacing the CURRENT file that
+names it, so workers shutting down together never mix each other's files. A snapshot records
+a checksum of its contents and the last change it includes; on startup it is memory-mapped,
+verified, and brought up to date from the change log, and the index is rebuilt from the
+users table when the checksum doesn't match or the log no longer reaches back that far.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from config import database, settings
+from utils.face_descriptors import (
+    DESCRIPTOR_DIM, decode_descriptor, record_descriptor_change, update_user_descriptor,
+)
+from utils.storage import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.path.join(BASE_DIR, settings.FACE_INDEX_DIR)
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 100_000
+
+SNAPSHOT_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+# Unfinished snapshot directories older than this are left over from a crash
+STALE_TEMP_SECONDS = 3600
+# Changes are applied once they are this old, so an insert that got an earlier id but
+# committed later isn't skipped
+CHANGE_SETTLE_SECONDS = 1
+CHANGE_BATCH_SIZE = 1000
+CHANGE_RETENTION_HOURS = 24
+
+
+class FaceIndex:
+    def __init__(self, ivf_min_size: int = 50_000, nprobe: int = 8):
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, DESCRIPTOR_DIM), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._positions = {}
+        self._centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._training = False
+        self.change_id = 0  # last face_index_changes row applied
+        self.dirty = False
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def partitioned(self) -> bool:
+        return self._centroids is not None
+
+    # Building and mutation
+
+    def build(self, ids, vectors):
+        """
+        Replace the index contents with the given ids and (n, 128) descriptors.
+        """
+        with self._lock:
+            self._ids = np.ascontiguousarray(ids, dtype=np.int64)
+            self._vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, DESCRIPTOR_DIM)
+            self._size = len(self._ids)
+            self._norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+            self._positions = {int(user_id): i for i, user_id in enumerate(self._ids)}
+            self._centroids = None
+            self._assignments = np.empty(0, dtype=np.int32)
+            train = self._size >= self.ivf_min_size
+        if train:
+            self.train()
+
+    def add(self, user_id: int, descriptor):
+        """
+        Insert or replace the descriptor for one user. Crossing ivf_min_size trains the
+        partitions in the calling thread, so call it from a worker thread.
+        """
+        vector = np.asarray(descriptor, dtype=np.float32).reshape(DESCRIPTOR_DIM)
+        with self._lock:
+            self._make_writable()
+            position = self._positions.get(user_id)
+            if position is None:
+                position = self._size
+                self._grow(position + 1)
+                self._ids[position] = user_id
+                self._positions[user_id] = position
+                self._size += 1
+            self._vectors[position] = vector
+            self._norms[position] = vector @ vector
+            self.dirty = True
+            if self._centroids is not None:
+                self._assignments[position] = self._nearest_centroids(vector[None, :], 1)[0, 0]
+            train = self._centroids is None and self._size >= self.ivf_min_size
+        if train:
+            self.train()
+
+    def apply(self, descriptors: dict):
+        """
+        Add or replace each user's descriptor, or remove the user where it is None.
+        """
+        for user_id, descriptor in descriptors.items():
+            if descriptor is None:
+                self.remove(user_id)
+            else:
+                self.add(user_id, descriptor)
+
+    def remove(self, user_id: int):
+        """
+        Drop a user's descriptor by moving the last row into its slot.
+        """
+        with self._lock:
+            position = self._positions.pop(user_id, None)
+            if position is None:
+                return
+            self._make_writable()
+            last = self._size - 1
+            if position != last:
+                moved_id = int(self._ids[last])
+                self._ids[position] = moved_id
+                self._vectors[position] = self._vectors[last]
+                self._norms[position] = self._norms[last]
+                if self._centroids is not None:
+                    self._assignments[position] = self._assignments[last]
+                self._positions[moved_id] = position
+            self._size = last
+            self.dirty = True
+
+    def train(self, nlist: Optional[int] = None):
+        """
+        Fit the coarse quantizer with k-means on (a sample of) the stored descriptors.
+        k-means runs on a copy without holding the lock, so searches and updates carry on;
+        the partitions are swapped in at the end.
+        """
+        rng = np.random.default_rng(0)
+        with self._lock:
+            if self._size == 0 or self._training:
+                return
+            self._training = True
+            nlist = nlist or max(1, int(np.sqrt(self._size)))
+            if self._size > KMEANS_SAMPLE_SIZE:
+                sample = self._vectors[rng.choice(self._size, KMEANS_SAMPLE_SIZE, replace=False)]
+            else:
+                sample = np.array(self._vectors[:self._size])
+        try:
+            centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)].copy()
+            for _ in range(KMEANS_ITERATIONS):
+                labels = _nearest(sample, centroids, 1)[:, 0]
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                counts = np.bincount(labels, minlength=len(centroids))
+                nonempty = counts > 0
+                centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        finally:
+            with self._lock:
+                self._training = False
+        with self._lock:
+            self._centroids = centroids
+            self._assignments = np.empty(len(self._vectors), dtype=np.int32)
+            self._assignments[:self._size] = self._nearest_centroids(self._vectors[:self._size], 1)[:, 0]
+
+    def _grow(self, size: int):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 64)
+        self._ids = np.resize(self._ids, capacity)
+        vectors = np.empty((capacity, DESCRIPTOR_DIM), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._norms = np.resize(self._norms, capacity)
+        if self._centroids is not None:
+            self._assignments = np.resize(self._assignments, capacity)
+
+    def _make_writable(self):
+        # Memory-mapped arrays from load() are read-only; copy them in before the first change
+        if isinstance(self._vectors, np.memmap) or not self._vectors.flags.writeable:
+            self._ids = np.array(self._ids)
+            self._vectors = np.array(self._vectors)
+            self._norms = np.array(self._norms)
+            if self._centroids is not None:
+                self._assignments = np.array(self._assignments)
+
+    def _nearest_centroids(self, vectors, count: int):
+        return _nearest(vectors, self._centroids, count)
+
+    # Queries
+
+    def search(self, descriptor, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Return up to k (user_id, euclidean distance) pairs, closest first.
+        """
+        query = np.asarray(descriptor, dtype=np.float32).reshape(DESCRIPTOR_DIM)
+        with self._lock:
+            if self._size == 0:
+                return []
+            if self._centroids is not None:
+                probes = self._nearest_centroids(query[None, :], min(self.nprobe, len(self._centroids)))[0]
+                candidates = np.flatnonzero(np.isin(self._assignments[:self._size], probes))
+            else:
+                candidates = None
+
+            vectors = self._vectors[:self._size] if candidates is None else self._vectors[candidates]
+            norms = self._norms[:self._size] if candidates is None else self._norms[candidates]
+            distances = norms - 2 * (vectors @ query) + query @ query
+            k = min(k, len(distances))
+            if k == 0:
+                return []
+            best = np.argpartition(distances, k - 1)[:k]
+            best = best[np.argsort(distances[best])]
+            rows = best if candidates is None else candidates[best]
+            return [(int(self._ids[row]), float(np.sqrt(max(distances[i], 0.0))))
+                    for row, i in zip(rows, best)]
+
+    # Persistence
+
+    def checksum(self) -> int:
+        with self._lock:
+            return _checksum(self._ids[:self._size], self._vectors[:self._size])
+
+    def save(self, directory: str = INDEX_DIR):
+        """
+        Write a new snapshot and make it the current one, unless a snapshot that includes
+        later changes has been published in the meantime.
+        """
+        snapshots = os.path.join(directory, SNAPSHOT_DIR)
+        with self._lock:
+            arrays = {"ids": self._ids[:self._size], "vectors": self._vectors[:self._size]}
+            if self._centroids is not None:
+                arrays["centroids"] = self._centroids
+                arrays["assignments"] = self._assignments[:self._size]
+            meta = {
+                "count": self._size,
+                "checksum": _checksum(arrays["ids"], arrays["vectors"]),
+                "change_id": self.change_id,
+            }
+            name = f"{self.change_id:012d}-{os.getpid()}-{os.urandom(4).hex()}"
+            temp_dir = os.path.join(snapshots, f"{name}.tmp")
+            os.makedirs(temp_dir)
+            for array_name, array in arrays.items():
+                np.save(os.path.join(temp_dir, f"{array_name}.npy"), np.ascontiguousarray(array))
+            with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            os.replace(temp_dir, os.path.join(snapshots, name))
+            self.dirty = False
+
+        current = _read_meta(directory)
+        if current is not None and current[1]["change_id"] > meta["change_id"]:
+            shutil.rmtree(os.path.join(snapshots, name), ignore_errors=True)
+            return
+        pointer = os.path.join(directory, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+        _remove_old_snapshots(snapshots, name)
+
+    def load(self, directory: str = INDEX_DIR) -> bool:
+        """
+        Memory-map the current snapshot. Returns False when there is none or it fails its
+        checksum.
+        """
+        current = _read_meta(directory)
+        if current is None:
+            return False
+        path, meta = current
+        try:
+            ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            centroids = assignments = None
+            if os.path.exists(os.path.join(path, "centroids.npy")):
+                centroids = np.load(os.path.join(path, "centroids.npy"))
+                assignments = np.load(os.path.join(path, "assignments.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            logger.warning("Face index snapshot %s is unreadable", path)
+            return False
+        if len(ids) != meta["count"] or len(vectors) != meta["count"] or _checksum(ids, vectors) != meta["checksum"]:
+            logger.warning("Face index snapshot %s doesn't match its checksum", path)
+            return False
+        with self._lock:
+            self._ids = ids
+            self._vectors = vectors
+            self._size = len(self._ids)
+            self._norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+            self._positions = {int(user_id): i for i, user_id in enumerate(self._ids)}
+            if centroids is not None:
+                self._centroids = centroids
+                self._assignments = assignments
+            else:
+                self._centroids = None
+                self._assignments = np.empty(0, dtype=np.int32)
+            self.change_id = meta["change_id"]
+            self.dirty = False
+        return True
+
+
+def _checksum(ids, vectors) -> int:
+    checksum = zlib.crc32(np.ascontiguousarray(ids, dtype="<i8"))
+    return zlib.crc32(np.ascontiguousarray(vectors, dtype="<f4"), checksum)
+
+
+def _read_meta(directory: str):
+    """
+    (path, meta) of the snapshot CURRENT points at, or None.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            path = os.path.join(directory, SNAPSHOT_DIR, f.read().strip())
+        with open(os.path.join(path, "meta.json")) as f:
+            return path, json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove_old_snapshots(snapshots: str, keep: str):
+    # Other workers may still have an old snapshot memory-mapped; on POSIX the mapping
+    # outlives the unlink, elsewhere the removal fails and is retried on the next save
+    now = time.time()
+    for name in os.listdir(snapshots):
+        path = os.path.join(snapshots, name)
+        if name == keep or (name.endswith(".tmp") and now - os.path.getmtime(path) < STALE_TEMP_SECONDS):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _nearest(vectors, centroids, count: int):
+    distances = (np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * (vectors @ centroids.T))
+    if count == 1:
+        return distances.argmin(axis=1)[:, None]
+    return np.argpartition(distances, count - 1, axis=1)[:, :count]
+
+
+face_index = FaceIndex(ivf_min_size=settings.FACE_INDEX_IVF_MIN_SIZE, nprobe=settings.FACE_INDEX_NPROBE)
+
+
+async def rebuild_face_index(db=database):
+    """
+    Build the index from the users table and save it.
+    """
+    # Changes logged while the table is read are replayed afterwards; applying one twice is harmless
+    change_id = await db.fetch_val("SELECT COALESCE(MAX(id), 0) FROM face_index_changes")
+    rows = await db.fetch_all("SELECT id, face_descriptor FROM users WHERE face_descriptor IS NOT NULL")
+    ids = np.fromiter((row["id"] for row in rows), dtype=np.int64, count=len(rows))
+    vectors = np.empty((len(rows), DESCRIPTOR_DIM), dtype=np.float32)
+    for i, row in enumerate(rows):
+        vectors[i] = decode_descriptor(row["face_descriptor"])
+    await run_in_threadpool(face_index.build, ids, vectors)
+    face_index.change_id = change_id
+    await run_in_threadpool(face_index.save)
+
+
+async def sync_face_index(index: FaceIndex = None, db=database) -> int:
+    """
+    Apply logged descriptor changes newer than the index's change_id. Returns how many
+    users were updated.
+    """
+    index = index or face_index
+    applied = 0
+    while True:
+        changes = await db.fetch_all("""
+            SELECT id, user_id FROM face_index_changes
+            WHERE id > :after AND created_at < NOW(6) - INTERVAL :settle SECOND
+            ORDER BY id
+            LIMIT :limit
+        """, {"after": index.change_id, "settle": CHANGE_SETTLE_SECONDS, "limit": CHANGE_BATCH_SIZE})
+        if not changes:
+            return applied
+        user_ids = sorted({row["user_id"] for row in changes})
+        params = {f"id_{i}": user_id for i, user_id in enumerate(user_ids)}
+        rows = await db.fetch_all(f"""
+            SELECT id, face_descriptor FROM users
+            WHERE id IN ({", ".join(":" + name for name in params)}) AND face_descriptor IS NOT NULL
+        """, params)
+        descriptors = {row["id"]: decode_descriptor(row["face_descriptor"]) for row in rows}
+        await run_in_threadpool(index.apply, {user_id: descriptors.get(user_id) for user_id in user_ids})
+        index.change_id = changes[-1]["id"]
+        index.dirty = True
+        applied += len(user_ids)
+
+
+async def load_face_index():
+    """
+    Load the current snapshot and catch up on the changes logged since, or rebuild the index
+    from the users table when there is no usable snapshot.
+    """
+    if await run_in_threadpool(face_index.load):
+        # A gap before the oldest logged change means changes the snapshot lacks were pruned
+        oldest = await database.fetch_val("SELECT MIN(id) FROM face_index_changes")
+        if oldest is None or oldest <= face_index.change_id + 1:
+            await sync_face_index()
+            return
+    await rebuild_face_index()
+
+
+async def save_face_index():
+    if face_index.dirty:
+        await run_in_threadpool(face_index.save)
+
+
+async def index_user_descriptor(user_id: int, face_data_path: str, content_hash: str):
+    """
+    Background task for a new profile image: store its descriptor and index it.
+    """
+    await run_in_threadpool(face_index.remove, user_id)
+    blob = await update_user_descriptor(user_id, face_data_path, content_hash)
+    if blob is not None:
+        await run_in_threadpool(face_index.add, user_id, decode_descriptor(blob))
+    else:
+        # The previous descriptor was cleared with the old image
+        await record_descriptor_change(user_id)
+
+
+class FaceIndexSync:
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._task = None
+        self.runs = 0
+        self.failures = 0
+        self.users_updated = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.users_updated += await sync_face_index()
+                await database.execute("""
+                    DELETE FROM face_index_changes
+                    WHERE created_at < NOW(6) - INTERVAL :hours HOUR
+                    LIMIT :limit
+                """, {"hours": CHANGE_RETENTION_HOURS, "limit": CHANGE_BATCH_SIZE})
+                self.runs += 1
+            except Exception:
+                self.failures += 1
+                logger.exception("Face index sync failed")
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(face_index),
+            "partitioned": face_index.partitioned,
+            "change_id": face_index.change_id,
+            "sync_runs": self.runs,
+            "sync_failures": self.failures,
+            "users_updated": self.users_updated,
+        }
+
+
+face_index_sync = FaceIndexSync(settings.FACE_INDEX_SYNC_SECONDS)
@@ -0,0 +1,164 @@
+"""
+`databases.Database` with query and connection-pool instrumentation.
+
+Every statement run through the shared database object (directly or inside a transaction)
+is timed and recorded in the metrics registry under its normalized SQL: literals and bind
+parameters become `?` and repeated placeholder lists collapse to `?, ...`, so one label
+covers every batch size of a multi-row INSERT or IN list. Statements slower than
+`slow_query_ms` are logged. Waiting for a pooled connection is timed separately and gives
+up after `pool_timeout` seconds with PoolTimeout.
+"""
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Optional
+
+from databases import Database
+from databases.core import Connection
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Distinct statement labels kept before new ones are reported as "other"
+MAX_STATEMENTS = 500
+MAX_STATEMENT_LENGTH = 300
+
+query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Query latency by normalized statement.", ("statement",))
+query_rows = registry.counter(
+    "db_query_rows_total", "Rows returned by normalized statement.", ("statement",))
+query_errors = registry.counter(
+    "db_query_errors_total", "Failed queries by normalized statement.", ("statement",))
+slow_queries = registry.counter(
+    "db_slow_queries_total", "Queries slower than DB_SLOW_QUERY_MS by normalized statement.", ("statement",))
+pool_wait_seconds = registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection.")
+pool_timeouts = registry.counter(
+    "db_pool_timeouts_total", "Connection acquisitions that gave up after DB_POOL_TIMEOUT.")
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_PARAM = re.compile(r"(?<!:):[A-Za-z_]\w*")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_LIST = re.compile(r"\?(?: ?, ?\?)+")
+_TUPLES = re.compile(r"\((\?(?:, \.\.\.)?)\)(?: ?, ?\(\1\))+")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    sql = _STRING.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _LIST.sub("?, ...", sql)
+    return _TUPLES.sub(r"(\1), ...", sql)
+
+
+class _QueryTimer:
+    def __init__(self, database: "InstrumentedDatabase", query):
+        self.database = database
+        self.statement = database.statement_label(query)
+        self.rows = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        labels = (self.statement,)
+        query_seconds.observe(elapsed, labels)
+        if exc_type is not None:
+            query_errors.inc(labels)
+            return
+        if self.rows:
+            query_rows.inc(labels, self.rows)
+        if elapsed * 1000 >= self.database.slow_query_ms:
+            slow_queries.inc(labels)
+            logger.warning("Slow query (%.1f ms, %d rows): %s", elapsed * 1000, self.rows, self.statement)
+
+
+class InstrumentedConnection(Connection):
+    async def __aenter__(self) -> "InstrumentedConnection":
+        if self._connection_counter:
+            # Already holding a pooled connection (nested use or a transaction)
+            return await super().__aenter__()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(super().__aenter__(), self._database.pool_timeout)
+        except asyncio.TimeoutError:
+            pool_timeouts.inc()
+            raise PoolTimeout(f"No database connection available after {self._database.pool_timeout}s") from None
+        pool_wait_seconds.observe(time.perf_counter() - start)
+        return self
+
+    async def fetch_all(self, query, values=None):
+        with _QueryTimer(self._database, query) as timer:
+            rows = await super().fetch_all(query, values)
+            timer.rows = len(rows)
+            return rows
+
+    async def fetch_one(self, query, values=None):
+        with _QueryTimer(self._database, query) as timer:
+            row = await super().fetch_one(query, values)
+            timer.rows = int(row is not None)
+            return row
+
+    async def fetch_val(self, query, values=None, column=0):
+        with _QueryTimer(self._database, query) as timer:
+            value = await super().fetch_val(query, values, column=column)
+            timer.rows = 1
+            return value
+
+    async def execute(self, query, values=None):
+        with _QueryTimer(self._database, query):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values):
+        with _QueryTimer(self._database, query):
+            return await super().execute_many(query, values)
+
+    async def iterate(self, query, values=None):
+        with _QueryTimer(self._database, query) as timer:
+            async for record in super().iterate(query, values):
+                timer.rows += 1
+                yield record
+
+
+class InstrumentedDatabase(Database):
+    def __init__(self, url, *, slow_query_ms: float = 200, pool_timeout: Optional[float] = None, **options):
+        super().__init__(url, **options)
+        self.slow_query_ms = slow_query_ms
+        self.pool_timeout = pool_timeout
+        self._statements = set()
+
+    def connection(self) -> Connection:
+        if self._global_connection is not None:
+            return self._global_connection
+        if not self._connection:
+            self._connection = InstrumentedConnection(self, self._backend)
+        return self._connection
+
+    def statement_label(self, query) -> str:
+        statement = normalize_sql(query if isinstance(query, str) else str(query))[:MAX_STATEMENT_LENGTH]
+        if statement not in self._statements:
+            if len(self._statements) >= MAX_STATEMENTS:
+                return "other"
+            self._statements.add(statement)
+        return statement
+
+    def pool_metrics(self) -> dict:
+        """
+        Pool occupancy for backends that expose it (aiomysql).
+        """
+        pool = getattr(self._backend, "_pool", None)
+        if pool is None or not hasattr(pool, "freesize"):
+            return {}
+        return {"size": pool.size, "free": pool.freesize, "min_size": pool.minsize, "max_size": pool.maxsize}
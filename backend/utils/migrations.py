@@ -0,0 +1,115 @@
+"""
+Versioned schema migrations.
+
+Migrations live in the top-level `migrations` folder as `vNNN_<name>.py` modules with a
+VERSION, a DESCRIPTION and an `async def upgrade(database)`. They are registered in
+MIGRATIONS below and applied in order; applied versions are recorded in `schema_version`.
+They run as a deploy step before new workers start (or on startup when
+RUN_MIGRATIONS_ON_STARTUP is set).
+
+    python -m utils.migrations            # apply pending migrations
+    python -m utils.migrations status     # show applied / pending versions
+"""
+import asyncio
+import sys
+
+from config import database
+from migrations import (
+    v001_initial_schema, v002_emotion_indexes, v003_face_descriptors, v004_retention_state, v005_emotion_labels,
+    v006_deletion_jobs, v007_face_index_changes, v008_emotion_label_collation,
+)
+
+MIGRATIONS = [
+    v001_initial_schema,
+    v002_emotion_indexes,
+    v003_face_descriptors,
+    v004_retention_state,
+    v005_emotion_labels,
+    v006_deletion_jobs,
+    v007_face_index_changes,
+    v008_emotion_label_collation,
+]
+
+# Named lock so several workers booting at once don't race on the same migration
+LOCK_NAME = "emotion_tracker_migrations"
+LOCK_TIMEOUT_SECONDS = 60
+
+
+async def _ensure_version_table(db):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+async def applied_versions(db=database):
+    await _ensure_version_table(db)
+    rows = await db.fetch_all("SELECT version FROM schema_version")
+    return {row["version"] for row in rows}
+
+
+async def pending_migrations(db=database):
+    """
+    Versions not yet applied. Read-only: takes no lock and creates nothing, so workers can
+    check the schema on every boot.
+    """
+    try:
+        rows = await db.fetch_all("SELECT version FROM schema_version")
+    except Exception:  # schema_version is created by the first migration run
+        return [migration.VERSION for migration in MIGRATIONS]
+    done = {row["version"] for row in rows}
+    return sorted(migration.VERSION for migration in MIGRATIONS if migration.VERSION not in done)
+
+
+async def run_migrations(db=database):
+    """
+    Apply every registered migration that is not yet recorded in schema_version.
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+    async with db.connection() as connection:
+        locked = await connection.fetch_val(
+            "SELECT GET_LOCK(:name, :timeout)", {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT_SECONDS}
+        )
+        if not locked:
+            raise RuntimeError("Timed out waiting for the migration lock")
+        try:
+            done = await applied_versions(connection)
+            for migration in sorted(MIGRATIONS, key=lambda m: m.VERSION):
+                if migration.VERSION in done:
+                    continue
+                await migration.upgrade(connection)
+                await connection.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (:version, :description)",
+                    {"version": migration.VERSION, "description": migration.DESCRIPTION},
+                )
+                applied.append(migration.VERSION)
+        finally:
+            await connection.execute("SELECT RELEASE_LOCK(:name)", {"name": LOCK_NAME})
+    return applied
+
+
+async def _main(argv):
+    await database.connect()
+    try:
+        if argv[1:] == ["status"]:
+            done = await applied_versions()
+            for migration in MIGRATIONS:
+                state = "applied" if migration.VERSION in done else "pending"
+                print(f"v{migration.VERSION:03d}  {state:8}  {migration.DESCRIPTION}")
+        elif argv[1:] in ([], ["upgrade"]):
+            applied = await run_migrations()
+            print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+        else:
+            print("usage: python -m utils.migrations [upgrade|status]")
+            return 2
+    finally:
+        await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
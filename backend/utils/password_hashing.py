@@ -0,0 +1,122 @@
+"""
+bcrypt hashing off the event loop.
+
+Hash and verify calls run on a dedicated, size-limited thread pool (bcrypt releases the GIL),
+so a burst of logins no longer stalls every other request. When more than
+PASSWORD_HASH_MAX_QUEUE calls are already waiting, new ones fail fast with PasswordPoolBusy.
+
+The CryptContext is built on first use, so importing this module costs nothing at startup.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from config import settings
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    # min/max rounds pinned to the configured factor make passlib flag older hashes for rehash
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+    )
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, context_factory, workers: int, max_queue: int):
+        self.context_factory = context_factory
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.run_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def context(self) -> CryptContext:
+        # Built on first use; the factory caches it
+        return self.context_factory()
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """
+        Check a password and return (valid, new_hash). new_hash is set when the stored hash
+        was made with a different work factor and should be replaced.
+        """
+        return await self._submit(self.context.verify_and_update, password, hashed)
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self.pending += 1
+        queued_at = time.perf_counter()
+        try:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run, queued_at, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _run(self, queued_at, fn, *args):
+        started = time.perf_counter()
+        waited = started - queued_at
+        with self._lock:
+            self.active += 1
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.run_seconds_total += time.perf_counter() - started
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.pending - self.active,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": (self.wait_seconds_total * 1000 / self.completed) if self.completed else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+                "avg_run_ms": (self.run_seconds_total * 1000 / self.completed) if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    get_pwd_context,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
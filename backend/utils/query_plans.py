@@ -0,0 +1,76 @@
+"""
+EXPLAIN-based guard for the hot emotion queries (also run by tests/test_query_plans.py).
+
+Each query below is EXPLAINed against the current database; if MySQL plans a full table
+scan (access type ALL) on `emotions`, the check reports it. Run it after migrations, e.g. in CI:
+
+    python -m utils.query_plans       # exits 1 when a query regresses to a full scan
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from config import database
+
+SAMPLE_TIMESTAMP = datetime(2024, 1, 1)
+
+HOT_QUERIES = {
+    "user.get_emotion": (
+        """
+        SELECT ROW_NUMBER() OVER (ORDER BY timestamp ASC) AS id, emotion_id, timestamp
+        FROM emotions WHERE user_id = :user_id
+        """,
+        {"user_id": 1},
+    ),
+    "user.emotions_by_label": (
+        "SELECT emotion_id, COUNT(*) FROM emotions WHERE user_id = :user_id GROUP BY emotion_id",
+        {"user_id": 1},
+    ),
+    "admin.get_all_emotion_page": (
+        """
+        SELECT emotions.id, emotions.user_id, users.email, emotions.emotion_id, emotions.timestamp
+        FROM emotions
+        JOIN users ON emotions.user_id = users.id
+        WHERE emotions.user_id > :user_id
+           OR (emotions.user_id = :user_id AND emotions.timestamp > :timestamp)
+           OR (emotions.user_id = :user_id AND emotions.timestamp = :timestamp AND emotions.id > :id)
+        ORDER BY emotions.user_id, emotions.timestamp, emotions.id
+        LIMIT 5000
+        """,
+        {"user_id": 1, "timestamp": SAMPLE_TIMESTAMP, "id": 1},
+    ),
+}
+
+SCANNED_TABLES = {"emotions"}
+
+
+async def check_query_plans(db=database):
+    """
+    EXPLAIN every hot query and return a list of (query name, table, plan row) full scans.
+    """
+    violations = []
+    for name, (query, values) in HOT_QUERIES.items():
+        for row in await db.fetch_all(f"EXPLAIN {query}", values):
+            row = dict(row)
+            if row.get("table") in SCANNED_TABLES and row.get("type") == "ALL":
+                violations.append((name, row["table"], row))
+    return violations
+
+
+async def _main():
+    await database.connect()
+    try:
+        violations = await check_query_plans()
+    finally:
+        await database.disconnect()
+
+    for name, table, row in violations:
+        print(f"FULL SCAN  {name}: table={table} key={row.get('key')} rows={row.get('rows')}")
+    if violations:
+        return 1
+    print(f"All {len(HOT_QUERIES)} hot queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
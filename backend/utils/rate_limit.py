@@ -0,0 +1,308 @@
+"""
+Admission control: per-client rate limits and per-route-class concurrency caps.
+
+Every HTTP request is put in a route class by its path:
+
+* auth  - CPU-bound password hashing and face matching (/auth/login, /auth/register, ...)
+* heavy - large reads and aggregates (/admin/get_all_emotion, /user/get_emotion, ...)
+* write - emotion inserts, profile changes and deletions
+* read  - everything else
+
+and then admitted in two steps, both answered straight away when they fail:
+
+1. A token bucket per (route, client) with the class's RATE_LIMITS [per second, burst].
+   The client is the user id from a valid bearer token, or else the client IP (the first
+   X-Forwarded-For address when RATE_LIMIT_TRUST_FORWARDED is set). An empty bucket gets
+   429 with Retry-After. /user/add_emotion(s), which take the user id from the body, also
+   charge a bucket for that user (`rate_limiter.limit_user`).
+
+   Login and registration are keyed by the submitted email under the auth limit, charged
+   by the route; the per-IP bucket for them uses the looser auth_ip limit, which bounds
+   guessing across many accounts from one address.
+2. A cap on requests of the class in progress in this worker (CONCURRENCY_LIMITS). A full
+   class gets 503 with Retry-After, so a flood of heavy or auth requests can't queue up in
+   front of everything else or exhaust the connection pool.
+
+RATE_LIMIT_BACKEND selects where the buckets live:
+
+* memory - per-process buckets, so each uvicorn worker allows the full rate on its own
+* redis  - shared by all workers through RATE_LIMIT_URL (needs the optional `redis` package);
+           each check is one atomic script call
+
+Behind a reverse proxy, set RATE_LIMIT_TRUST_FORWARDED (and make sure the proxy sets
+X-Forwarded-For): otherwise every anonymous client has the proxy's address and they all share
+one bucket per route, so the auth_ip limit applies to the whole site.
+
+Backend errors are logged and the request is let through. Concurrency caps are always per
+worker, like the connection pool they protect. /metrics, static files and the live emotion
+stream are not limited.
+"""
+import logging
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config import settings
+from utils.auth import verify_token
+from utils.serialization import dumps
+from utils.ttl_cache import TTLCache
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+AUTH = "auth"
+AUTH_IP = "auth_ip"
+HEAVY = "heavy"
+WRITE = "write"
+READ = "read"
+
+ROUTE_CLASSES = {
+    "/auth/login": AUTH,
+    "/auth/register": AUTH,
+    "/auth/register/face-data": AUTH,
+    "/admin/identify_face": AUTH,
+    "/admin/get_all_emotion": HEAVY,
+    "/admin/export_emotion": HEAVY,
+    "/admin/get_emotion_stats": HEAVY,
+    "/admin/get_mood_trends": HEAVY,
+    "/user/get_emotion": HEAVY,
+    "/user/get_mood_trends": HEAVY,
+    "/user/add_emotion": WRITE,
+    "/user/add_emotions": WRITE,
+    "/user/update_profile": WRITE,
+    "/user/delete": WRITE,
+    "/user/remove": WRITE,
+}
+
+# Charged per account by the route (limit_user); the middleware uses AUTH_IP for the client
+ACCOUNT_KEYED_PATHS = {"/auth/login", "/auth/register"}
+
+EXEMPT_PATHS = {"/metrics", "/admin/stream/emotions"}
+EXEMPT_PREFIXES = ("/static/",)
+
+# Token bucket in one round trip: refill for the time since the last call, then take `cost`
+# or return how long until there is enough. Numbers come back as strings; Redis would
+# truncate a Lua number to an integer.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+if tokens < cost then
+    return tostring((cost - tokens) / rate)
+end
+tokens = tokens - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return '0'
+"""
+
+
+class MemoryRateLimitBackend:
+    """
+    In-process buckets. A bucket is dropped once it would have refilled, so an unknown key
+    simply means a full bucket.
+    """
+
+    def __init__(self, max_keys: int):
+        self._buckets = TTLCache(max_keys, math.inf)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        tokens -= cost
+        self._buckets.set(key, (tokens, now), (burst - tokens) / rate)
+        return 0.0
+
+    def stats(self) -> dict:
+        stats = self._buckets.stats()
+        return {"backend": "memory", "buckets": stats["size"], "evictions": stats["evictions"]}
+
+
+class RedisRateLimitBackend:
+    """
+    Shared buckets, so the limits hold across all workers.
+    """
+
+    def __init__(self, url: str, prefix: str = "emotion-tracker:ratelimit:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        wait = await self._script(keys=[self._prefix + key], args=[rate, burst, time.time(), cost])
+        return float(wait)
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_backend(name: str):
+    if name == "memory":
+        return MemoryRateLimitBackend(settings.RATE_LIMIT_MAX_KEYS)
+    if name == "redis":
+        return RedisRateLimitBackend(settings.RATE_LIMIT_URL or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {name}")
+
+
+def route_class(path: str) -> Optional[str]:
+    """
+    Route class for a request path, or None for paths that aren't limited.
+    """
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    return ROUTE_CLASSES.get(path, READ)
+
+
+def _retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+class RateLimiter:
+    def __init__(self, backend, limits: Dict[str, List[float]], concurrency: Dict[str, int],
+                 enabled: bool = True, trust_forwarded: bool = False):
+        self.backend = backend
+        self.limits = limits
+        self.concurrency = concurrency
+        self.enabled = enabled
+        self.trust_forwarded = trust_forwarded
+        self.in_flight = Counter()
+        self.admitted = Counter()
+        self.rate_limited = Counter()
+        self.shed = Counter()
+        self.errors = 0
+
+    def client_key(self, scope) -> str:
+        """
+        `user:<id>` for a request with a valid bearer token, otherwise `ip:<address>`.
+        """
+        headers = dict(scope.get("headers") or ())
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.startswith("Bearer "):
+            try:
+                return f"user:{verify_token(authorization.split(' ')[1])['id']}"
+            except (HTTPException, KeyError):
+                pass
+        if self.trust_forwarded and b"x-forwarded-for" in headers:
+            return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def retry_after(self, name: str, key: str) -> float:
+        """
+        Take a token from `key`'s bucket under route class `name`'s limit. Returns 0 when the
+        request may go ahead, otherwise the seconds until a token is available.
+        """
+        limit = self.limits.get(name)
+        if not self.enabled or not limit:
+            return 0.0
+        rate, burst = limit
+        try:
+            wait = await self.backend.take(f"{name}:{key}", rate, burst)
+        except Exception:
+            self.errors += 1
+            logger.exception("Rate limit backend unavailable")
+            return 0.0
+        if wait:
+            self.rate_limited[name] += 1
+        return wait
+
+    async def limit_user(self, path: str, user_id):
+        """
+        Charge `user_id`'s bucket for `path`, for routes that identify the user in the body.
+        Raises 429 when it is empty.
+        """
+        wait = await self.retry_after(route_class(path) or READ, f"{path}:user:{user_id}")
+        if wait:
+            raise HTTPException(status_code=429, detail="Too many requests, retry shortly",
+                                headers={"Retry-After": _retry_after(wait)})
+
+    def try_enter(self, name: str) -> bool:
+        """
+        Claim one of class `name`'s concurrency slots; pair with `leave` when it returns True.
+        """
+        limit = self.concurrency.get(name)
+        if self.enabled and limit and self.in_flight[name] >= limit:
+            self.shed[name] += 1
+            return False
+        self.in_flight[name] += 1
+        self.admitted[name] += 1
+        return True
+
+    def leave(self, name: str):
+        self.in_flight[name] -= 1
+
+    def metrics(self) -> dict:
+        classes = set(self.limits) | set(self.concurrency) | set(self.admitted)
+        return {
+            **self.backend.stats(),
+            "enabled": self.enabled,
+            "backend_errors": self.errors,
+            **{name: {
+                "in_flight": self.in_flight[name],
+                "admitted": self.admitted[name],
+                "rate_limited": self.rate_limited[name],
+                "shed": self.shed[name],
+            } for name in sorted(classes)},
+        }
+
+
+async def _reject(send, status: int, detail: str, retry_after: str):
+    body = dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        name = route_class(scope["path"]) if scope["type"] == "http" and self.limiter.enabled else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        bucket = AUTH_IP if scope["path"] in ACCOUNT_KEYED_PATHS else name
+        wait = await self.limiter.retry_after(bucket, f"{scope['path']}:{self.limiter.client_key(scope)}")
+        if wait:
+            await _reject(send, 429, "Too many requests, retry shortly", _retry_after(wait))
+            return
+        if not self.limiter.try_enter(name):
+            await _reject(send, 503, "Server busy, try again later", "1")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.leave(name)
+
+
+rate_limiter = RateLimiter(
+    create_backend(settings.RATE_LIMIT_BACKEND),
+    limits=settings.RATE_LIMITS,
+    concurrency=settings.CONCURRENCY_LIMITS,
+    enabled=settings.RATE_LIMIT_ENABLED,
+    trust_forwarded=settings.RATE_LIMIT_TRUST_FORWARDED,
+)
@@ -0,0 +1,153 @@
+"""
+Read-replica routing for the heavy read endpoints.
+
+Endpoints that only read (admin emotion export, user history and stats) ask `read_router`
+for a database instead of using `config.database`. With READ_DATABASE_URL(S) set, that is
+the next healthy replica in round-robin order; writes, transactions and everything else keep
+using the primary. Admin responses computed on a replica are kept in the response cache for
+at most REPLICA_CACHE_SECONDS (`read_router.cache_seconds`), so a result read before the
+replica caught up with a write is replaced soon after.
+
+A background task runs `SELECT 1` against every replica each REPLICA_HEALTH_INTERVAL_SECONDS;
+a replica that fails or times out is skipped until it answers again, and when none is
+healthy reads fall back to the primary. A user who has just written emotions is pinned to
+the primary for READ_STICKY_SECONDS so they read their own writes despite replication lag.
+The pin is per worker process.
+
+To try it with two local MySQL instances, point DATABASE_URL at one and READ_DATABASE_URL at
+the other (replication isn't required for routing or health checks; stop the second
+instance to watch reads fall back to the primary, see /metrics).
+"""
+import asyncio
+import itertools
+import logging
+from typing import Iterable, List, Optional
+
+from config import database, get_read_databases, settings
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Users pinned to the primary at any one time
+MAX_STICKY_USERS = 100000
+
+
+def _user_key(user_id) -> Optional[int]:
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class Replica:
+    def __init__(self, database):
+        self.database = database
+        self.healthy = False
+        self.failures = 0
+        self.reads = 0
+
+
+class ReplicaRouter:
+    def __init__(self, primary, replicas: List, sticky_seconds: float, health_interval: float,
+                 health_timeout: float, cache_seconds: Optional[float] = None):
+        self.primary = primary
+        self.replicas = [Replica(replica) for replica in replicas]
+        self._cache_seconds = cache_seconds
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._sticky = TTLCache(MAX_STICKY_USERS, sticky_seconds)
+        self._next = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._task = None
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    async def connect(self):
+        if not self.replicas:
+            return
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+        self._task = asyncio.create_task(self._run())
+
+    async def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            if replica.database.is_connected:
+                await replica.database.disconnect()
+
+    @property
+    def cache_seconds(self) -> Optional[float]:
+        """
+        How long a cached response computed through `database()` may be served, or None
+        when reads go to the primary.
+        """
+        return self._cache_seconds if self.replicas else None
+
+    def mark_write(self, user_ids: Iterable[int]):
+        """
+        Pin these users' reads to the primary for READ_STICKY_SECONDS.
+        """
+        if self.replicas:
+            for user_id in user_ids:
+                self._sticky.set(_user_key(user_id), True)
+
+    def database(self, user_id=None):
+        """
+        Database for a read-only query, on behalf of `user_id` when there is one.
+        """
+        if not self.replicas:
+            return self.primary
+        if user_id is not None and self._sticky.get(_user_key(user_id)):
+            self.sticky_reads += 1
+            return self.primary
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next)]
+            if replica.healthy:
+                replica.reads += 1
+                return replica.database
+        self.primary_reads += 1
+        return self.primary
+
+    async def _check(self, replica: Replica):
+        try:
+            if not replica.database.is_connected:
+                await asyncio.wait_for(replica.database.connect(), self.health_timeout)
+            await asyncio.wait_for(replica.database.fetch_val("SELECT 1"), self.health_timeout)
+        except Exception as e:
+            replica.failures += 1
+            if replica.healthy:
+                logger.warning("Read replica %s is unhealthy: %r", replica.database.url.obscure_password, e)
+            replica.healthy = False
+            return
+        if not replica.healthy:
+            logger.info("Read replica %s is healthy", replica.database.url.obscure_password)
+        replica.healthy = True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    def metrics(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "replica_reads": sum(replica.reads for replica in self.replicas),
+            "primary_fallback_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+            "health_check_failures": sum(replica.failures for replica in self.replicas),
+        }
+
+
+read_router = ReplicaRouter(
+    database,
+    get_read_databases(),
+    sticky_seconds=settings.READ_STICKY_SECONDS,
+    health_interval=settings.REPLICA_HEALTH_INTERVAL_SECONDS,
+    health_timeout=settings.REPLICA_HEALTH_TIMEOUT_SECONDS,
+    cache_seconds=settings.REPLICA_CACHE_SECONDS,
+)
@@ -0,0 +1,78 @@
+"""
+ASGI middleware recording per-route latency, status codes and in-flight requests.
+
+Routes are labelled by their path template (/user/get_emotion, not the raw URL), so the
+label set stays bounded. Unhandled exceptions are logged with their route and counted as
+500s.
+
+When PROFILE_ROUTES is set, a PROFILE_SAMPLE_RATE fraction of requests to those paths is
+also run under the sampling profiler; otherwise the only per-request cost is two clock reads
+and three metric updates.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from config import settings
+from utils.metrics import registry
+from utils.sampling_profiler import SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED = "<unmatched>"
+
+request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route"))
+requests_total = registry.counter(
+    "http_requests_total", "Requests by route and status code.", ("method", "route", "status"))
+requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests currently being handled.")
+
+request_profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app, profile_routes=(), profile_sample_rate: float = 0.0,
+                 profiler: SamplingProfiler = None):
+        self.app = app
+        self.profile_routes = frozenset(profile_routes)
+        self.profile_sample_rate = profile_sample_rate
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        task = None
+        if (self.profiler is not None and scope["path"] in self.profile_routes
+                and random.random() < self.profile_sample_rate):
+            task = asyncio.current_task()
+            self.profiler.begin(task)
+
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            logger.exception("Unhandled error in %s %s", scope["method"], scope["path"])
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec()
+            route = scope.get("route")
+            label = route.path if route is not None else UNMATCHED
+            request_seconds.observe(elapsed, (scope["method"], label))
+            requests_total.inc((scope["method"], label, str(status)))
+            if task is not None:
+                self.profiler.end(task, label)
@@ -0,0 +1,199 @@
+"""
+Cache for read-mostly admin responses.
+
+Rendered JSON bodies are stored under a key that includes the current emotion generation,
+a counter bumped after every emotion write, user deletion and email change. A bump orphans
+every cached body at once (old keys simply age out of the LRU), and clients holding an ETag
+from an older generation get a fresh body. A matching If-None-Match is answered with 304 from
+the generation alone, without touching the database.
+
+Responses that may lag behind the generation (computed on a read replica) are cached with a
+`max_age`: their key and ETag also carry the current max_age-long time window, so they are
+recomputed and revalidated at least that often.
+
+CACHE_BACKEND selects where bodies and the generation live:
+
+* memory - per-process TTL/LRU cache bounded by RESPONSE_CACHE_MAX_BYTES of bodies; each
+           uvicorn worker keeps its own generation
+* redis  - shared by all workers through CACHE_URL (needs the optional `redis` package)
+
+Backend errors are logged and treated as cache misses, so a cache outage only costs speed.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+
+from config import settings
+from utils.serialization import encode, negotiate
+from utils.ttl_cache import TTLCache
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Only needed for CACHE_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "emotions:generation"
+
+
+class MemoryCacheBackend:
+    """
+    In-process backend. The generation is prefixed with a per-process token so ETags issued
+    by one worker never match another worker's (independently counted) generation.
+    """
+
+    def __init__(self, max_size: int, ttl: float, max_bytes: Optional[int] = None):
+        self._cache = TTLCache(max_size, ttl, max_bytes)
+        self._instance = os.urandom(4).hex()
+        self._generation = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._cache.set(key, value, ttl)
+
+    async def get_generation(self) -> str:
+        return f"{self._instance}.{self._generation}"
+
+    async def incr_generation(self):
+        self._generation += 1
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class RedisCacheBackend:
+    """
+    Shared backend, so every worker sees the same bodies and generation.
+    """
+
+    def __init__(self, url: str, prefix: str = "emotion-tracker:"):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        self._client = redis.from_url(url)
+        self._prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self._prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._client.set(self._prefix + key, value, ex=max(1, int(ttl)))
+
+    async def get_generation(self) -> str:
+        value = await self._client.get(self._prefix + GENERATION_KEY)
+        return value.decode() if value else "0"
+
+    async def incr_generation(self):
+        await self._client.incr(self._prefix + GENERATION_KEY)
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_backend(name: str):
+    if name == "memory":
+        return MemoryCacheBackend(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL,
+                                  settings.RESPONSE_CACHE_MAX_BYTES)
+    if name == "redis":
+        return RedisCacheBackend(settings.CACHE_URL or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float, max_entry_bytes: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    async def invalidate(self):
+        """
+        Bump the generation; call after the change is committed.
+        """
+        try:
+            await self.backend.incr_generation()
+        except Exception:
+            self.errors += 1
+            logger.exception("Failed to bump the response cache generation")
+
+    async def respond(self, request: Request, name: str, compute: Callable[[], Awaitable],
+                      max_age: Optional[float] = None) -> Response:
+        """
+        Serve `name` for this request's query string and negotiated encoding from the cache,
+        or compute, store and return it. `compute` returns the JSON-able payload. With
+        `max_age`, a body is served for at most that many seconds.
+        """
+        media_type = negotiate(request)
+        try:
+            generation = await self.backend.get_generation()
+        except Exception:
+            self.errors += 1
+            logger.exception("Response cache unavailable")
+            return Response(encode(await compute(), media_type), media_type=media_type, headers={"Vary": "Accept"})
+
+        if max_age:
+            generation = f"{generation}.w{int(time.time() // max_age)}"
+        variant = hashlib.sha256(f"{media_type} {request.url.query}".encode()).hexdigest()[:16]
+        etag = f'W/"{name}-{generation}-{variant}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip() for tag in if_none_match.split(",")}
+            if etag in tags or "*" in tags:
+                self.not_modified += 1
+                return Response(status_code=304, headers=headers)
+
+        key = f"{name}:{generation}:{variant}"
+        body = await self._get(key)
+        if body is not None:
+            self.hits += 1
+            return Response(content=body, media_type=media_type, headers=headers)
+
+        self.misses += 1
+        body = encode(await compute(), media_type)
+        if len(body) <= self.max_entry_bytes:
+            await self._set(key, body, min(self.ttl, max_age or self.ttl))
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        try:
+            return await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            logger.exception("Response cache read failed")
+            return None
+
+    async def _set(self, key: str, body: bytes, ttl: float):
+        try:
+            await self.backend.set(key, body, ttl)
+        except Exception:
+            self.errors += 1
+            logger.exception("Response cache write failed")
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "response_hits": self.hits,
+            "response_misses": self.misses,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "response_hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    create_backend(settings.CACHE_BACKEND),
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+)
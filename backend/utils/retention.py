@@ -0,0 +1,217 @@
+"""
+Retention for the raw emotions table.
+
+Raw rows older than RETENTION_RAW_DAYS are archived to gzip'd NDJSON files under
+RETENTION_ARCHIVE_DIR and then deleted by primary key in batches of RETENTION_BATCH_SIZE,
+pausing between batches so no DELETE holds its locks for long. Nothing has to be
+summarized first: apply_rollups already keeps hourly and daily rollups for every row, and
+deleting raw rows leaves them and the totals untouched.
+
+The watermark in retention_state marks where raw history ends. It is moved forward (to a
+day boundary) before any row is deleted, and reads before it are served from the daily
+rollups, so history and stats stay complete while a run is in progress.
+
+When RETENTION_ENABLED is set, a background task runs the job every RETENTION_INTERVAL_HOURS.
+A MySQL named lock makes sure only one worker runs it at a time.
+
+    python -m utils.retention run      # compact now
+    python -m utils.retention status   # show the watermark and archived row count
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from config import database, settings
+from utils.emotion_labels import emotion_labels
+from utils.migrations import run_migrations
+from utils.response_cache import response_cache
+from utils.rollups import DAY, bucket_start
+from utils.storage import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "emotions"
+LOCK_NAME = "emotion_tracker_retention"
+ARCHIVE_DIR = os.path.join(BASE_DIR, settings.RETENTION_ARCHIVE_DIR)
+
+# The watermark moves at most once per run; readers may see it a little late
+WATERMARK_CACHE_SECONDS = 60
+_watermark_cache = (None, 0.0)
+
+
+async def get_watermark(db=database) -> Optional[datetime]:
+    return await db.fetch_val("SELECT watermark FROM retention_state WHERE name = :name", {"name": STATE_NAME})
+
+
+async def cached_watermark() -> Optional[datetime]:
+    """
+    The watermark for read paths, refreshed at most every WATERMARK_CACHE_SECONDS.
+    """
+    global _watermark_cache
+    watermark, expires_at = _watermark_cache
+    if expires_at <= time.monotonic():
+        watermark = await get_watermark()
+        _watermark_cache = (watermark, time.monotonic() + WATERMARK_CACHE_SECONDS)
+    return watermark
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _append_archive(path: str, rows):
+    """
+    Append rows to the archive as one more gzip member and fsync it before rows are deleted.
+    """
+    data = "".join(json.dumps(dict(row), default=_json_default) + "\n" for row in rows).encode()
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            archive.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+async def _archive_and_delete(connection, cutoff: datetime) -> int:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"emotions-before-{cutoff:%Y%m%d}-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson.gz")
+    after_id = 0
+    total = 0
+    while True:
+        rows = await connection.fetch_all("""
+            SELECT id, user_id, emotion_id, timestamp, confidence
+            FROM emotions
+            WHERE id > :after_id AND timestamp < :cutoff
+            ORDER BY id
+            LIMIT :limit
+        """, {"after_id": after_id, "cutoff": cutoff, "limit": settings.RETENTION_BATCH_SIZE})
+        if not rows:
+            break
+
+        # Archives keep the label so they stay readable without the lookup table
+        labels = await emotion_labels.names(row["emotion_id"] for row in rows)
+        await run_in_threadpool(_append_archive, path, [
+            {"id": row["id"], "user_id": row["user_id"], "emotion": labels[row["emotion_id"]],
+             "timestamp": row["timestamp"], "confidence": row["confidence"]}
+            for row in rows
+        ])
+        ids = {f"id_{i}": row["id"] for i, row in enumerate(rows)}
+        await connection.execute(
+            f"DELETE FROM emotions WHERE id IN ({', '.join(':' + name for name in ids)})", ids
+        )
+        await connection.execute(
+            "UPDATE retention_state SET rows_archived = rows_archived + :count WHERE name = :name",
+            {"count": len(rows), "name": STATE_NAME},
+        )
+        total += len(rows)
+        after_id = rows[-1]["id"]
+        await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_MS / 1000)
+    return total
+
+
+async def run_retention(db=database) -> Optional[int]:
+    """
+    Advance the watermark to the retention cutoff, then archive and delete raw rows before it.
+    Returns the number of rows removed, or None when another worker holds the lock.
+    """
+    cutoff = bucket_start(datetime.utcnow() - timedelta(days=settings.RETENTION_RAW_DAYS), DAY)
+    async with db.connection() as connection:
+        if not await connection.fetch_val("SELECT GET_LOCK(:name, 0)", {"name": LOCK_NAME}):
+            return None
+        try:
+            await connection.execute("""
+                INSERT INTO retention_state (name, watermark) VALUES (:name, :cutoff)
+                ON DUPLICATE KEY UPDATE watermark = GREATEST(watermark, VALUES(watermark))
+            """, {"name": STATE_NAME, "cutoff": cutoff})
+            removed = await _archive_and_delete(connection, cutoff)
+        finally:
+            await connection.execute("SELECT RELEASE_LOCK(:name)", {"name": LOCK_NAME})
+    if removed:
+        await response_cache.invalidate()
+    return removed
+
+
+class RetentionScheduler:
+    def __init__(self, interval_hours: float):
+        self.interval = interval_hours * 3600
+        self._task = None
+        self.runs = 0
+        self.failures = 0
+        self.rows_removed = 0
+        self.last_run_seconds = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            try:
+                removed = await run_retention()
+                self.runs += 1
+                self.rows_removed += removed or 0
+                if removed:
+                    logger.info("Retention archived and removed %d emotions", removed)
+            except Exception:
+                self.failures += 1
+                logger.exception("Retention run failed")
+            self.last_run_seconds = time.perf_counter() - start
+            await asyncio.sleep(self.interval)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "rows_removed": self.rows_removed,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+
+retention_scheduler = RetentionScheduler(settings.RETENTION_INTERVAL_HOURS)
+
+
+async def _main(argv):
+    if argv[1:] not in (["run"], ["status"]):
+        print("usage: python -m utils.retention [run|status]")
+        return 2
+    await database.connect()
+    try:
+        await run_migrations()
+        if argv[1] == "run":
+            removed = await run_retention()
+            print("Another worker is running retention" if removed is None else f"Removed {removed} raw emotions")
+        else:
+            row = await database.fetch_one(
+                "SELECT watermark, rows_archived FROM retention_state WHERE name = :name", {"name": STATE_NAME}
+            )
+            if row is None:
+                print("Retention has not run yet")
+            else:
+                print(f"Raw history starts at {row['watermark']}; {row['rows_archived']} rows archived to {ARCHIVE_DIR}")
+    finally:
+        await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
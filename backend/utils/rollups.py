@@ -0,0 +1,172 @@
+"""
+Pre-aggregated emotion counters.
+
+Three tables are kept in step with `emotions` by `apply_rollups` (and `subtract_rollups`
+for deletions), which callers run in the same transaction as the raw insert or delete:
+
+* emotion_totals        - global count per emotion (admin stats)
+* emotion_user_totals   - count per (user, emotion) (user stats)
+* emotion_rollups       - count per (user, granularity, bucket_start, emotion), hourly and daily
+
+Like `emotions`, they are keyed by emotion_id (see utils.emotion_labels).
+
+Run `python -m utils.rollups rebuild` from the backend directory to backfill them from
+existing rows. Raw rows older than the retention watermark are deleted (see utils.retention),
+so the rollups are the only record of that period.
+"""
+import asyncio
+import sys
+from collections import Counter
+from datetime import datetime
+
+from config import database
+from utils.emotion_labels import emotion_labels
+from utils.migrations import run_migrations
+
+HOUR = "hour"
+DAY = "day"
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """
+    Truncate a timestamp to the start of its hourly or daily bucket.
+    """
+    if granularity == HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def apply_rollups(rows):
+    """
+    Add freshly inserted emotion rows to the rollup counters.
+    Each row is a mapping with user_id, emotion and timestamp. Must be called inside the
+    transaction that inserted the rows so counters and raw data commit together.
+    """
+    label_ids = await emotion_labels.ids({row["emotion"] for row in rows})
+    await _add_counts([(row["user_id"], label_ids[row["emotion"]], row["timestamp"]) for row in rows], 1)
+
+
+async def subtract_rollups(rows):
+    """
+    Take deleted emotion rows back out of the rollup counters.
+    Each row is a mapping with user_id, emotion_id and timestamp, as selected from `emotions`.
+    Must be called inside the transaction that deleted the rows. Counters that drop to zero
+    are left in place; readers skip them.
+    """
+    await _add_counts([(row["user_id"], row["emotion_id"], row["timestamp"]) for row in rows], -1)
+
+
+async def _add_counts(rows, sign: int):
+    totals = Counter()
+    user_totals = Counter()
+    buckets = Counter()
+    for user_id, emotion_id, timestamp in rows:
+        totals[emotion_id] += sign
+        user_totals[(user_id, emotion_id)] += sign
+        for granularity in (HOUR, DAY):
+            buckets[(user_id, granularity, bucket_start(timestamp, granularity), emotion_id)] += sign
+
+    if not totals:
+        return
+
+    # Fixed lock order (per-user rows first, global row last) keeps concurrent writers from deadlocking
+    await _upsert(
+        "emotion_rollups", ("user_id", "granularity", "bucket_start", "emotion_id", "count"),
+        [(*key, count) for key, count in sorted(buckets.items())],
+    )
+    await _upsert(
+        "emotion_user_totals", ("user_id", "emotion_id", "count"),
+        [(*key, count) for key, count in sorted(user_totals.items())],
+    )
+    await _upsert(
+        "emotion_totals", ("emotion_id", "count"),
+        [(key, count) for key, count in sorted(totals.items())],
+    )
+
+
+async def _upsert(table: str, columns, rows):
+    """
+    Multi-row INSERT ... ON DUPLICATE KEY UPDATE that adds to the existing count.
+    """
+    placeholders = []
+    values = {}
+    for i, row in enumerate(rows):
+        placeholders.append("(" + ", ".join(f":{column}_{i}" for column in columns) + ")")
+        values.update({f"{column}_{i}": value for column, value in zip(columns, row)})
+
+    query = f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES {", ".join(placeholders)}
+        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+    """
+    await database.execute(query, values)
+
+
+async def remove_user_rollups(user_id: int):
+    """
+    Subtract a user's counts from the global totals before the user is deleted.
+    Per-user rollup rows go away with the user through ON DELETE CASCADE.
+    """
+    query = """
+        UPDATE emotion_totals
+        JOIN emotion_user_totals ON emotion_user_totals.emotion_id = emotion_totals.emotion_id
+        SET emotion_totals.count = emotion_totals.count - emotion_user_totals.count
+        WHERE emotion_user_totals.user_id = :user_id
+    """
+    await database.execute(query, {"user_id": user_id})
+
+
+async def rebuild_rollups():
+    """
+    Recompute the rollup tables from the raw emotions table.
+    Buckets before the retention watermark have no raw rows left and are kept as they are;
+    totals are then summed from the daily rollups.
+    """
+    async with database.transaction():
+        since = await database.fetch_val("SELECT watermark FROM retention_state WHERE name = 'emotions'")
+        values = {"since": since or datetime(1000, 1, 1)}
+        await database.execute("DELETE FROM emotion_rollups WHERE bucket_start >= :since", values)
+        for table in ("emotion_user_totals", "emotion_totals"):
+            await database.execute(f"DELETE FROM {table}")
+
+        await database.execute("""
+            INSERT INTO emotion_rollups (user_id, granularity, bucket_start, emotion_id, count)
+            SELECT user_id, 'hour', DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), emotion_id, COUNT(*)
+            FROM emotions
+            WHERE timestamp >= :since
+            GROUP BY user_id, DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), emotion_id
+        """, values)
+        await database.execute("""
+            INSERT INTO emotion_rollups (user_id, granularity, bucket_start, emotion_id, count)
+            SELECT user_id, 'day', DATE(timestamp), emotion_id, COUNT(*)
+            FROM emotions
+            WHERE timestamp >= :since
+            GROUP BY user_id, DATE(timestamp), emotion_id
+        """, values)
+        await database.execute("""
+            INSERT INTO emotion_user_totals (user_id, emotion_id, count)
+            SELECT user_id, emotion_id, SUM(count) FROM emotion_rollups WHERE granularity = 'day'
+            GROUP BY user_id, emotion_id
+        """)
+        await database.execute("""
+            INSERT INTO emotion_totals (emotion_id, count)
+            SELECT emotion_id, SUM(count) FROM emotion_user_totals GROUP BY emotion_id
+        """)
+
+
+async def _main(argv):
+    if argv[1:] != ["rebuild"]:
+        print("usage: python -m utils.rollups rebuild")
+        return 2
+    await database.connect()
+    try:
+        await run_migrations()
+        await rebuild_rollups()
+        print("Rollup tables rebuilt")
+    finally:
+        await database.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv)))
@@ -0,0 +1,143 @@
+"""
+Opt-in wall-clock sampling profiler for individual requests.
+
+While a sampled request is in flight, a background thread records its stack every
+PROFILE_INTERVAL_MS. The stack is the request task's chain of awaiting coroutines, so time
+spent waiting on the database or the hashing pool shows up under the await that waits for
+it; when the task is the one running on the event loop, the synchronous frames it is
+executing (from sys._current_frames) are appended.
+
+Stacks are aggregated per route in the folded format ("frame;frame;frame count") read by
+flamegraph.pl and speedscope. The thread only runs while profiled requests are active.
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _awaited(obj):
+    for attribute in ("cr_await", "ag_await", "gi_yieldfrom"):
+        value = getattr(obj, attribute, None)
+        if value is not None:
+            return value
+    return None
+
+
+def _object_frame(obj):
+    for attribute in ("cr_frame", "ag_frame", "gi_frame"):
+        frame = getattr(obj, attribute, None)
+        if frame is not None:
+            return frame
+    return None
+
+
+def task_stack(task: asyncio.Task, running_frame=None) -> Optional[str]:
+    """
+    Folded stack of a task: its coroutine await chain, outermost first, extended with the
+    synchronous frames under `running_frame` when the task is currently executing.
+    """
+    frames = []
+    obj = task.get_coro()
+    while obj is not None:
+        frame = _object_frame(obj)
+        if frame is None:
+            break
+        frames.append(frame)
+        obj = _awaited(obj)
+    if not frames:
+        return None
+
+    if running_frame is not None:
+        below = []
+        frame = running_frame
+        while frame is not None and frame is not frames[-1]:
+            below.append(frame)
+            frame = frame.f_back
+        if frame is not None:
+            frames.extend(reversed(below))
+    return ";".join(_frame_label(frame) for frame in frames)
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._active: Dict[asyncio.Task, Counter] = {}
+        self._stacks: Dict[str, Counter] = defaultdict(Counter)
+        self._loop_thread_id = None
+        self._thread = None
+        self.requests_profiled = 0
+
+    def begin(self, task: asyncio.Task):
+        with self._lock:
+            self._loop_thread_id = threading.get_ident()
+            self._active[task] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def end(self, task: asyncio.Task, route: str):
+        with self._lock:
+            samples = self._active.pop(task, None)
+            if samples:
+                self._stacks[route].update(samples)
+            self.requests_profiled += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.items())
+                loop_thread_id = self._loop_thread_id
+            running_frame = sys._current_frames().get(loop_thread_id)
+            stacks = []
+            for task, samples in active:
+                try:
+                    stack = task_stack(task, running_frame)
+                except (AttributeError, RuntimeError):  # the task moved on mid-walk
+                    continue
+                if stack:
+                    stacks.append((samples, stack))
+            with self._lock:
+                for samples, stack in stacks:
+                    samples[stack] += 1
+
+    def folded(self, route: Optional[str] = None) -> str:
+        """
+        Aggregated stacks for one route (or all routes) in folded format.
+        """
+        with self._lock:
+            routes = [route] if route is not None else list(self._stacks)
+            lines = [
+                f"{stack} {count}"
+                for name in routes
+                for stack, count in self._stacks.get(name, Counter()).most_common()
+            ]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def dump(self, directory: str):
+        """
+        Write one <route>.folded file per profiled route.
+        """
+        with self._lock:
+            routes = list(self._stacks)
+        if not routes:
+            return
+        os.makedirs(directory, exist_ok=True)
+        for route in routes:
+            name = re.sub(r"[^A-Za-z0-9_.-]+", "_", route.strip("/")) or "root"
+            with open(os.path.join(directory, f"{name}.folded"), "w") as f:
+                f.write(self.folded(route))
@@ -0,0 +1,94 @@
+"""
+Response encoding for large payloads.
+
+FastAPI runs every returned value through jsonable_encoder and then json.dumps. For the big
+emotion responses that dominates the request, so they build plain lists and dicts (or
+per-column lists) straight from the database rows and return a finished Response from
+`render`, which encodes them with orjson in one pass.
+
+Clients can ask for a more compact encoding:
+
+* Accept: application/msgpack - MessagePack instead of JSON (needs the optional `msgpack`
+  package; without it the response stays JSON)
+* layout=columns - where an endpoint supports it, one array per field instead of one
+  object per row, e.g. {"id": [...], "emotion": [...], "timestamp": [...]}, which is what
+  chart libraries consume and is much smaller on the wire
+
+Timestamps are ISO 8601 strings in every encoding, as before.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # Only needed for Accept: application/msgpack
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = {MSGPACK, "application/x-msgpack"}
+
+
+def _default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _msgpack_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return _default(value)
+
+
+def dumps(payload) -> bytes:
+    return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def negotiate(request: Request) -> str:
+    """
+    Media type for the response: MessagePack when the client accepts it and it's available.
+    """
+    if msgpack is not None:
+        accept = request.headers.get("accept", "")
+        if any(part.split(";")[0].strip() in MSGPACK_TYPES for part in accept.split(",")):
+            return MSGPACK
+    return JSON
+
+
+def encode(payload, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=_msgpack_default, datetime=False)
+    return dumps(payload)
+
+
+def render(request: Request, payload, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    media_type = negotiate(request)
+    headers = {"Vary": "Accept", **(headers or {})}
+    return Response(encode(payload, media_type), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def to_columns(rows: Iterable[Sequence], fields: Sequence[str]) -> Dict[str, list]:
+    """
+    Transpose row tuples into one list per field.
+    """
+    columns = list(zip(*rows))
+    if not columns:
+        return {field: [] for field in fields}
+    return {field: list(column) for field, column in zip(fields, columns)}
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class: orjson instead of json.dumps for everything the routes return.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
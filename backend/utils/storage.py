@@ -0,0 +1,206 @@
+"""
+Profile image storage.
+
+Images are written under FACE_DATA_DIR as `<sha256>.<ext>`, so identical uploads share one
+file and a name never points at different content. Writes and hashing run in the thread
+pool, uploads are consumed in chunks, and a small JPEG thumbnail is stored next to the
+image in `thumbs/` when Pillow is installed. Paths stored in the database stay relative to
+the backend directory (`face_data/<hash>.png`) and are served under /static.
+"""
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+from config import settings
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FACE_DATA_URL_PREFIX = "face_data"
+FACE_DATA_DIR = os.path.join(BASE_DIR, settings.FACE_DATA_DIR)
+THUMBNAIL_DIR = os.path.join(FACE_DATA_DIR, "thumbs")
+
+CHUNK_SIZE = 64 * 1024
+# Multiple of 4 so every slice of the base64 text decodes on its own
+BASE64_CHUNK_SIZE = 4 * 16 * 1024
+
+CONTENT_HASH_RE = re.compile(r"[0-9a-f]{64}")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"RIFF", "webp"),
+]
+
+
+@dataclass
+class StoredImage:
+    content_hash: str
+    path: str  # relative, e.g. face_data/<hash>.png
+    thumbnail_path: Optional[str]
+
+
+def _extension(head: bytes) -> str:
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return "png"
+
+
+class _HashingWriter:
+    """
+    Writes chunks to a temporary file in FACE_DATA_DIR while hashing them.
+    """
+
+    def __init__(self):
+        os.makedirs(FACE_DATA_DIR, exist_ok=True)
+        self._fd, self.temp_path = tempfile.mkstemp(dir=FACE_DATA_DIR, suffix=".part")
+        self._file = os.fdopen(self._fd, "wb")
+        self._hash = hashlib.sha256()
+        self.head = b""
+
+    def write(self, chunk: bytes):
+        if len(self.head) < 16:
+            self.head += chunk[:16 - len(self.head)]
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self) -> StoredImage:
+        """
+        Move the temp file to its content-addressed name (or drop it if that file exists)
+        and make sure a thumbnail exists.
+        """
+        self._file.close()
+        content_hash = self._hash.hexdigest()
+        file_name = f"{content_hash}.{_extension(self.head)}"
+        final_path = os.path.join(FACE_DATA_DIR, file_name)
+        if os.path.exists(final_path):
+            os.remove(self.temp_path)
+        else:
+            os.replace(self.temp_path, final_path)
+        return StoredImage(
+            content_hash=content_hash,
+            path=f"{FACE_DATA_URL_PREFIX}/{file_name}",
+            thumbnail_path=_ensure_thumbnail(final_path, content_hash),
+        )
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def _ensure_thumbnail(image_path: str, content_hash: str) -> Optional[str]:
+    if Image is None:
+        return None
+    file_name = f"{content_hash}.jpg"
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, file_name)
+    if not os.path.exists(thumbnail_path):
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        try:
+            with Image.open(image_path) as image:
+                image.thumbnail((settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+                image.convert("RGB").save(thumbnail_path, "JPEG", quality=85)
+        except OSError:
+            return None
+    return f"{FACE_DATA_URL_PREFIX}/thumbs/{file_name}"
+
+
+async def save_upload(upload: UploadFile) -> StoredImage:
+    """
+    Stream an uploaded file to disk in chunks without holding it in memory.
+    """
+    writer = await run_in_threadpool(_HashingWriter)
+    try:
+        while chunk := await upload.read(CHUNK_SIZE):
+            await run_in_threadpool(writer.write, chunk)
+        return await run_in_threadpool(writer.finish)
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
+
+
+def _save_base64_sync(encoded: str) -> StoredImage:
+    writer = _HashingWriter()
+    try:
+        encoded = "".join(encoded.split())
+        for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+            writer.write(base64.b64decode(encoded[start:start + BASE64_CHUNK_SIZE]))
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+async def save_base64(encoded: str) -> StoredImage:
+    """
+    Decode a base64 image and store it, decoding slice by slice off the event loop.
+    """
+    return await run_in_threadpool(_save_base64_sync, encoded)
+
+
+def thumbnail_for(face_data_path: Optional[str]) -> Optional[str]:
+    """
+    Relative thumbnail path for a stored image, or None for legacy/unhashed images.
+    """
+    if not face_data_path:
+        return None
+    stem = os.path.splitext(os.path.basename(face_data_path))[0]
+    if not CONTENT_HASH_RE.fullmatch(stem) or not os.path.exists(os.path.join(THUMBNAIL_DIR, f"{stem}.jpg")):
+        return None
+    return f"{FACE_DATA_URL_PREFIX}/thumbs/{stem}.jpg"
+
+
+def _delete_image_sync(face_data_path: str):
+    # Only the file name is used, so a stored path can't point outside FACE_DATA_DIR
+    file_name = os.path.basename(face_data_path)
+    stem = os.path.splitext(file_name)[0]
+    paths = [os.path.join(FACE_DATA_DIR, file_name)]
+    if CONTENT_HASH_RE.fullmatch(stem):
+        paths.append(os.path.join(THUMBNAIL_DIR, f"{stem}.jpg"))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+async def delete_image(face_data_path: Optional[str]):
+    """
+    Remove a stored image and its thumbnail. Images are shared by content hash, so callers
+    check that no other user still references the path first.
+    """
+    if face_data_path:
+        await run_in_threadpool(_delete_image_sync, face_data_path)
+
+
+class ContentHashedStaticFiles(StaticFiles):
+    """
+    StaticFiles that gives content-addressed files a strong ETag (their hash) and a
+    long-lived immutable Cache-Control header.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        stem = os.path.splitext(os.path.basename(full_path))[0]
+        if CONTENT_HASH_RE.fullmatch(stem):
+            response.headers["etag"] = f'"{stem}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after a per-entry time to live.
+    With `max_bytes`, values must support len() and their total length is bounded too.
+    Keeps hit/miss/eviction counters for the metrics endpoints.
+    """
+
+    def __init__(self, max_size: int, ttl: float, max_bytes: Optional[int] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, time.monotonic() + ttl)
+            if self.max_bytes is not None:
+                self._bytes += len(value)
+            while len(self._data) > self.max_size or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None and self.max_bytes is not None:
+            self._bytes -= len(entry[0])
+        return entry
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._remove(key)
+            return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+            if self.max_bytes is not None:
+                stats.update({"bytes": self._bytes, "max_bytes": self.max_bytes})
+            return stats
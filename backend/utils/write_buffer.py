@@ -0,0 +1,221 @@
+"""
+Optional write-behind buffer for emotion inserts.
+
+When EMOTION_BUFFER_ENABLED is set, add_emotion enqueues rows here instead of writing them
+itself, and a background task started in main.startup flushes them with one multi-row
+insert per batch (by size or after the flush interval, whichever comes first).
+
+A batch that fails on a row-level error (a deleted user, bad data) is split to isolate the
+bad rows. Any other failure, such as a lost connection, is retried for the whole batch with
+exponential backoff, so during an outage the queue fills up and add_emotion answers 429
+instead of dropping rows; once stop() has been called a batch gets STOP_RETRY_ATTEMPTS
+more tries.
+"""
+import asyncio
+import logging
+import time
+
+from pymysql.err import DataError as MySQLDataError, IntegrityError as MySQLIntegrityError
+from sqlalchemy.exc import DataError, IntegrityError
+
+from config import settings
+from utils.emotion_writer import write_emotions
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Failures caused by the rows themselves; retrying the same rows can't succeed
+ROW_ERRORS = (IntegrityError, DataError, MySQLIntegrityError, MySQLDataError, KeyError, ValueError)
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 10
+STOP_RETRY_ATTEMPTS = 3
+
+
+class BufferFull(Exception):
+    pass
+
+
+class BufferStopped(Exception):
+    """
+    The buffer is shutting down; write the row directly.
+    """
+
+
+class EmotionWriteBuffer:
+    def __init__(self, capacity: int, batch_size: int, flush_interval_ms: int, block_when_full: bool):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.block_when_full = block_when_full
+        self._queue = None
+        self._has_rows = None
+        self._task = None
+        self._stopping = False
+        self._waiting_puts = 0
+        self.rows_enqueued = 0
+        self.rows_rejected = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.batch_splits = 0
+        self.batch_retries = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.capacity)
+        self._has_rows = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop accepting rows and wait until everything already queued, or waiting for space
+        in the queue, has been flushed.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._queue.put(_STOP)
+        self._has_rows.set()
+        await self._task
+        self._task = None
+
+    async def enqueue(self, row: dict):
+        """
+        Queue a row for the next flush. Raises BufferFull when the queue is at capacity,
+        unless the buffer is configured to wait for space instead, and BufferStopped once
+        stop() has been called.
+        """
+        if self._stopping:
+            raise BufferStopped()
+        if self.block_when_full:
+            # stop() keeps flushing until waiting rows are in, so none lands after the last flush
+            self._waiting_puts += 1
+            try:
+                await self._queue.put(row)
+            finally:
+                self._waiting_puts -= 1
+        else:
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self.rows_rejected += 1
+                raise BufferFull()
+        self.rows_enqueued += 1
+        self._has_rows.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0 or self._stopping:
+                        break
+                    self._has_rows.clear()
+                    try:
+                        await asyncio.wait_for(self._has_rows.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    continue
+                row = self._queue.get_nowait()
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+            if stop:
+                break
+
+        # Rows that were waiting for space when stop() was called land behind _STOP
+        while True:
+            while self._waiting_puts and self._queue.empty():
+                await asyncio.sleep(0)
+            if self._queue.empty():
+                return
+            batch = []
+            while not self._queue.empty() and len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        await self._write(batch)
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flush_seconds_total += elapsed
+        self.last_flush_ms = elapsed * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    async def _write(self, batch):
+        """
+        Write a batch. On a row-level error split it in half and write each half, so one bad
+        row (an unknown or deleted user id) only costs itself and not the other users' rows;
+        on any other error retry the whole batch after a backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                await write_emotions(batch)
+                self.rows_flushed += len(batch)
+                return
+            except ROW_ERRORS as e:
+                if len(batch) == 1:
+                    self.rows_failed += 1
+                    logger.warning("Dropping buffered emotion row for user %s: %r", batch[0].get("user_id"), e)
+                    return
+                break
+            except Exception:
+                attempt += 1
+                if self._stopping and attempt > STOP_RETRY_ATTEMPTS:
+                    self.rows_failed += len(batch)
+                    logger.exception("Dropping %d buffered emotion rows at shutdown", len(batch))
+                    return
+                self.batch_retries += 1
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                logger.warning("Writing %d buffered emotion rows failed (attempt %d), retrying in %.1f s",
+                               len(batch), attempt, delay, exc_info=True)
+                await asyncio.sleep(delay)
+        self.batch_splits += 1
+        middle = len(batch) // 2
+        await self._write(batch[:middle])
+        await self._write(batch[middle:])
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "capacity": self.capacity,
+            "rows_enqueued": self.rows_enqueued,
+            "rows_rejected": self.rows_rejected,
+            "rows_flushed": self.rows_flushed,
+            "rows_failed": self.rows_failed,
+            "batch_splits": self.batch_splits,
+            "batch_retries": self.batch_retries,
+            "flushes": self.flushes,
+            "avg_flush_ms": (self.flush_seconds_total * 1000 / self.flushes) if self.flushes else 0.0,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+
+emotion_buffer = EmotionWriteBuffer(
+    capacity=settings.EMOTION_BUFFER_CAPACITY,
+    batch_size=settings.EMOTION_BUFFER_BATCH_SIZE,
+    flush_interval_ms=settings.EMOTION_BUFFER_FLUSH_INTERVAL_MS,
+    block_when_full=settings.EMOTION_BUFFER_BLOCK_WHEN_FULL,
+)
@@ -1,6 +1,11 @@
 import React, { useState, useRef, useEffect } from "react";
 import * as faceapi from "face-api.js";
-import { addEmotion, getEmotion, getProfile } from "../services/userService";
+import {
+  addEmotion,
+  getEmotion,
+  getFaceDescriptor,
+  getProfile,
+} from "../services/userService";
 import { getCurrentUser } from "../services/authService";
 
 const EMOTION_EMOJIS = {
@@ -13,6 +18,11 @@ const EMOTION_EMOJIS = {
   fearful: "😨",
 };
 
+const HISTORY_WINDOW_DAYS = 30;
+const HISTORY_LIMIT = 100;
+// Match distance for descriptors computed in the browser
+const FACE_MATCH_THRESHOLD = 0.4;
+
 const UserDashboardPage = () => {
   const [emotion, setEmotion] = useState("");
   const [emotionHistory, setEmotionHistory] = useState([]);
@@ -63,7 +73,13 @@ const UserDashboardPage = () => {
   const fetchEmotionHistory = async (userId) => {
     setLoadingHistory(true); // Start spinner
     try {
-      const response = await getEmotion(userId);
+      // Only the most recent window is shown, so don't pull the whole history
+      const since = new Date(Date.now() - HISTORY_WINDOW_DAYS * 24 * 60 * 60 * 1000);
+      const response = await getEmotion(userId, {
+        from: since.toISOString(),
+        limit: HISTORY_LIMIT,
+        order: "desc",
+      });
       const sortedHistory = response.emotion.map((record, index) => ({
         id: index + 1,
         ...record,
@@ -83,8 +99,16 @@ const UserDashboardPage = () => {
     setError(null);
     await loadModels();
 
-    const profileImageUrl = await getProfile(); // Get profile image URL
-    const profileImage = await faceapi.fetchImage(profileImageUrl); // Load profile image
+    // Prefer the server-side descriptor when the backend enables it; otherwise decode the profile image
+    const serverDescriptor = await getFaceDescriptor();
+    const matchThreshold = serverDescriptor
+      ? serverDescriptor.threshold
+      : FACE_MATCH_THRESHOLD;
+    let profileImage = null;
+    if (!serverDescriptor) {
+      const profileImageUrl = await getProfile(); // Get profile image URL
+      profileImage = await faceapi.fetchImage(profileImageUrl); // Load profile image
+    }
 
     if (navigator.mediaDevices.getUserMedia) {
       setLoadingCamera(false);
@@ -111,21 +135,22 @@ const UserDashboardPage = () => {
                 .withFaceLandmarks()
                 .withFaceDescriptor();
               if (detections) {
-                const profileFace = await faceapi
-                  .detectSingleFace(
-                    profileImage,
-                    new faceapi.TinyFaceDetectorOptions()
-                  )
-                  .withFaceLandmarks()
-                  .withFaceDescriptor();
+                const profileFace = serverDescriptor
+                  ? { descriptor: serverDescriptor.descriptor }
+                  : await faceapi
+                      .detectSingleFace(
+                        profileImage,
+                        new faceapi.TinyFaceDetectorOptions()
+                      )
+                      .withFaceLandmarks()
+                      .withFaceDescriptor();
 
                 if (profileFace) {
                   const faceMatcher = new faceapi.FaceMatcher(profileFace);
                   const bestMatch = faceMatcher.findBestMatch(
                     detections.descriptor
                   );
-                  if (bestMatch.distance > 0.4) {
-                    // Adjust threshold if needed
+                  if (bestMatch.distance > matchThreshold) {
                     console.log(bestMatch.distance);
                     clearInterval(countdownInterval);
                     showError("Face does not match profile picture.");
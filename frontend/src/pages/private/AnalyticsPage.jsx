@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from "react";
 import { Pie } from "react-chartjs-2";
 import { Chart as ChartJS, Title, Tooltip, Legend, ArcElement } from "chart.js";
-import { getEmotionStats } from "../../services/adminService";
+import { getEmotionStats, subscribeEmotionEvents } from "../../services/adminService";
 
 // Registering necessary Chart.js components
 ChartJS.register(Title, Tooltip, Legend, ArcElement);
@@ -23,6 +23,24 @@ const AnalyticsPage = () => {
     };
 
     fetchData();
+
+    // Apply live count deltas on top of the fetched snapshot
+    const unsubscribe = subscribeEmotionEvents(({ delta }) => {
+      setEmotionStats((current) => {
+        if (!current) return current;
+        const counts = Object.fromEntries(
+          current.emotion_stats.map((stat) => [stat.emotion, stat.count])
+        );
+        Object.entries(delta).forEach(([emotion, count]) => {
+          counts[emotion] = (counts[emotion] || 0) + count;
+        });
+        const emotion_stats = Object.entries(counts)
+          .map(([emotion, count]) => ({ emotion, count }))
+          .sort((a, b) => b.count - a.count);
+        return { ...current, emotion_stats, dominant_emotion: emotion_stats[0]?.emotion };
+      });
+    });
+    return unsubscribe;
   }, []);
 
   if (loading) {
@@ -14,6 +14,26 @@ export const getEmotion = async () => {
 };
 // Fetch emotion stats
 export const getEmotionStats = async () => {
-  const response = await axios.get(`${API_URL}/get_emotion_stats`, {});
+  const token = getToken();
+  const config = {
+    headers: { Authorization: `Bearer ${token}` },
+  };
+  const response = await axios.get(`${API_URL}/get_emotion_stats`, config);
   return response.data;
 };
+
+// Live feed of new emotions; onMessage gets {type: "emotions", events, delta} messages.
+// Returns a function that closes the socket.
+export const subscribeEmotionEvents = (onMessage) => {
+  const token = getToken();
+  const socket = new WebSocket(
+    `${API_URL.replace(/^http/, "ws")}/ws/emotions?token=${encodeURIComponent(token)}`
+  );
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "emotions") {
+      onMessage(message);
+    }
+  };
+  return () => socket.close();
+};
@@ -8,8 +8,18 @@ export const addEmotion = async (emotionData) => {
   const response = await axios.post(`${API_URL}/add_emotion`, emotionData);
   return response.data;
 };
-export const getEmotion = async (user_id) => {
-  const response = await axios.get(`${API_URL}/get_emotion?user_id=${user_id}`);
+export const addEmotions = async (userId, emotions) => {
+  const response = await axios.post(`${API_URL}/add_emotions`, {
+    userId,
+    emotions,
+  });
+  return response.data;
+};
+// params: optional { from, to, limit, cursor, resolution, order } history window
+export const getEmotion = async (user_id, params = {}) => {
+  const response = await axios.get(`${API_URL}/get_emotion`, {
+    params: { user_id, ...params },
+  });
   return response.data;
 };
 export const getProfile = async () => {
@@ -34,6 +44,24 @@ export const getProfile = async () => {
     return null;
   }
 };
+// Precomputed 128-d descriptor of the profile image, or null if the server has none yet
+export const getFaceDescriptor = async () => {
+  if (!isAuthenticated()) return null;
+
+  try {
+    const token = getToken();
+    const response = await axios.get(`${API_URL}/get_face_descriptor`, {
+      headers: { Authorization: `Bearer ${token}` },
+      responseType: "arraybuffer",
+    });
+    // Server descriptors come from dlib, so they are matched at their own calibrated distance
+    const threshold = parseFloat(response.headers["x-match-threshold"]);
+    if (Number.isNaN(threshold)) return null;
+    return { descriptor: new Float32Array(response.data), threshold };
+  } catch (error) {
+    return null;
+  }
+};
 export const fetchEmotionAnalytics = async (user_id) => {
   const response = await axios.get(
     `${API_URL}/get_emotion_stats?user_id=${user_id}`
@@ -65,6 +93,7 @@ export const deleteAccount = async (email) => {
     // Ensure the email is URL-encoded
     const response = await axios.delete(`${API_URL}/delete`, {
       params: { email: email },
+      headers: { Authorization: `Bearer ${getToken()}` },
     });
     return response.data.message;
   } catch (error) {